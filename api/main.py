@@ -3,49 +3,56 @@ Echo Bot Backend API
 FastAPI для мини-приложения Echo
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from typing import List, Optional
-import sqlite3
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import date, datetime
 from pathlib import Path
 
-app = FastAPI(title="Echo API", version="1.0.0")
+# Shared data layer lives in the repository root (echo/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-# Database
-DB_PATH = Path.home() / "echo-bot.db"
+from echo import metrics, push
+from echo.archive import Archiver
+from echo.db import DB_PATH
+from echo.batch import BatchError
+from echo.pagination import parse_fields
+from echo.push import ChangeBroker, TooManySubscribers
+from echo.ratelimit import RateLimiter, http_dependency
+from echo.shards import open_repository
+from echo.stats import last_days
+from echo.sync import cache_headers, current_since, etag, etag_matches
+from echo.templates import DuplicateTemplate
+
+# Per-user and per-IP token buckets: 429 with Retry-After before the handler runs
+limiter = RateLimiter()
+
+app = FastAPI(title="Echo API", version="1.0.0", dependencies=[Depends(http_dependency(limiter))])
+
+# Database: one long-lived connection per thread, accessed through an async
+# repository so SQLite work never runs on the event loop. With ECHO_SHARDS > 1
+# users are spread over several files by user_id (echo/shards.py)
+repo = open_repository(DB_PATH)
+
+# Fan-out of task changes to open /tasks/events streams in this process
+broker = ChangeBroker()
+repo.add_listener(broker.on_task_event)
+metrics.REGISTRY.gauge("echo_push_subscribers", "Open /tasks/events streams",
+                       lambda: broker.stats()["subscribers"])
+
+# Completed tasks older than ECHO_ARCHIVE_DAYS move to tasks_archive in small batches
+archiver = Archiver(repo)
 
 def init_db():
     """Initialize database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        chat_id TEXT,
-        first_name TEXT,
-        created_at TIMESTAMP
-    )''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        title TEXT,
-        description TEXT,
-        deadline TIMESTAMP,
-        priority INTEGER DEFAULT 5,
-        status TEXT DEFAULT 'active',
-        created_at TIMESTAMP,
-        updated_at TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (user_id)
-    )''')
-    
-    conn.commit()
-    conn.close()
+    repo.init_db()
+
+# Fields returned by GET /tasks/{user_id} when no ?fields= projection is given
+TASK_LIST_FIELDS = ("id", "title", "description", "deadline", "priority", "status", "created_at", "updated_at")
 
 # Models
 class User(BaseModel):
@@ -68,6 +75,36 @@ class TaskUpdate(BaseModel):
 class QuickTask(BaseModel):
     template: str
 
+class TemplateCreate(BaseModel):
+    name: str
+    title: Optional[str] = None
+    priority: int = 5
+    deadline_hours: float = 1
+    category: str = "general"
+    icon: Optional[str] = None
+
+class TemplateUpdate(BaseModel):
+    name: Optional[str] = None
+    title: Optional[str] = None
+    priority: Optional[int] = None
+    deadline_hours: Optional[float] = None
+    category: Optional[str] = None
+    icon: Optional[str] = None
+
+class BatchOperation(BaseModel):
+    op: str  # create / update / complete / delete
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[int] = None
+    deadline: Optional[datetime] = None
+    status: Optional[str] = None
+    category: Optional[str] = None
+
+class TaskBatch(BaseModel):
+    operations: List[BatchOperation]
+    all_or_nothing: bool = False
+
 # Initialize database
 init_db()
 
@@ -80,6 +117,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms, exported on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get("/")
 async def root():
     """Health check"""
@@ -88,189 +128,211 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {"status": "ok", "timestamp": datetime.now().isoformat(), **repo.stats(), "push": broker.stats(),
+            "archive": archiver.stats(), "rate_limit": limiter.stats()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.on_event("startup")
+async def startup():
+    await archiver.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # End open event streams so the server can stop
+    broker.close()
+    await archiver.stop()
+    await repo.drain()
+    repo.close()
 
 @app.get("/users/{user_id}")
 async def get_user(user_id: int):
     """Get user by ID"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("SELECT user_id, username, chat_id, first_name FROM users WHERE user_id = ?", (user_id,))
-    user = c.fetchone()
-    
-    conn.close()
+    user = await repo.get_user(user_id)
     
     if user:
-        return {"user_id": user[0], "username": user[1], "chat_id": user[2], "first_name": user[3]}
+        return {"user_id": user["user_id"], "username": user["username"],
+                "chat_id": user["chat_id"], "first_name": user["first_name"]}
     raise HTTPException(status_code=404, detail="User not found")
 
 @app.post("/users")
 async def create_user(user: User):
     """Create new user"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    try:
-        c.execute('''INSERT INTO users (user_id, username, chat_id, first_name, created_at)
-            VALUES (?, ?, ?, ?, ?)''', (user.user_id, user.username, user.chat_id, user.first_name, datetime.now()))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass  # User exists
-    
-    conn.close()
+    await repo.create_user(user.user_id, user.username, user.chat_id, user.first_name)
     return {"status": "created", "user_id": user.user_id}
 
-@app.get("/tasks/{user_id}")
-async def get_tasks(user_id: int):
-    """Get all tasks for user"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT id, title, description, deadline, priority, status, created_at, updated_at
-        FROM tasks
-        WHERE user_id = ? AND status = 'active'
-        ORDER BY priority DESC, deadline ASC
-    ''', (user_id,))
-    
-    rows = c.fetchall()
-    conn.close()
-    
-    tasks = [{
-        "id": row[0],
-        "title": row[1],
-        "description": row[2],
-        "deadline": row[3],
-        "priority": row[4],
-        "status": row[5],
-        "created_at": row[6],
-        "updated_at": row[7]
-    } for row in rows]
-    
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """304 with no body when the client already has this version"""
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=cache_headers(tag))
+    return None
+
+# Declared before /tasks/{user_id}, which would otherwise capture "changes", "search" and "events"
+@app.get("/tasks/changes")
+async def get_task_changes(user_id: int, since: Optional[str] = None, limit: Optional[int] = None):
+    """Tasks changed since ?since=<sync_cursor | next_since>, plus IDs of deleted tasks"""
+    try:
+        return await repo.get_changes(user_id, since, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/tasks/search")
+async def search_tasks(user_id: int, q: str, status: Optional[str] = None, category: Optional[str] = None,
+                       min_priority: Optional[int] = None, limit: Optional[int] = None):
+    """Full-text search over titles and descriptions, best matches first"""
+    try:
+        tasks = await repo.search_tasks(user_id, q, status, category, min_priority, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"tasks": tasks, "count": len(tasks)}
 
+@app.get("/tasks/events")
+async def task_events(user_id: int):
+    """Server-Sent Events stream: an `event: change` with {"event", "id"} per task write.
+
+    Clients fetch the delta from /tasks/changes; `event: reset` means the client
+    fell behind and was disconnected, so it should resync after reconnecting.
+    """
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return StreamingResponse(broker.stream(subscription), media_type=push.MEDIA_TYPE, headers=push.HEADERS)
+
+@app.get("/tasks/{user_id}")
+async def get_tasks(request: Request, response: Response, user_id: int, limit: Optional[int] = None,
+                    cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Get active tasks for user, one page at a time (pass next_cursor as ?cursor=).
+
+    Responses carry an ETag; an unchanged list costs a 304 with no body.
+    """
+    try:
+        projection = parse_fields(fields) or TASK_LIST_FIELDS
+        since = None if cursor else current_since()
+        version = await repo.get_version(user_id)
+        tag = etag(version, request.url.query)
+        cached = not_modified(request, tag)
+        if cached:
+            return cached
+        page = await repo.get_tasks_page(user_id, "active", limit, cursor, projection, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    response.headers.update(cache_headers(tag))
+    tasks = page["tasks"]
+    
+    result = {"tasks": tasks, "count": len(tasks), "next_cursor": page["next_cursor"]}
+    if since:
+        result["sync_cursor"] = since
+    return result
+
 @app.post("/tasks/{user_id}")
 async def create_task(user_id: int, task: TaskCreate):
     """Create new task"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    result = await repo.create_task(user_id, task.title, task.description, task.priority, task.deadline)
     
-    now = datetime.now()
-    
-    c.execute('''
-        INSERT INTO tasks (user_id, title, description, deadline, priority, status, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, task.title, task.description, task.deadline, task.priority, 'active', now, now))
-    
-    task_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    
-    return {"id": task_id, "status": "created"}
+    return {"id": result["id"], "status": "created"}
 
 @app.put("/tasks/{task_id}")
 async def update_task(task_id: int, task_update: TaskUpdate):
     """Update task (complete, postpone, etc.)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    update_fields = []
-    update_values = []
-    
-    if task_update.status:
-        update_fields.append("status = ?")
-        update_values.append(task_update.status)
-    
-    if task_update.deadline:
-        update_fields.append("deadline = ?")
-        update_values.append(task_update.deadline)
-    
-    if task_update.title:
-        update_fields.append("title = ?")
-        update_values.append(task_update.title)
-    
-    if update_fields:
-        update_values.append(datetime.now())
-        c.execute(f'''
-            UPDATE tasks
-            SET {', '.join(update_fields)}, updated_at = ?
-            WHERE id = ?
-        ''', update_values + [task_id])
-        conn.commit()
-    
-    conn.close()
+    await repo.update_task(task_id, status=task_update.status, title=task_update.title,
+                           deadline=task_update.deadline)
     
     return {"status": "updated"}
 
 @app.post("/tasks/{user_id}/quick")
 async def create_quick_task(user_id: int, quick: QuickTask):
-    """Create task from template"""
-    templates = {
-        "Код-ревью": {"title": "Код-ревью", "priority": 7, "deadline_hours": 1},
-        "Митинг": {"title": "Митинг с командой", "priority": 5, "deadline_hours": 2},
-        "Обед": {"title": "Обед", "priority": 3, "deadline_hours": 1},
-        "Спринт": {"title": "Спринт-планирование", "priority": 8, "deadline_hours": 4},
-        "Доклад": {"title": "Отправить доклад", "priority": 6, "deadline_hours": 2},
-        "Упражнение": {"title": "Упражнение", "priority": 4, "deadline_hours": 1},
-    }
-    
-    template = templates.get(quick.template, {"title": quick.template, "priority": 5, "deadline_hours": 1})
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    now = datetime.now()
-    deadline = now + timedelta(hours=template["deadline_hours"])
-    
-    c.execute('''
-        INSERT INTO tasks (user_id, title, description, deadline, priority, status, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, template["title"], f"Шаблон: {quick.template}", deadline, template["priority"], 'active', now, now))
+    """Create task from a template (the user's own or a shared one)"""
+    result = await repo.create_task_from_template(user_id, quick.template)
     
-    task_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    return {"id": result["id"], "template": quick.template}
+
+@app.post("/tasks/{user_id}/batch")
+async def batch_tasks(user_id: int, payload: TaskBatch):
+    """Apply create/update/complete/delete operations in a single transaction"""
+    try:
+        results = await repo.apply_batch(user_id, [op.model_dump() for op in payload.operations],
+                                         payload.all_or_nothing)
+    except BatchError as e:
+        return JSONResponse(status_code=409 if e.results else 400,
+                            content={"detail": str(e), "index": e.index, "results": e.results})
     
-    return {"id": task_id, "template": quick.template}
+    return {"results": results, "count": len(results)}
 
 @app.delete("/tasks/{task_id}")
 async def delete_task(task_id: int):
     """Delete task"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-    conn.commit()
-    conn.close()
+    await repo.delete_task(task_id)
     
     return {"status": "deleted"}
 
+@app.get("/templates")
+async def get_templates(request: Request, response: Response, user_id: int):
+    """Template catalogue for the user (shared + own), served from memory with an ETag"""
+    tag, items = await repo.get_template_catalogue(user_id)
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tag))
+    return {"templates": items, "count": len(items)}
+
+@app.post("/templates/{user_id}")
+async def create_template(user_id: int, template: TemplateCreate):
+    """Create a custom template; 409 if the user already has one with this name"""
+    try:
+        return await repo.create_template(user_id, template.model_dump())
+    except DuplicateTemplate as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/templates/{template_id}")
+async def update_template(template_id: int, template: TemplateUpdate):
+    """Update a custom template (shared templates are read-only)"""
+    try:
+        result = await repo.update_template(template_id, template.model_dump())
+    except DuplicateTemplate as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return result
+
+@app.delete("/templates/{template_id}")
+async def delete_template(template_id: int):
+    """Delete a custom template"""
+    if not await repo.delete_template(template_id):
+        raise HTTPException(status_code=404, detail="Template not found")
+    return {"status": "deleted"}
+
 @app.get("/stats/{user_id}")
-async def get_stats(user_id: int):
-    """Get user productivity stats"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Get today's tasks
-    today = datetime.now().date()
-    c.execute('''
-        SELECT COUNT(*) as total,
-               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed
-        FROM tasks
-        WHERE user_id = ? AND DATE(created_at) = ?
-    ''', (user_id, today))
-    
-    stats = c.fetchone()
-    conn.close()
+async def get_stats(request: Request, response: Response, user_id: int, days: int = 1):
+    """Get user productivity stats for today or the last N days"""
+    tag = etag(await repo.get_version(user_id), request.url.query, date.today())
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tag))
+
+    start, end = last_days(days)
+    stats = await repo.get_stats_range(user_id, start, end)
     
-    return {
+    result = {
         "user_id": user_id,
-        "date": today.isoformat(),
-        "total": stats[0] or 0,
-        "completed": stats[1] or 0,
-        "efficiency": round((stats[1] / stats[0] * 100) if stats[0] > 0 else 0)
+        "date": end,
+        "total": stats["total"],
+        "completed": stats["completed"],
+        "efficiency": round((stats["completed"] / stats["total"] * 100) if stats["total"] > 0 else 0)
     }
+    if days > 1:
+        result["from"] = start
+        result["days"] = stats["days"]
+    return result
 
 if __name__ == "__main__":
     import uvicorn
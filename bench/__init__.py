@@ -0,0 +1,14 @@
+"""
+Нагрузочные прогоны Echo без сети
+
+    python -m bench.run --tasks 100000 --requests 20000 --concurrency 32
+    python -m bench.run --compare bench/results/<старый>.json
+
+- seed.py — временная база SQLite с пользователями и задачами (1k–1M задач)
+- workload.py — смешанная нагрузка на одно приложение (api/main.py или
+  bot.py) через ASGI-транспорт httpx, Telegram заменён на echo.fakebot
+- run.py — засев, прогон каждого приложения в отдельном процессе,
+  p50/p95/p99 и пропускная способность, результат в JSON
+- quickadd.py — корректность и скорость разбора быстрого добавления
+  (echo/quickadd.py) на корпусе quickadd_corpus.json
+"""
@@ -0,0 +1,88 @@
+"""
+Разбор быстрого добавления (echo/quickadd.py): корректность и скорость
+
+    python -m bench.quickadd                    # корпус bench/quickadd_corpus.json
+    python -m bench.quickadd --rounds 200
+
+Сначала каждое сообщение корпуса сверяется с ожидаемым результатом (при
+расхождениях — код выхода 1), затем корпус прогоняется rounds раз:
+время сборки правил, среднее и p99 на одно сообщение в микросекундах.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from echo import quickadd
+
+CORPUS = Path(__file__).resolve().parent / "quickadd_corpus.json"
+
+
+def expected_view(result: dict) -> dict:
+    deadline = result["deadline"]
+    return {
+        "title": result["title"],
+        "deadline": deadline.isoformat(sep=" ", timespec="minutes") if deadline else None,
+        "priority": result["priority"],
+        "category": result["category"],
+    }
+
+
+def check(cases: list, now: datetime) -> list:
+    """Расхождения с корпусом: [(текст, ожидалось, получено)]"""
+    failures = []
+    for case in cases:
+        expected = {key: case[key] for key in ("title", "deadline", "priority", "category")}
+        actual = expected_view(quickadd.parse(case["text"], now))
+        if actual != expected:
+            failures.append((case["text"], expected, actual))
+    return failures
+
+
+def measure(texts: list, now: datetime, rounds: int) -> dict:
+    re.purge()  # иначе re.compile отдаст выражение из своего кэша
+    started = time.perf_counter()
+    quickadd.compile_rules()
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for _ in range(rounds):
+        for text in texts:
+            started = time.perf_counter_ns()
+            quickadd.parse(text, now)
+            timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return {
+        "messages": len(timings),
+        "compile_ms": round(compile_ms, 2),
+        "mean_us": round(sum(timings) / len(timings) / 1000, 1),
+        "p50_us": round(timings[len(timings) // 2] / 1000, 1),
+        "p99_us": round(timings[int(len(timings) * 0.99)] / 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора быстрого добавления")
+    parser.add_argument("--corpus", default=str(CORPUS), help="JSON-корпус с ожидаемыми результатами")
+    parser.add_argument("--rounds", type=int, default=100, help="сколько раз прогнать корпус")
+    args = parser.parse_args()
+
+    corpus = json.loads(Path(args.corpus).read_text(encoding="utf-8"))
+    now = datetime.fromisoformat(corpus["now"])
+    cases = corpus["cases"]
+
+    failures = check(cases, now)
+    for text, expected, actual in failures:
+        print(f"✗ {text!r}\n    ожидалось: {expected}\n    получено:  {actual}")
+    print(f"Корпус: {len(cases) - len(failures)}/{len(cases)} совпадений")
+
+    print(json.dumps(measure([case["text"] for case in cases], now, args.rounds), indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
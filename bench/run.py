@@ -0,0 +1,142 @@
+"""
+Нагрузочный прогон Echo: засев, нагрузка на api/main.py и bot.py, отчёт
+
+    python -m bench.run                                  # 10k задач, 5000 запросов на приложение
+    python -m bench.run --tasks 1000000 --requests 50000
+    python -m bench.run --compare bench/results/old.json # сравнить с прошлым прогоном
+    python -m bench.run --shards 4 --mix create=80,list=20 # запись в 4 шарда
+
+Каждое приложение получает свою копию засеянной базы и свой процесс.
+Результат сохраняется в bench/results/<время>-<commit>.json.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.seed import seed
+from bench.workload import DEFAULT_MIX, parse_mix
+from echo.shards import rebalance
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_app(app: str, db_path: Path, args, log) -> dict:
+    """Прогнать bench.workload для одного приложения в отдельном процессе"""
+    # Нагрузка идёт от одного клиента по немногим user_id: ограничение частоты выключено
+    env = dict(os.environ, ECHO_DB_PATH=str(db_path), ECHO_SHARDS=str(args.shards), ECHO_RATE_LIMIT="0",
+               PYTHONPATH=str(ROOT))
+    mix = ",".join(f"{op}={weight:g}" for op, weight in args.mix.items())
+    command = [sys.executable, "-m", "bench.workload", "--app", app,
+               "--users", str(args.users), "--tasks", str(args.tasks),
+               "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+               "--warmup", str(args.warmup), "--mix", mix, "--seed", str(args.seed)]
+    completed = subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Прогон {app} завершился с кодом {completed.returncode}")
+    return json.loads(completed.stdout)
+
+
+def print_report(result: dict):
+    print(f"\nCommit {result['commit']}: {result['config']['tasks']} задач, "
+          f"{result['config']['users']} пользователей, засев {result['seed_seconds']} с")
+    for app, report in result["apps"].items():
+        print(f"\n[{app}] {report['throughput_rps']} запросов/с за {report['wall_seconds']} с")
+        print(f"  {'операция':<12} {'count':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        rows = dict(report["ops"])
+        if "updates_e2e" in report:
+            rows["update→done"] = report["updates_e2e"]
+        for op, s in rows.items():
+            print(f"  {op:<12} {s['count']:>7} {s['errors']:>5} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+
+def compare(old: dict, new: dict):
+    """Разница p95 и пропускной способности по каждой операции"""
+    print(f"\nСравнение {old['commit']} -> {new['commit']}")
+    for app, report in new["apps"].items():
+        before = old.get("apps", {}).get(app)
+        if not before:
+            continue
+        change = (report["throughput_rps"] / before["throughput_rps"] - 1) * 100 if before["throughput_rps"] else 0
+        print(f"[{app}] throughput {before['throughput_rps']} -> {report['throughput_rps']} ({change:+.1f}%)")
+        for op, s in report["ops"].items():
+            if op in before["ops"]:
+                b = before["ops"][op]
+                delta = (s["p95_ms"] / b["p95_ms"] - 1) * 100 if b["p95_ms"] else 0
+                print(f"  {op:<12} p95 {b['p95_ms']:>8.2f} -> {s['p95_ms']:>8.2f} ms ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон Echo без сети")
+    parser.add_argument("--tasks", type=int, default=10000, help="задач в засеянной базе (1k–1M)")
+    parser.add_argument("--users", type=int, default=None, help="по умолчанию tasks / 50")
+    parser.add_argument("--requests", type=int, default=5000, help="запросов на приложение")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="веса операций, например list=40,create=20,complete=10,stats=15,webhook=15")
+    parser.add_argument("--apps", default="api,bot")
+    parser.add_argument("--shards", type=int, default=1, help="разложить базу по N шардам (echo/shards.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл результата (по умолчанию bench/results/...)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="показывать логи приложений")
+    args = parser.parse_args()
+    args.users = args.users or max(args.tasks // 50, 10)
+
+    workdir = Path(tempfile.mkdtemp(prefix="echo-bench-"))
+    log = None if args.verbose else subprocess.DEVNULL
+    try:
+        base = workdir / "seed.db"
+        print(f"Засев {args.tasks} задач...")
+        seeded = seed(base, args.tasks, args.users, args.seed)
+
+        apps = {}
+        for app in args.apps.split(","):
+            db_path = workdir / f"{app}.db"
+            shutil.copy(base, db_path)
+            if args.shards > 1:
+                rebalance(db_path, args.shards)
+            print(f"Прогон {app}...")
+            apps[app] = run_app(app, db_path, args, log)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {"tasks": args.tasks, "users": args.users, "requests": args.requests,
+                   "concurrency": args.concurrency, "warmup": args.warmup, "mix": args.mix, "seed": args.seed,
+                   "shards": args.shards},
+        "seed_seconds": seeded["seconds"],
+        "apps": apps,
+    }
+    print_report(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"\nРезультат: {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), result)
+
+
+if __name__ == "__main__":
+    main()
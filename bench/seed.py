@@ -0,0 +1,94 @@
+"""
+Засев базы для нагрузочных прогонов
+
+Задачи вставляются пачками через executemany в одной транзакции на пачку,
+счётчики статистики и полнотекстовый индекс пересчитываются один раз в конце. Генерация
+детерминирована (--seed), так что одинаковые параметры дают одинаковую базу.
+
+    python -m bench.seed --db /tmp/echo-bench.db --tasks 1000000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from echo import search, stats
+from echo.db import ConnectionPool
+from echo.migrations import migrate
+
+CHUNK = 50000
+USER_ID_BASE = 1_000_000
+
+TITLES = ("Код-ревью", "Митинг с командой", "Обед", "Спорт", "Спринт-планирование",
+          "Отправить доклад", "Купить молоко", "Позвонить маме", "Написать отчёт", "Оплатить счета")
+CATEGORIES = ("general", "work", "personal", "health")
+
+
+def user_ids(users: int) -> range:
+    """ID засеянных пользователей"""
+    return range(USER_ID_BASE + 1, USER_ID_BASE + users + 1)
+
+
+def seed(path, tasks: int, users: int, seed: int = 42, days: int = 90) -> dict:
+    """Создать базу с users пользователями и tasks задачами. Возвращает параметры засева"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    now = datetime.now().replace(microsecond=0)
+
+    pool = ConnectionPool(path)
+    conn = pool.connection()
+    migrate(conn)
+
+    with pool.transaction() as conn:
+        conn.executemany('''INSERT INTO users (user_id, username, chat_id, first_name, created_at)
+            VALUES (?, ?, ?, ?, ?)''',
+            [(uid, f"user{uid}", str(uid), f"User {uid}", now.isoformat(sep=" ")) for uid in user_ids(users)])
+
+    with pool.transaction() as conn:
+        # Индекс поиска строится одним проходом после загрузки, а не триггером на строку
+        conn.execute("DROP TRIGGER IF EXISTS tasks_fts_insert")
+
+    for start in range(0, tasks, CHUNK):
+        rows = []
+        for _ in range(min(CHUNK, tasks - start)):
+            created = now - timedelta(seconds=rng.randrange(days * 86400))
+            status = "completed" if rng.random() < 0.3 else "active"
+            deadline = None
+            if rng.random() < 0.5:
+                deadline = (created + timedelta(hours=rng.randrange(1, 240))).isoformat(sep=" ")
+            rows.append((USER_ID_BASE + rng.randint(1, users), rng.choice(TITLES), None,
+                         rng.randint(1, 10), status, deadline, rng.choice(CATEGORIES),
+                         created.isoformat(sep=" ", timespec="microseconds"),
+                         created.isoformat(sep=" ", timespec="microseconds")))
+        with pool.transaction() as conn:
+            conn.executemany('''INSERT INTO tasks
+                (user_id, title, description, priority, status, deadline, category, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+    with pool.transaction() as conn:
+        stats.rebuild(conn)
+        search.create_index(conn)
+        search.rebuild(conn)
+        search.optimize(conn)
+        # Засеянные дедлайны — история, напоминать по ним не нужно
+        conn.execute("UPDATE tasks SET reminded_at = created_at WHERE deadline IS NOT NULL")
+    conn.execute("ANALYZE")
+    pool.close_all()
+
+    return {"tasks": tasks, "users": users, "seed": seed, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Засев базы Echo для нагрузочных прогонов")
+    parser.add_argument("--db", required=True, help="путь к файлу SQLite (будет создан)")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=None, help="по умолчанию tasks / 50")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(seed(args.db, args.tasks, args.users or max(args.tasks // 50, 10), args.seed))
+
+
+if __name__ == "__main__":
+    main()
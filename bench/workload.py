@@ -0,0 +1,239 @@
+"""
+Смешанная нагрузка на одно приложение
+
+Запускается отдельным процессом (так настройки ECHO_* и путь к базе не
+пересекаются между приложениями), печатает результат в JSON на stdout:
+
+    ECHO_DB_PATH=/tmp/bench.db python -m bench.workload --app bot --users 200 --tasks 10000
+
+Запросы идут через httpx.ASGITransport прямо в приложение, lifespan
+выполняется как при настоящем запуске. Telegram заменён на FakeBotAPI,
+поэтому /webhook проходит весь путь: очередь обновлений -> обработчик ->
+SQLite -> очередь исходящих сообщений.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from bench.seed import user_ids
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = {"list": 40, "create": 20, "complete": 10, "stats": 15, "webhook": 15}
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / seconds, 1) if seconds else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+# --- ПРИЛОЖЕНИЯ ---
+
+def load_api():
+    """api/main.py как есть (база — из ECHO_DB_PATH)"""
+    sys.path.insert(0, str(ROOT / "api"))
+    import main
+    return main.app, None
+
+
+def load_bot():
+    """bot.py с поддельным Bot API"""
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    sys.path.insert(0, str(ROOT))
+    import bot
+    from echo.fakebot import FakeBotAPI, FakeRequest
+
+    api = FakeBotAPI(rate_limits=False)
+    return bot.create_app(application=bot.build_application(FakeRequest(api))), api
+
+
+class Workload:
+    """Генератор запросов одного приложения"""
+
+    def __init__(self, app_name: str, users: int, tasks: int, rng: random.Random):
+        self.app_name = app_name
+        self.users = list(user_ids(users))
+        self.tasks = tasks
+        self.rng = rng
+        self.update_id = 0
+
+    def user(self) -> int:
+        return self.rng.choice(self.users)
+
+    def task_id(self) -> int:
+        return self.rng.randint(1, max(self.tasks, 1))
+
+    async def list(self, client):
+        if self.app_name == "api":
+            return await client.get(f"/tasks/{self.user()}", params={"limit": 50})
+        return await client.get("/tasks", params={"user_id": self.user(), "status": "active", "limit": 50})
+
+    async def create(self, client):
+        return await client.post(f"/tasks/{self.user()}",
+                                 json={"title": f"Задача {self.rng.randrange(10 ** 6)}",
+                                       "priority": self.rng.randint(1, 10)})
+
+    async def complete(self, client):
+        if self.app_name == "api":
+            return await client.put(f"/tasks/{self.task_id()}", json={"status": "completed"})
+        return await client.post(f"/tasks/{self.task_id()}/complete")
+
+    async def stats(self, client):
+        return await client.get(f"/stats/{self.user()}", params={"days": 7})
+
+    def update(self) -> dict:
+        """Синтетическое обновление Telegram: текст (новая задача) или /tasks"""
+        self.update_id += 1
+        user_id = self.user()
+        message = {"message_id": self.update_id, "date": int(time.time()),
+                   "chat": {"id": user_id, "type": "private"},
+                   "from": {"id": user_id, "is_bot": False, "first_name": "Bench"}}
+        if self.rng.random() < 0.3:
+            message.update(text="/tasks", entities=[{"type": "bot_command", "offset": 0, "length": 6}])
+        else:
+            message["text"] = f"Задача из чата {self.rng.randrange(10 ** 6)}"
+        return {"update_id": self.update_id, "message": message}
+
+    async def webhook(self, client):
+        return await client.post("/webhook", json=self.update())
+
+
+# --- ПРОГОН ---
+
+async def run(app_name: str, users: int, tasks: int, requests: int, concurrency: int,
+              warmup: int, mix: dict, seed: int) -> dict:
+    app, fake_api = load_api() if app_name == "api" else load_bot()
+    if app_name == "api":
+        mix = {op: weight for op, weight in mix.items() if op != "webhook"}
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+
+    latencies = {op: [] for op in ops}
+    errors = dict.fromkeys(ops, 0)
+    updates = []
+    offered = {}                      # update_id -> время POST /webhook
+
+    async with app.router.lifespan_context(app):
+        ingestor = getattr(app.state, "ingestor", None)
+        if ingestor is not None:
+            # Время от POST /webhook до конца обработчика
+            process = ingestor.process
+
+            async def timed_process(data):
+                try:
+                    await process(data)
+                finally:
+                    updates.append(time.perf_counter() - offered.pop(data["update_id"]))
+
+            ingestor.process = timed_process
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            workloads = [Workload(app_name, users, tasks, random.Random(seed * 1000 + number))
+                         for number in range(concurrency)]
+            for number, workload in enumerate(workloads):
+                workload.update_id = number * 10 ** 9
+
+            async def phase(count: int, record: bool):
+                issued = 0
+
+                async def worker(workload: Workload):
+                    nonlocal issued
+                    while issued < count:
+                        issued += 1
+                        op = workload.rng.choices(ops, weights)[0]
+                        if op == "webhook":
+                            offered[workload.update_id + 1] = time.perf_counter()
+                        started = time.perf_counter()
+                        response = await getattr(workload, op)(client)
+                        elapsed = time.perf_counter() - started
+                        if record:
+                            errors[op] += response.status_code >= 400
+                            latencies[op].append(elapsed)
+
+                await asyncio.gather(*(worker(w) for w in workloads))
+
+            # Прогрев: кэши SQLite и приложения, без записи результатов
+            await phase(warmup, record=False)
+            while ingestor is not None and ingestor.depth:
+                await asyncio.sleep(0.01)
+            updates.clear()
+
+            wall_started = time.perf_counter()
+            await phase(requests, record=True)
+            wall = time.perf_counter() - wall_started
+
+            # Дождаться обработки всех принятых обновлений и отправки ответов
+            drain_started = time.perf_counter()
+            while ingestor is not None and (ingestor.depth or app.state.sender.depth):
+                await asyncio.sleep(0.01)
+            drain = time.perf_counter() - drain_started
+
+        result = {
+            "app": app_name,
+            "requests": requests,
+            "wall_seconds": round(wall, 3),
+            "throughput_rps": round(sum(len(v) for v in latencies.values()) / wall, 1),
+            "ops": {op: summarize(latencies[op], errors[op], wall) for op in ops},
+        }
+        if ingestor is not None:
+            result["updates_e2e"] = summarize(updates, ingestor.failed, wall)
+            result["drain_seconds"] = round(drain, 3)
+            result["bot_api_calls"] = len(fake_api.calls)
+    return result
+
+
+def parse_mix(value: str) -> dict:
+    """list=40,create=20,... -> dict"""
+    mix = {}
+    for part in value.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"неизвестная операция: {op}")
+        mix[op.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на одно приложение Echo")
+    parser.add_argument("--app", choices=("api", "bot"), required=True)
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--tasks", type=int, required=True)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.app, args.users, args.tasks, args.requests, args.concurrency,
+                             args.warmup, args.mix, args.seed))
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
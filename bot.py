@@ -6,22 +6,41 @@ Echo Telegram Bot (FREE VERSION)
 import os
 import logging
 import json
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 import uvicorn
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import aiohttp
-import sqlite3
 from pathlib import Path
 
 # Telegram Bot API
 import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import (Application, ApplicationHandlerStop, CommandHandler, MessageHandler, CallbackQueryHandler,
+                          ContextTypes, TypeHandler, filters)
+from telegram.request import BaseRequest
+
+from echo import metrics, push, quickadd
+from echo.archive import Archiver
+from echo.db import DB_PATH
+from echo.batch import BatchError
+from echo.ingest import SHED, UpdateIngestor
+from echo.pagination import parse_fields
+from echo.push import ChangeBroker, TooManySubscribers
+from echo.ratelimit import READ, WRITE, RateLimiter, http_dependency, retry_after
+from echo.reminders import ReminderScheduler
+from echo.sender import OutboundSender
+from echo.shards import open_repository
+from echo.stats import last_days
+from echo.stt import ACCEPTED, DISABLED, MAX_DURATION, TOO_LONG, VoiceJob, VoicePipeline
+from echo.sync import cache_headers, current_since, etag, etag_matches
+from echo.templates import DuplicateTemplate
 
 # Настройки
 TOKEN = os.getenv("BOT_TOKEN")
@@ -31,9 +50,6 @@ MINIAPP_URL = os.getenv("MINIAPP_URL", "https://zverinvest52-web.github.io/echo-
 if not TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения")
 
-# База данных
-DB_PATH = Path.home() / "echo-bot.db"
-
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -43,155 +59,136 @@ logger = logging.getLogger(__name__)
 
 # --- БАЗА ДАННЫХ ---
 
-def init_db():
-    """Инициализация базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Пользователи
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        first_name TEXT,
-        last_name TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-
-    # Задачи
-    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        title TEXT NOT NULL,
-        description TEXT,
-        priority INTEGER DEFAULT 5,
-        status TEXT DEFAULT 'active',
-        deadline TIMESTAMP,
-        category TEXT DEFAULT 'general',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (user_id)
-    )''')
-
-    conn.commit()
-    conn.close()
-    logger.info("База данных инициализирована")
-
-def get_user(user_id: int, username: str = None, first_name: str = None, last_name: str = None) -> dict:
-    """Получить или создать пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    user = c.fetchone()
-
-    if not user:
-        c.execute('''INSERT INTO users (user_id, username, first_name, last_name)
-            VALUES (?, ?, ?, ?)''', (user_id, username, first_name, last_name))
-        conn.commit()
-        logger.info(f"Создан пользователь: {user_id}")
-    else:
-        c.execute('''UPDATE users SET username = ?, first_name = ?, last_name = ?
-            WHERE user_id = ?''', (username, first_name, last_name, user_id))
-        conn.commit()
-
-    conn.close()
-    return {"user_id": user_id}
-
-# --- ФУНКЦИИ ЗАДАЧ ---
-
-def create_task(user_id: int, title: str, description: str = None, priority: int = 5,
-                deadline: str = None, category: str = "general") -> dict:
-    """Создать задачу"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute('''INSERT INTO tasks (user_id, title, description, priority, deadline, category)
-        VALUES (?, ?, ?, ?, ?, ?)''',
-        (user_id, title, description, priority, deadline, category))
-
-    task_id = c.lastrowid
-    conn.commit()
-    conn.close()
-
-    logger.info(f"Создана задача: {task_id} для пользователя: {user_id}")
-    return {"id": task_id, "title": title, "status": "active", "priority": priority}
-
-def get_tasks(user_id: int, status: str = None) -> list:
-    """Получить задачи пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    query = "SELECT * FROM tasks WHERE user_id = ?"
-    params = [user_id]
-
-    if status:
-        query += " AND status = ?"
-        params.append(status)
-
-    query += " ORDER BY priority DESC, deadline ASC, created_at DESC"
-
-    c.execute(query, params)
-    rows = c.fetchall()
-    conn.close()
+# Пул соединений (одно соединение на поток) и асинхронный репозиторий поверх него:
+# запросы к SQLite не блокируют event loop. ECHO_SHARDS > 1 — несколько файлов по user_id
+repo = open_repository(DB_PATH)
 
-    tasks = [{
-        "id": row[0],
-        "user_id": row[1],
-        "title": row[2],
-        "description": row[3],
-        "priority": row[4],
-        "status": row[5],
-        "deadline": row[6],
-        "category": row[7],
-        "ai_analyzed": False,
-        "created_at": row[8],
-        "updated_at": row[9]
-    } for row in rows]
+# Бюджеты запросов по user_id (бот и HTTP) и по IP (HTTP), см. echo/ratelimit.py
+limiter = RateLimiter()
 
-    return tasks
-
-def complete_task(task_id: int) -> bool:
-    """Завершить задачу"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute('''UPDATE tasks SET status = 'completed', updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?''', (task_id,))
-
-    updated = c.rowcount > 0
-    conn.commit()
-    conn.close()
-
-    if updated:
-        logger.info(f"Задача {task_id} выполнена")
-    return updated
-
-def delete_task(task_id: int) -> bool:
-    """Удалить задачу"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def init_db():
+    """Инициализация базы данных"""
+    repo.init_db()
+
+def task_view(task: dict) -> dict:
+    """Задача в формате ответа API"""
+    return {**task, "ai_analyzed": False}
+
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """304 без тела, если клиент прислал актуальный ETag"""
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=cache_headers(tag))
+    return None
+
+# --- ОТПРАВКА ---
+
+def reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+    """Ответить в чат через очередь отправки (обработчик не ждёт Telegram)"""
+    return context.bot_data["sender"].send_message(update.effective_chat.id, text, **kwargs)
+
+def edit(query, context: ContextTypes.DEFAULT_TYPE, text: str, **kwargs):
+    """Изменить сообщение с кнопкой через очередь; правки подряд схлопываются"""
+    if query.message is None:
+        # Inline-сообщение без чата — правим напрямую
+        return context.application.create_task(query.edit_message_text(text, **kwargs))
+    return context.bot_data["sender"].edit_message_text(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+def task_keyboard(task_id: int) -> InlineKeyboardMarkup:
+    """Кнопки под сообщением о новой задаче"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("✓ Выполнить", callback_data=f"complete_{task_id}"),
+         InlineKeyboardButton("✗ Удалить", callback_data=f"delete_{task_id}")],
+        [InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]
+    ])
+
+async def create_quick_task(user_id: int, text: str) -> dict:
+    """Задача из свободного текста (см. echo/quickadd.py)"""
+    parsed = quickadd.parse(text)
+    result = await repo.create_task(user_id, parsed["title"], priority=parsed["priority"],
+                                    deadline=parsed["deadline"], category=parsed["category"], coalesce=True)
+    return dict(result, deadline=parsed["deadline"], category=parsed["category"])
+
+def task_created_text(task: dict) -> str:
+    """Ответ о новой задаче: название и то, что удалось разобрать из текста"""
+    text = f"✅ Задача создана!\n\n📝 {task['title']}"
+    if task["deadline"]:
+        text += f"\n⏰ {task['deadline']:%d.%m %H:%M}"
+    if task["priority"] != quickadd.DEFAULT_PRIORITY:
+        text += f"\n❗ Приоритет {task['priority']}"
+    if task["category"] != quickadd.DEFAULT_CATEGORY:
+        text += f"\n🏷 {task['category']}"
+    return text
+
+# Сколько активных задач показывать в списке в чате
+LIST_SIZE = 10
+
+def priority_icon(priority: int) -> str:
+    return "🔴" if priority >= 7 else "🟡" if priority >= 5 else "🟢"
+
+def task_list_message(view: dict) -> tuple:
+    """Список задач для /tasks и кнопки «Мои задачи»: (текст, клавиатура или None)"""
+    if not view["total"]:
+        return "📭 У тебя пока нет задач. Создай первую!", None
+
+    lines = [f"📊 *Твои задачи ({view['active']} активных)*", ""]
+    if view["tasks"]:
+        lines.append("🔴 *Активные:*")
+        lines.extend(f"{i}. {priority_icon(task['priority'])} {task['title']}"
+                     for i, task in enumerate(view["tasks"], 1))
+    if view["completed"]:
+        lines += ["", f"✅ *Выполнено ({view['completed']})*"]
 
-    c.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+    keyboard = [[InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]]
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
 
-    deleted = c.rowcount > 0
-    conn.commit()
-    conn.close()
+# --- TELEGRAM HANDLERS ---
 
-    if deleted:
-        logger.info(f"Задача {task_id} удалена")
-    return deleted
+def update_kind(update: Update) -> str:
+    """Чтение или запись: новая задача, голосовое, кнопки выполнить/удалить — запись"""
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return WRITE if data.startswith(("complete_", "delete_")) else READ
+    message = update.effective_message
+    if message is None:
+        return READ
+    if message.voice:
+        return WRITE
+    text = message.text or ""
+    if text.startswith("/"):
+        return WRITE if text.split(maxsplit=1)[0].split("@")[0] == "/add" else READ
+    return WRITE if text else READ
+
+async def admission_gate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Группа -1: при исчерпанном бюджете пользователя остальные обработчики не запускаются"""
+    user = update.effective_user
+    if user is None:
+        return
+    kind = update_kind(update)
+    retry = limiter.check(kind, user.id)
+    if not retry:
+        return
 
-# --- TELEGRAM HANDLERS ---
+    metrics.RATE_LIMITED.inc(("bot", kind))
+    # Предупреждаем один раз за период ограничения, а не на каждое сообщение
+    text = f"⏳ Слишком много запросов подряд. Попробуй через {retry_after(retry)} с."
+    notify = limiter.notify_once(user.id, retry)
+    if update.callback_query:
+        # На нажатие кнопки нужно ответить в любом случае, иначе у клиента крутится индикатор
+        await update.callback_query.answer(text if notify else None)
+    elif notify and update.effective_chat:
+        reply(update, context, text)
+    raise ApplicationHandlerStop
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /start"""
     user = update.effective_user
 
-    get_user(
+    await repo.upsert_user(
         user_id=user.id,
         username=user.username,
         first_name=user.first_name,
-        last_name=user.last_name
+        last_name=user.last_name,
+        chat_id=update.effective_chat.id
     )
 
     keyboard = [
@@ -225,7 +222,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 Начни прямо сейчас! 🎯
 """
 
-    await update.message.reply_text(welcome_text, parse_mode='Markdown', reply_markup=reply_markup)
+    reply(update, context, welcome_text, parse_mode='Markdown', reply_markup=reply_markup)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /help"""
@@ -253,72 +250,44 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 Напиши @your_support_bot
 """
 
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    reply(update, context, help_text, parse_mode='Markdown')
 
 async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /tasks - список задач"""
-    user_id = update.effective_user.id
-    tasks = get_tasks(user_id)
-
-    if not tasks:
-        await update.message.reply_text("📭 У тебя пока нет задач. Создай первую!")
-        return
-
-    # Группируем по статусу
-    active = [t for t in tasks if t['status'] == 'active']
-    completed = [t for t in tasks if t['status'] == 'completed']
-
-    text = f"📊 *Твои задачи ({len(active)} активных)*\n\n"
-
-    if active:
-        text += "🔴 *Активные:*\n"
-        for i, task in enumerate(active[:10], 1):
-            priority_icon = "🔴" if task['priority'] >= 7 else "🟡" if task['priority'] >= 5 else "🟢"
-            text += f"{i}. {priority_icon} {task['title']}\n"
-
-    if completed:
-        text += f"\n✅ *Выполнено ({len(completed)})*\n"
-
-    keyboard = [[InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+    text, reply_markup = task_list_message(await repo.get_list_view(update.effective_user.id, LIST_SIZE))
+    reply(update, context, text, parse_mode='Markdown', reply_markup=reply_markup)
 
 async def add_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /add - добавить задачу"""
     if not context.args:
-        await update.message.reply_text("⚠️ Используй: /add Название задачи")
+        reply(update, context, "⚠️ Используй: /add Название задачи")
         return
 
     user_id = update.effective_user.id
-    title = " ".join(context.args)
-
-    result = create_task(user_id, title)
-
-    keyboard = [
-        [InlineKeyboardButton("✓ Выполнить", callback_data=f"complete_{result['id']}"),
-         InlineKeyboardButton("✗ Удалить", callback_data=f"delete_{result['id']}")],
-        [InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(
-        f"✅ Задача создана!\n\n📝 {result['title']}",
-        reply_markup=reply_markup
-    )
+    result = await create_quick_task(user_id, " ".join(context.args))
+    reply(update, context, task_created_text(result), reply_markup=task_keyboard(result['id']))
 
 async def voice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка голосовых сообщений"""
     user_id = update.effective_user.id
+    voice = update.message.voice
 
-    if not update.message.voice:
+    if not voice:
         return
 
-    # Поскольку нет OpenAI Whisper, используем заглушку
-    # В реальном продакшене можно использовать бесплатные альтернативы
-    # Например: Google Speech-to-Text API (бесплатный тариф)
-
-    await update.message.reply_text("🎤 Голосовое сообщение получено!\n\n⚠️ Для распознавания речи нужен OpenAI API.\n\nПока что используй текстовый ввод или открой Mini App.")
+    # Распознавание идёт в фоне (echo/stt.py), задача создаётся в on_voice_result
+    chat_id = update.effective_chat.id
+    status = context.bot_data["voice"].submit(
+        VoiceJob(user_id, chat_id, voice.file_id, voice.file_unique_id, voice.duration, voice.file_size))
+
+    if status == ACCEPTED:
+        context.bot_data["sender"].enqueue("send_chat_action", chat_id, action="typing")
+    elif status == DISABLED:
+        reply(update, context, "🎤 Голосовое сообщение получено!\n\n⚠️ Распознавание речи на сервере не настроено.\n\nПока что используй текстовый ввод или открой Mini App.")
+    elif status == TOO_LONG:
+        reply(update, context, f"🎤 Голосовое слишком длинное: распознаю до {MAX_DURATION} секунд.")
+    else:
+        reply(update, context, "🎤 Слишком много голосовых сразу, попробуй чуть позже.")
 
 async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка текстовых сообщений"""
@@ -329,20 +298,9 @@ async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if text.startswith('/'):
         return
 
-    # Создаем задачу из текста
-    result = create_task(user_id, text)
-
-    keyboard = [
-        [InlineKeyboardButton("✓ Выполнить", callback_data=f"complete_{result['id']}"),
-         InlineKeyboardButton("✗ Удалить", callback_data=f"delete_{result['id']}")],
-        [InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.message.reply_text(
-        f"✅ Задача создана!\n\n📝 {result['title']}",
-        reply_markup=reply_markup
-    )
+    # Создаем задачу из текста: срок, приоритет и категория — из самого текста
+    result = await create_quick_task(user_id, text)
+    reply(update, context, task_created_text(result), reply_markup=task_keyboard(result['id']))
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка кнопок"""
@@ -353,22 +311,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     data = query.data
 
     if data == "list":
-        tasks = get_tasks(user_id)
-        if not tasks:
-            await query.edit_message_text("📭 У тебя пока нет задач.")
-            return
-
-        active = [t for t in tasks if t['status'] == 'active']
-        text = f"📊 *Твои задачи ({len(active)} активных)*\n\n"
-
-        for i, task in enumerate(active[:10], 1):
-            priority_icon = "🔴" if task['priority'] >= 7 else "🟡" if task['priority'] >= 5 else "🟢"
-            text += f"{i}. {priority_icon} {task['title']}\n"
-
-        keyboard = [[InlineKeyboardButton("📋 Открыть Echo", web_app={"url": MINIAPP_URL})]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+        text, reply_markup = task_list_message(await repo.get_list_view(user_id, LIST_SIZE))
+        edit(query, context, text, parse_mode='Markdown', reply_markup=reply_markup)
 
     elif data == "help":
         help_text = """
@@ -382,34 +326,98 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 💡 Просто напиши мне задачу!
 """
-        await query.edit_message_text(help_text, parse_mode='Markdown')
+        edit(query, context, help_text, parse_mode='Markdown')
 
     elif data.startswith("complete_"):
         task_id = int(data.split("_")[1])
-        if complete_task(task_id):
-            await query.edit_message_text("✅ Задача выполнена! Отличная работа! 💪")
+        if await repo.complete_task(task_id, coalesce=True):
+            edit(query, context, "✅ Задача выполнена! Отличная работа! 💪")
         else:
-            await query.edit_message_text("❌ Задача не найдена")
+            edit(query, context, "❌ Задача не найдена")
 
     elif data.startswith("delete_"):
         task_id = int(data.split("_")[1])
-        if delete_task(task_id):
-            await query.edit_message_text("🗑 Задача удалена")
+        if await repo.delete_task(task_id):
+            edit(query, context, "🗑 Задача удалена")
         else:
-            await query.edit_message_text("❌ Задача не найдена")
+            edit(query, context, "❌ Задача не найдена")
 
-# --- FASTAPI APP (для API + Webhook) ---
+# --- НАПОМИНАНИЯ ---
 
-app = FastAPI(title="Echo Bot + API")
+def send_reminders(sender: OutboundSender, reminders: list) -> None:
+    """Пачка наступивших дедлайнов: одно сообщение на чат"""
+    by_chat = {}
+    for task in reminders:
+        by_chat.setdefault(task["chat_id"], []).append(task)
 
-# CORS для Mini App
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    for chat_id, tasks in by_chat.items():
+        if len(tasks) == 1:
+            task = tasks[0]
+            keyboard = [[InlineKeyboardButton("✓ Выполнить", callback_data=f"complete_{task['id']}")]]
+            sender.send_message(chat_id, f"⏰ Наступил дедлайн!\n\n📝 {task['title']}",
+                                reply_markup=InlineKeyboardMarkup(keyboard))
+            continue
+
+        text = f"⏰ Наступили дедлайны ({len(tasks)}):\n\n"
+        text += "\n".join(f"{i}. {task['title']}" for i, task in enumerate(tasks, 1))
+        sender.send_message(chat_id, text)
+
+# --- ГОЛОСОВЫЕ ---
+
+async def on_voice_result(sender: OutboundSender, job: VoiceJob, text: str) -> None:
+    """Распознанное голосовое -> новая задача"""
+    result = await create_quick_task(job.user_id, text)
+    sender.send_message(job.chat_id, f"🎤 Распознано!\n\n{task_created_text(result)}",
+                        reply_markup=task_keyboard(result['id']))
+
+async def on_voice_error(sender: OutboundSender, job: VoiceJob, error: Exception) -> None:
+    sender.send_message(job.chat_id, f"🎤 {error}\n\nМожно написать задачу текстом.")
+
+# --- TELEGRAM APPLICATION ---
+
+def build_application(request: BaseRequest = None) -> Application:
+    """Telegram Application с обработчиками (без Updater: обновления приходят через webhook).
+
+    request — свой транспорт Bot API (например, echo.fakebot.FakeRequest для прогонов без сети).
+    """
+    builder = Application.builder().token(TOKEN).updater(None)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+
+    # Ограничение частоты — до всех остальных обработчиков
+    application.add_handler(TypeHandler(Update, admission_gate), group=-1)
+
+    # Handlers (каждый обёрнут в гистограмму echo_handler_duration_seconds)
+    application.add_handler(CommandHandler("start", metrics.timed_handler(start_command)))
+    application.add_handler(CommandHandler("help", metrics.timed_handler(help_command)))
+    application.add_handler(CommandHandler("tasks", metrics.timed_handler(list_command)))
+    application.add_handler(CommandHandler("add", metrics.timed_handler(add_command)))
+
+    # Callback queries
+    application.add_handler(CallbackQueryHandler(metrics.timed_handler(button_callback)))
+
+    # Voice messages
+    application.add_handler(MessageHandler(filters.VOICE, metrics.timed_handler(voice_handler)))
+
+    # Text messages (как задачи)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, metrics.timed_handler(text_handler)))
+
+    return application
+
+async def setup_webhook(application: Application) -> None:
+    """Установить webhook, если он ещё не указывает на нас (каждый воркер вызывает это при старте)"""
+    webhook_url = f"{RENDER_URL}/webhook"
+    info = await application.bot.get_webhook_info()
+    if info.url == webhook_url:
+        logger.info(f"Webhook уже установлен: {webhook_url}")
+        return
+    await application.bot.set_webhook(webhook_url)
+    logger.info(f"Webhook установлен: {webhook_url}")
+
+# --- FASTAPI APP (для API + Webhook) ---
+
+router = APIRouter(dependencies=[Depends(http_dependency(limiter))])
 
 # Models
 class TaskCreate(BaseModel):
@@ -422,23 +430,130 @@ class TaskCreate(BaseModel):
 class QuickTask(BaseModel):
     template: str
 
+class TemplateCreate(BaseModel):
+    name: str
+    title: Optional[str] = None
+    priority: int = 5
+    deadline_hours: float = 1
+    category: str = "general"
+    icon: Optional[str] = None
+
+class TemplateUpdate(BaseModel):
+    name: Optional[str] = None
+    title: Optional[str] = None
+    priority: Optional[int] = None
+    deadline_hours: Optional[float] = None
+    category: Optional[str] = None
+    icon: Optional[str] = None
+
+class BatchOperation(BaseModel):
+    op: str                          # create / update / complete / delete
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[int] = None
+    deadline: Optional[str] = None
+    status: Optional[str] = None
+    category: Optional[str] = None
+
+class TaskBatch(BaseModel):
+    operations: List[BatchOperation]
+    all_or_nothing: bool = False
+
 # API Endpoints
-@app.get("/")
+@router.get("/")
 async def root():
     return {"status": "running", "service": "Echo Bot + API (FREE)", "version": "4.0.0"}
 
-@app.get("/health")
-async def health():
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+@router.get("/health")
+async def health(request: Request):
+    ingestor = request.app.state.ingestor
+    return {"status": "ok", "timestamp": datetime.now().isoformat(), **repo.stats(), "updates": ingestor.stats(),
+            "outbound": request.app.state.sender.stats(), "reminders": request.app.state.reminders.stats(),
+            "push": request.app.state.push.stats(), "voice": request.app.state.voice.stats(),
+            "archive": request.app.state.archiver.stats(), "rate_limit": limiter.stats()}
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/tasks")
+async def get_tasks_api(request: Request, response: Response, user_id: int, status: Optional[str] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None):
+    """Задачи постранично: следующая страница — ?cursor=<next_cursor>, поля — ?fields=id,title.
+
+    Ответ несёт ETag; с If-None-Match неизменившийся список стоит 304 без тела.
+    Первая страница отдаёт sync_cursor для последующих /tasks/changes.
+    """
+    try:
+        projection = parse_fields(fields)
+        # Курсор берётся до чтения списка: всё, что изменится позже, придёт в /tasks/changes
+        since = None if cursor else current_since()
+        version = await repo.get_version(user_id)
+        tag = etag(version, request.url.query)
+        cached = not_modified(request, tag)
+        if cached:
+            return cached
+        page = await repo.get_tasks_page(user_id, status, limit, cursor, projection, version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response.headers.update(cache_headers(tag))
+    tasks = page["tasks"] if projection else [task_view(t) for t in page["tasks"]]
+    result = {"tasks": tasks, "count": len(tasks), "next_cursor": page["next_cursor"]}
+    if since:
+        result["sync_cursor"] = since
+    return result
 
-@app.get("/tasks")
-async def get_tasks_api(user_id: int):
-    tasks = get_tasks(user_id)
-    return {"tasks": tasks, "count": len(tasks)}
+@router.get("/tasks/changes")
+async def get_task_changes_api(user_id: int, since: Optional[str] = None, limit: Optional[int] = None):
+    """Изменения после ?since=<sync_cursor | next_since>: изменённые задачи и ID удалённых.
+
+    has_more — есть ещё изменения (сразу запросить снова с next_since);
+    reset — курсор старше журнала удалений, нужно перезагрузить /tasks целиком.
+    """
+    try:
+        changes = await repo.get_changes(user_id, since, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    changes["tasks"] = [task_view(t) for t in changes["tasks"]]
+    return changes
+
+@router.get("/tasks/search")
+async def search_tasks_api(user_id: int, q: str, status: Optional[str] = None, category: Optional[str] = None,
+                           min_priority: Optional[int] = None, limit: Optional[int] = None):
+    """Поиск по названию и описанию: каждое слово — префикс, лучшие совпадения первыми"""
+    try:
+        tasks = await repo.search_tasks(user_id, q, status, category, min_priority, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tasks": [task_view(t) for t in tasks], "count": len(tasks)}
+
+@router.get("/tasks/events")
+async def task_events_api(request: Request, user_id: int):
+    """Поток изменений задач (Server-Sent Events): event: change с {"event", "id"} на каждую запись.
+
+    На событие клиент забирает дельту через /tasks/changes; event: reset — клиент
+    не успевал читать и был отключён, после переподключения нужна синхронизация.
+    """
+    broker = request.app.state.push
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return StreamingResponse(broker.stream(subscription), media_type=push.MEDIA_TYPE, headers=push.HEADERS)
+
+# Объявлен раньше /tasks/{user_id}: иначе "quick" попадает в user_id и запрос получает 422
+@router.post("/tasks/quick")
+async def quick_task_api(quick: QuickTask, user_id: int):
+    """Задача по шаблону (личному или общему); неизвестное имя — задача с таким названием"""
+    return await repo.create_task_from_template(user_id, quick.template)
 
-@app.post("/tasks/{user_id}")
+@router.post("/tasks/{user_id}")
 async def create_task_api(user_id: int, task: TaskCreate):
-    result = create_task(
+    result = await repo.create_task(
         user_id=user_id,
         title=task.title,
         description=task.description,
@@ -448,108 +563,211 @@ async def create_task_api(user_id: int, task: TaskCreate):
     )
     return result
 
-@app.post("/tasks/quick")
-async def quick_task_api(quick: QuickTask, user_id: int):
-    templates = {
-        "Код-ревью": {"title": "Код-ревью", "priority": 7, "deadline": 1},
-        "Митинг": {"title": "Митинг с командой", "priority": 5, "deadline": 2},
-        "Обед": {"title": "Обед", "priority": 3, "deadline": 1},
-        "Спорт": {"title": "Спорт", "priority": 4, "deadline": 1},
-        "Спринт": {"title": "Спринт-планирование", "priority": 8, "deadline": 4},
-        "Доклад": {"title": "Отправить доклад", "priority": 6, "deadline": 2},
-    }
-
-    template = templates.get(quick.template, {"title": quick.template, "priority": 5, "deadline": 1})
-
-    deadline = (datetime.now() + timedelta(hours=template["deadline"])).isoformat()
-
-    result = create_task(user_id, template["title"], f"Шаблон: {quick.template}", template["priority"], deadline)
+@router.get("/templates")
+async def get_templates_api(request: Request, response: Response, user_id: int):
+    """Каталог шаблонов пользователя (общие + личные) из памяти, с ETag"""
+    tag, items = await repo.get_template_catalogue(user_id)
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tag))
+    return {"templates": items, "count": len(items)}
+
+@router.post("/templates/{user_id}")
+async def create_template_api(user_id: int, template: TemplateCreate):
+    try:
+        return await repo.create_template(user_id, template.model_dump())
+    except DuplicateTemplate as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/templates/{template_id}")
+async def update_template_api(template_id: int, template: TemplateUpdate):
+    try:
+        result = await repo.update_template(template_id, template.model_dump())
+    except DuplicateTemplate as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Личный шаблон не найден")
     return result
 
-@app.post("/tasks/{task_id}/complete")
+@router.delete("/templates/{template_id}")
+async def delete_template_api(template_id: int):
+    if not await repo.delete_template(template_id):
+        raise HTTPException(status_code=404, detail="Личный шаблон не найден")
+    return {"status": "deleted"}
+
+@router.post("/tasks/{task_id}/complete")
 async def complete_task_api(task_id: int):
-    success = complete_task(task_id)
+    success = await repo.complete_task(task_id)
     return {"status": "completed" if success else "not_found"}
 
-@app.delete("/tasks/{task_id}")
+@router.delete("/tasks/{task_id}")
 async def delete_task_api(task_id: int):
-    success = delete_task(task_id)
+    success = await repo.delete_task(task_id)
     return {"status": "deleted" if success else "not_found"}
 
-@app.get("/stats/{user_id}")
-async def get_stats_api(user_id: int):
-    tasks = get_tasks(user_id)
-    active = len([t for t in tasks if t['status'] == 'active'])
-    completed = len([t for t in tasks if t['status'] == 'completed'])
-
-    return {
+@router.post("/tasks/{user_id}/batch")
+async def batch_tasks_api(user_id: int, payload: TaskBatch):
+    """Пакет операций в одной транзакции: либо применяется целиком, либо откатывается"""
+    try:
+        results = await repo.apply_batch(user_id, [op.model_dump() for op in payload.operations],
+                                         payload.all_or_nothing)
+    except BatchError as e:
+        return JSONResponse(status_code=409 if e.results else 400,
+                            content={"detail": str(e), "index": e.index, "results": e.results})
+    return {"results": results, "count": len(results)}
+
+@router.get("/stats/{user_id}")
+async def get_stats_api(request: Request, response: Response, user_id: int, days: Optional[int] = None):
+    # Окно days зависит от текущей даты — она тоже часть ETag
+    tag = etag(await repo.get_version(user_id), request.url.query, date.today())
+    cached = not_modified(request, tag)
+    if cached:
+        return cached
+    response.headers.update(cache_headers(tag))
+
+    totals = await repo.get_user_stats(user_id)
+
+    result = {
         "user_id": user_id,
-        "active": active,
-        "completed": completed,
-        "total": len(tasks)
+        "active": totals["active"],
+        "completed": totals["completed"],
+        "total": totals["total"]
     }
 
-@app.post("/webhook")
+    # Статистика за последние N дней (по дням создания задач)
+    if days:
+        start, end = last_days(days)
+        result["period"] = {"from": start, "to": end, **await repo.get_stats_range(user_id, start, end)}
+
+    return result
+
+@router.post("/webhook")
 async def webhook(request: Request):
     """Telegram webhook endpoint"""
     data = await request.json()
+    ingestor = request.app.state.ingestor
 
-    # Создаем Update объект из данных
-    update = Update.de_json(data, application.bot)
-
-    # Обрабатываем обновление
-    await application.update_queue.put(update)
+    # Передаём обновление в очередь воркеров бота (дедупликация и backpressure внутри)
+    if ingestor.offer(data) == SHED:
+        return JSONResponse(status_code=ingestor.shed_status, content={"status": "shed"})
 
     return {"status": "ok"}
 
-# --- MAIN ---
+# --- LIFESPAN ---
 
-if __name__ == "__main__":
-    # Инициализация БД
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Бот живёт в том же event loop, что и сервер: старт и остановка вместе с приложением"""
     init_db()
 
-    # Telegram Application
-    application = Application.builder().token(TOKEN).build()
-
-    # Handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("tasks", list_command))
-    application.add_handler(CommandHandler("add", add_command))
-
-    # Callback queries
-    application.add_handler(CallbackQueryHandler(button_callback))
-
-    # Voice messages
-    application.add_handler(MessageHandler(filters.VOICE, voice_handler))
-
-    # Text messages (как задачи)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
-
-    # Настройка webhook
-    async def setup_webhook():
-        webhook_url = f"{RENDER_URL}/webhook"
-        await application.bot.set_webhook(webhook_url)
-        logger.info(f"Webhook установлен: {webhook_url}")
-
-    # Запуск
-    import threading
-
-    def run_bot():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(setup_webhook())
-        loop.run_until_complete(application.start())
-        loop.run_forever()
-
-    # Запуск бота в отдельном потоке
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
+    application = app.state.application
+    ingestor = app.state.ingestor
+    sender = app.state.sender
+    reminders = app.state.reminders
+    broker = app.state.push
+    voice = app.state.voice
+    archiver = app.state.archiver
+
+    await application.initialize()
+    if app.state.register_webhook:
+        await setup_webhook(application)
+    await application.start()
+    await sender.start()
+    await voice.start()
+    await ingestor.start()
+    await reminders.start()
+    await archiver.start()
+    repo.add_listener(broker.on_task_event)
 
     logger.info("🚀 Echo Bot (FREE VERSION) запускается...")
     logger.info(f"📡 API: {RENDER_URL}")
     logger.info(f"📱 Mini App: {MINIAPP_URL}")
     logger.info(f"💰 Стоимость: 0$ (полностью бесплатно!)")
 
-    # Запуск FastAPI
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    try:
+        yield
+    finally:
+        # Открытые потоки Mini App иначе не дали бы серверу остановиться
+        repo.remove_listener(broker.on_task_event)
+        broker.close()
+        await archiver.stop()
+        await reminders.stop()
+        await ingestor.stop()
+        await voice.stop()
+        await repo.drain()
+        await sender.stop()
+        await application.stop()
+        await application.shutdown()
+        repo.close()
+
+def create_app(application: Application = None, register_webhook: bool = True) -> FastAPI:
+    """Фабрика приложения: работает с `uvicorn bot:app --workers N` и gunicorn"""
+    app = FastAPI(title="Echo Bot + API", lifespan=lifespan)
+
+    # CORS для Mini App
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Гистограммы времени HTTP-запросов для /metrics
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    app.include_router(router)
+
+    application = application or build_application()
+
+    async def process_update(data: dict) -> None:
+        """Обработать одно обновление из webhook"""
+        update = Update.de_json(data, application.bot)
+        await application.process_update(update)
+
+    app.state.application = application
+    # Очередь исходящих сообщений с лимитами Telegram; обработчики берут её из bot_data
+    app.state.sender = sender = application.bot_data["sender"] = OutboundSender(application.bot)
+
+    async def notify(reminders: list) -> None:
+        send_reminders(sender, reminders)
+
+    app.state.reminders = ReminderScheduler(repo, notify)
+    # Перенос старых выполненных задач в tasks_archive (echo/archive.py)
+    app.state.archiver = Archiver(repo)
+    # Распознавание голосовых: пул процессов и очередь заданий (echo/stt.py)
+    app.state.voice = voice = application.bot_data["voice"] = VoicePipeline(
+        application.bot, partial(on_voice_result, sender), partial(on_voice_error, sender))
+    # Push изменений задач в открытые Mini App
+    app.state.push = broker = ChangeBroker()
+    app.state.register_webhook = register_webhook
+    # Очередь обновлений: webhook кладёт, воркеры в том же loop обрабатывают
+    app.state.ingestor = ingestor = UpdateIngestor(process_update)
+
+    # Глубина очередей читается в момент запроса /metrics
+    metrics.REGISTRY.gauge("echo_update_queue_depth", "Обновления, ждущие обработки", lambda: ingestor.depth)
+    metrics.REGISTRY.gauge("echo_outbound_queue_depth", "Исходящие сообщения, ждущие отправки", lambda: sender.depth)
+    metrics.REGISTRY.gauge("echo_reminders_scheduled", "Дедлайны в куче напоминаний",
+                           lambda: app.state.reminders.stats()["scheduled"])
+    metrics.REGISTRY.gauge("echo_voice_queue_depth", "Голосовые, ждущие распознавания", lambda: voice.depth)
+    metrics.REGISTRY.gauge("echo_push_subscribers", "Открытые потоки /tasks/events",
+                           lambda: broker.stats()["subscribers"])
+    return app
+
+app = create_app()
+
+# --- MAIN ---
+
+if __name__ == "__main__":
+    # Запуск FastAPI (бот стартует в lifespan); WEB_CONCURRENCY > 1 — несколько воркеров
+    uvicorn.run(
+        "bot:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -0,0 +1,4 @@
+"""
+Echo core
+Общий слой данных для бота (bot.py) и API (api/main.py)
+"""
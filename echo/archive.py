@@ -0,0 +1,199 @@
+"""
+Архив выполненных задач
+
+Горячие запросы (списки, страницы, синхронизация, напоминания) читают
+только tasks. Выполненные задачи, не менявшиеся ARCHIVE_DAYS дней,
+переносятся в tasks_archive — таблицу с теми же колонками в том же файле,
+поэтому tasks и её индексы остаются небольшими и держатся в кэше страниц.
+
+Перенос идёт пачками по BATCH задач. Пачка — короткая транзакция: INSERT
+в архив, надгробия синхронизации, DELETE из tasks; между пачками пауза
+PAUSE секунд, чтобы блокировку записи успевали брать обработчики запросов.
+Кандидаты выбираются по частичному индексу idx_tasks_completed — активные
+задачи в нём не лежат. Archiver делает проход раз в INTERVAL секунд.
+
+Архив остаётся доступен для чтения:
+- счётчики статистики при переносе не меняются, stats.rebuild считает обе таблицы;
+- задачи архива остаются в полнотекстовом индексе, поиск добирает совпадения из архива;
+- клиенты синхронизации получают ID перенесённых задач как удалённые — в списках их больше нет.
+
+    python -m echo.archive                      # перенести всё, что старше ECHO_ARCHIVE_DAYS
+    python -m echo.archive --days 7
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from echo import search, sync
+from echo.db import now_ts
+
+logger = logging.getLogger(__name__)
+
+# 0 — не архивировать
+ARCHIVE_DAYS = float(os.getenv("ECHO_ARCHIVE_DAYS", "30"))
+BATCH = int(os.getenv("ECHO_ARCHIVE_BATCH", "500"))
+PAUSE = float(os.getenv("ECHO_ARCHIVE_PAUSE", "0.05"))
+INTERVAL = float(os.getenv("ECHO_ARCHIVE_INTERVAL", "3600"))
+
+# Колонки tasks: новая колонка tasks добавляется миграцией и в tasks_archive, и сюда
+COLUMNS = ("id", "user_id", "title", "description", "priority", "status",
+           "deadline", "category", "created_at", "updated_at", "reminded_at")
+
+SELECT_BATCH = '''SELECT id, user_id FROM tasks
+    WHERE status = 'completed' AND updated_at < ?
+    ORDER BY updated_at LIMIT ?'''
+
+
+def cutoff(days: float) -> str:
+    """Граница updated_at: задачи, не менявшиеся дольше days дней"""
+    return (datetime.now() - timedelta(days=days)).isoformat(sep=" ", timespec="microseconds")
+
+
+# --- SQL ---
+
+def create_table(conn):
+    """tasks_archive, индекс кандидатов и триггер индекса поиска (внутри транзакции вызывающего)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS tasks_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        title TEXT NOT NULL,
+        description TEXT,
+        priority INTEGER,
+        status TEXT,
+        deadline TIMESTAMP,
+        category TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        reminded_at TIMESTAMP,
+        archived_at TIMESTAMP NOT NULL
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_archive_user
+        ON tasks_archive (user_id, created_at)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_completed
+        ON tasks (updated_at) WHERE status = 'completed' ''')
+    # Перенесённая задача остаётся в tasks_fts
+    conn.execute("DROP TRIGGER IF EXISTS tasks_fts_delete")
+    conn.execute(search.ARCHIVE_DELETE_TRIGGER)
+
+
+def archive_batch(conn, before: str, limit: int) -> list:
+    """Перенести до limit выполненных задач с updated_at < before (внутри транзакции вызывающего).
+
+    Возвращает user_id перенесённых задач (по одному на задачу).
+    """
+    rows = conn.execute(SELECT_BATCH, (before, limit)).fetchall()
+    if not rows:
+        return []
+    ids = [row[0] for row in rows]
+    marks = ", ".join("?" * len(ids))
+    columns = ", ".join(COLUMNS)
+    now = now_ts()
+    conn.execute(f'''INSERT INTO tasks_archive ({columns}, archived_at)
+        SELECT {columns}, ? FROM tasks WHERE id IN ({marks})''', [now, *ids])
+    conn.executemany(sync.RECORD_DELETION, [(task_id, user_id, now) for task_id, user_id in rows])
+    conn.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+    return [row[1] for row in rows]
+
+
+# --- ПЛАНИРОВЩИК ---
+
+class Archiver:
+    """Периодический перенос старых выполненных задач в архив пачками"""
+
+    def __init__(self, repo, days: float = ARCHIVE_DAYS, batch_size: int = BATCH,
+                 pause: float = PAUSE, interval: float = INTERVAL):
+        self.repo = repo
+        self.days = days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self._task = None
+
+        self.runs = 0
+        self.batches = 0
+        self.archived = 0
+        self.last_run_ms = 0.0
+
+    async def start(self):
+        """Запустить цикл в текущем event loop (ничего не делает при days = 0)"""
+        if self.days <= 0:
+            logger.info("Архивация выполненных задач отключена (ECHO_ARCHIVE_DAYS=0)")
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Архивация: выполненные задачи старше {self.days:g} дн., раз в {self.interval:g} с")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Один проход: пачки до исчерпания кандидатов. Возвращает число перенесённых задач"""
+        started = time.perf_counter()
+        before = cutoff(self.days)
+        moved = 0
+        while True:
+            count = await self.repo.archive_completed(before, self.batch_size)
+            self.batches += 1
+            moved += count
+            # Сумма по шардам меньше пачки — значит, каждый шард исчерпан
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        self.runs += 1
+        self.archived += moved
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        if moved:
+            logger.info(f"В архив перенесено задач: {moved} за {self.last_run_ms:.0f} мс")
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка архивации выполненных задач")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.days > 0,
+            "days": self.days,
+            "runs": self.runs,
+            "batches": self.batches,
+            "archived": self.archived,
+            "last_run_ms": round(self.last_run_ms, 1),
+        }
+
+
+def main():
+    from echo.db import DB_PATH
+    from echo.shards import SHARDS, open_repository
+
+    parser = argparse.ArgumentParser(description="Перенос выполненных задач Echo в архив")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу SQLite")
+    parser.add_argument("--shards", type=int, default=SHARDS, help="число шардов (ECHO_SHARDS)")
+    parser.add_argument("--days", type=float, default=ARCHIVE_DAYS or 30, help="возраст выполненной задачи, дней")
+    parser.add_argument("--batch", type=int, default=BATCH, help="задач в одной транзакции")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    repo = open_repository(args.db, args.shards)
+    repo.init_db()
+    try:
+        archiver = Archiver(repo, days=args.days, batch_size=args.batch)
+        moved = asyncio.run(archiver.run_once())
+    finally:
+        repo.close()
+    print(f"Перенесено в архив: {moved} задач, пачек: {archiver.batches}")
+
+
+if __name__ == "__main__":
+    main()
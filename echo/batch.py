@@ -0,0 +1,140 @@
+"""
+Пакетные операции над задачами
+
+Список операций create / update / complete / delete применяется в одной
+транзакции: одна блокировка записи и один fsync на весь пакет вместо
+одного на задачу. Изменения и удаления идут через executemany; создание —
+отдельными INSERT (нужен id каждой новой задачи), но в той же транзакции
+и на закэшированном подготовленном выражении.
+"""
+
+import sqlite3
+
+from echo.db import now_ts, to_db_ts
+from echo.stats import StatsDelta
+from echo.sync import RECORD_DELETION
+
+MAX_BATCH_SIZE = 500
+
+OPERATIONS = ("create", "update", "complete", "delete")
+
+# Поля, которые можно менять операцией update
+UPDATE_FIELDS = ("title", "description", "priority", "deadline", "status", "category")
+
+UPDATE_SQL = f'''UPDATE tasks SET
+    {", ".join(f"{name} = COALESCE(?, {name})" for name in UPDATE_FIELDS)},
+    reminded_at = CASE WHEN ? IS NULL THEN reminded_at END,
+    updated_at = ?
+    WHERE id = ?'''
+
+INSERT_SQL = '''INSERT INTO tasks
+    (user_id, title, description, priority, status, deadline, category, created_at, updated_at)
+    VALUES (?, ?, ?, ?, 'active', ?, ?, ?, ?)'''
+
+
+class BatchError(ValueError):
+    """Пакет отклонён целиком (ничего не записано)"""
+
+    def __init__(self, message: str, index: int = None, results: list = None):
+        super().__init__(message)
+        self.index = index
+        self.results = results
+
+
+def validate(operations: list):
+    """Проверить пакет до открытия транзакции"""
+    if not operations:
+        raise BatchError("Пустой пакет")
+    if len(operations) > MAX_BATCH_SIZE:
+        raise BatchError(f"Слишком большой пакет: {len(operations)} > {MAX_BATCH_SIZE}")
+
+    for index, op in enumerate(operations):
+        kind = op.get("op")
+        if kind not in OPERATIONS:
+            raise BatchError(f"Неизвестная операция: {kind}", index)
+        if kind == "create" and not op.get("title"):
+            raise BatchError("Для create нужен title", index)
+        if kind != "create" and op.get("id") is None:
+            raise BatchError(f"Для {kind} нужен id", index)
+
+
+def _load_states(conn, user_id, task_ids) -> dict:
+    """Состояние задач пакета (только задачи этого пользователя)"""
+    states = {}
+    ids = list(task_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT id, status, created_at FROM tasks WHERE user_id = ? AND id IN ({', '.join('?' * len(chunk))})",
+            [user_id] + chunk)
+        for row in rows:
+            states[row[0]] = {"status": row[1], "created_at": row[2]}
+    return states
+
+
+def apply(conn: sqlite3.Connection, user_id: int, operations: list, all_or_nothing: bool = False) -> list:
+    """Применить пакет внутри транзакции вызывающего.
+
+    Возвращает результат по каждой операции. При all_or_nothing любая
+    ненайденная задача превращается в BatchError (вызывающий откатывает транзакцию).
+    """
+    now = now_ts()
+    states = _load_states(conn, user_id, {op["id"] for op in operations if op["op"] != "create"})
+    delta = StatsDelta()
+
+    results = []
+    updates = []
+    deletes = []
+
+    for index, op in enumerate(operations):
+        kind = op["op"]
+
+        if kind == "create":
+            cur = conn.execute(INSERT_SQL, (
+                user_id, op["title"], op.get("description"), op.get("priority") or 5,
+                to_db_ts(op.get("deadline")), op.get("category") or "general", now, now))
+            delta.on_created(user_id, now)
+            results.append({"index": index, "op": kind, "id": cur.lastrowid, "status": "created"})
+            continue
+
+        task_id = op["id"]
+        state = states.get(task_id)
+        if state is None:
+            results.append({"index": index, "op": kind, "id": task_id, "status": "not_found"})
+            continue
+
+        if kind == "delete":
+            deletes.append((task_id,))
+            delta.on_deleted(user_id, state["created_at"], state["status"])
+            del states[task_id]
+            results.append({"index": index, "op": kind, "id": task_id, "status": "deleted"})
+            continue
+
+        values = {name: op.get(name) for name in UPDATE_FIELDS}
+        if kind == "complete":
+            values = dict.fromkeys(UPDATE_FIELDS)
+            values["status"] = "completed"
+        values["deadline"] = to_db_ts(values["deadline"])
+
+        if values["status"]:
+            delta.on_status_changed(user_id, state["created_at"], state["status"], values["status"])
+            state["status"] = values["status"]
+
+        # Новый дедлайн сбрасывает отметку о напоминании
+        updates.append(tuple(values[name] for name in UPDATE_FIELDS) + (values["deadline"], now, task_id))
+        results.append({"index": index, "op": kind, "id": task_id,
+                        "status": "completed" if kind == "complete" else "updated"})
+
+    if all_or_nothing:
+        missing = [r for r in results if r["status"] == "not_found"]
+        if missing:
+            raise BatchError(f"Задача {missing[0]['id']} не найдена", missing[0]["index"], results)
+
+    # Удалённые в пакете задачи уже не изменяются (states), поэтому
+    # порядок "сначала все update, потом все delete" эквивалентен исходному
+    conn.executemany(UPDATE_SQL, updates)
+    conn.executemany("DELETE FROM tasks WHERE id = ?", deletes)
+    conn.executemany(RECORD_DELETION, [(task_id, user_id, now) for (task_id,) in deletes])
+    delta.flush(conn)
+
+    return results
@@ -0,0 +1,123 @@
+"""
+Кэш списков задач
+
+LRU с ограничением размера и TTL, ключ — (user_id, status) или другой
+подключ запроса пользователя (например, первая страница). Любая запись
+по пользователю сбрасывает все его ключи. Чтобы чтение, начатое до записи,
+не положило в кэш устаревший список, кэш ведёт счётчик инвалидаций: put()
+принимает значение, только если пользователя не сбрасывали после начала
+чтения (token из begin_read()).
+
+Запись из другого процесса (API, второй воркер) этот кэш не сбрасывает.
+Поэтому в ключи списков входит версия данных пользователя, а сама версия
+живёт в кэше всего VERSION_TTL секунд: база опрашивается не чаще раза за
+VERSION_TTL на пользователя, чужая запись видна не позже чем через VERSION_TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.getenv("ECHO_TASK_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("ECHO_TASK_CACHE_TTL", "60"))
+VERSION_TTL = float(os.getenv("ECHO_VERSION_TTL", "2"))
+
+
+class TaskListCache:
+    """LRU + TTL кэш списков задач с точной инвалидацией по пользователю"""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()      # (user_id, status) -> (expires_at, value)
+        self._keys_by_user = {}            # user_id -> set ключей
+        self._invalidated = {}             # user_id -> номер последней инвалидации
+        self._counter = 0
+        self._floor = 0                    # put() с token ниже floor отклоняется
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def begin_read(self) -> int:
+        """Метка начала чтения из базы (передаётся в put)"""
+        with self._lock:
+            return self._counter
+
+    def get(self, user_id: int, status=None):
+        key = (user_id, status)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, user_id: int, status, value, token: int, ttl: float = None) -> bool:
+        """Положить значение; ttl — своё время жизни вместо общего self.ttl"""
+        key = (user_id, status)
+        with self._lock:
+            if token < self._floor or self._invalidated.get(user_id, -1) > token:
+                return False
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate_user(self, user_id: int):
+        """Сбросить все списки пользователя"""
+        with self._lock:
+            self._counter += 1
+            self._invalidated[user_id] = self._counter
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+            self.invalidations += 1
+
+            # Метки инвалидаций не должны расти бесконечно: сбрасываем их,
+            # поднимая порог — put() от более ранних чтений просто не пройдёт
+            if len(self._invalidated) > self.max_entries * 4:
+                self._invalidated.clear()
+                self._counter += 1
+                self._floor = self._counter
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._invalidated.clear()
+            self._counter += 1
+            self._floor = self._counter
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
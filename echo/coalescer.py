@@ -0,0 +1,117 @@
+"""
+Group commit для записей из бота
+
+Одновременные вставки и смены статуса копятся в течение короткого окна
+(или до max_batch операций) и фиксируются одной транзакцией: одна
+блокировка записи и один fsync на группу. Каждая операция выполняется в
+своём SAVEPOINT, так что ошибка одной не откатывает соседей, а каждый
+вызывающий получает свой результат (например, lastrowid своей задачи).
+"""
+
+import asyncio
+import os
+import time
+
+WINDOW_MS = float(os.getenv("ECHO_COALESCE_WINDOW_MS", "5"))
+MAX_BATCH = int(os.getenv("ECHO_COALESCE_MAX_BATCH", "64"))
+
+# Границы корзин гистограммы размера группы
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, float("inf"))
+
+
+class WriteCoalescer:
+    """Копит операции записи и отдаёт их в commit_group одной пачкой.
+
+    commit_group(ops) получает список (fn, args) и возвращает список
+    (ok, value) той же длины; вызывается в одном event loop с submit().
+    """
+
+    def __init__(self, commit_group, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.commit_group = commit_group
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+
+        self._pending = []
+        self._timer = None
+        self._committing = set()      # задачи фиксации групп в полёте
+
+        self.groups = 0
+        self.ops = 0
+        self.failed_groups = 0
+        self.size_buckets = dict.fromkeys(BATCH_BUCKETS, 0)
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+
+    async def submit(self, fn, *args):
+        """Поставить операцию в текущую группу и дождаться её результата"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((fn, args, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        group, self._pending = self._pending, []
+        if group:
+            task = asyncio.get_running_loop().create_task(self._commit(group))
+            self._committing.add(task)
+            task.add_done_callback(self._committing.discard)
+
+    async def stop(self):
+        """Зафиксировать накопленную группу и дождаться всех начатых фиксаций"""
+        self._flush()
+        while self._committing:
+            await asyncio.gather(*self._committing, return_exceptions=True)
+
+    async def _commit(self, group):
+        started = time.perf_counter()
+        try:
+            results = await self.commit_group([(fn, args) for fn, args, _ in group])
+        except Exception as e:
+            # Транзакция группы не состоялась целиком
+            self.failed_groups += 1
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._observe(len(group), time.perf_counter() - started)
+
+        for (_, _, future), (ok, value) in zip(group, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _observe(self, size: int, seconds: float):
+        self.groups += 1
+        self.ops += size
+        self.commit_seconds_total += seconds
+        self.commit_seconds_max = max(self.commit_seconds_max, seconds)
+        for bound in BATCH_BUCKETS:
+            if size <= bound:
+                self.size_buckets[bound] += 1
+                break
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "groups": self.groups,
+            "ops": self.ops,
+            "failed_groups": self.failed_groups,
+            "avg_batch": round(self.ops / self.groups, 2) if self.groups else 0.0,
+            "batch_size_buckets": {f"le_{bound:g}": count for bound, count in self.size_buckets.items()},
+            "avg_commit_ms": round(self.commit_seconds_total / self.groups * 1000, 3) if self.groups else 0.0,
+            "max_commit_ms": round(self.commit_seconds_max * 1000, 3),
+        }
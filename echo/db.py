@@ -0,0 +1,119 @@
+"""
+Пул соединений SQLite
+
+Каждый поток получает своё долгоживущее соединение, которое переиспользуется
+между запросами: файл открывается и схема разбирается один раз на поток,
+а подготовленные выражения живут в кэше соединения.
+"""
+
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Путь к базе по умолчанию (общий для бота и API)
+DB_PATH = Path(os.getenv("ECHO_DB_PATH", str(Path.home() / "echo-bot.db")))
+
+# Настройки SQLite
+CACHE_SIZE_KB = int(os.getenv("ECHO_DB_CACHE_KB", "16384"))        # 16 MB страничного кэша
+MMAP_SIZE = int(os.getenv("ECHO_DB_MMAP_BYTES", str(128 * 1024 * 1024)))
+CACHED_STATEMENTS = int(os.getenv("ECHO_DB_CACHED_STATEMENTS", "256"))
+BUSY_TIMEOUT_MS = 5000
+
+
+def now_ts() -> str:
+    """Текущее время в формате, который хранится в базе"""
+    return datetime.now().isoformat(sep=" ", timespec="microseconds")
+
+
+def to_db_ts(value) -> Optional[str]:
+    """Привести дедлайн (datetime или ISO-строку) к единому формату"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    try:
+        return datetime.fromisoformat(str(value)).isoformat(sep=" ", timespec="seconds")
+    except ValueError:
+        return str(value)
+
+
+class ConnectionPool:
+    """Пул соединений: одно переиспользуемое соединение на поток"""
+
+    def __init__(self, path=DB_PATH, cache_size_kb: int = CACHE_SIZE_KB,
+                 mmap_size: int = MMAP_SIZE, cached_statements: int = CACHED_STATEMENTS):
+        self.path = Path(path)
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создаётся при первом обращении)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self.hits += 1
+            return conn
+
+        conn = self._connect()
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+            self.misses += 1
+        logger.debug(f"Открыто соединение SQLite для потока {threading.current_thread().name}")
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция на соединении потока: commit при успехе, rollback при ошибке"""
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    def stats(self) -> dict:
+        """Счётчики пула"""
+        total = self.hits + self.misses
+        return {
+            "connections": len(self._connections),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close_all(self):
+        """Закрыть все соединения пула"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
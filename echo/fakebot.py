@@ -0,0 +1,143 @@
+"""
+Bot API в памяти процесса — для проверок и нагрузочных прогонов без сети
+
+FakeBotAPI отвечает на основные методы (getMe, sendMessage,
+editMessageText, answerCallbackQuery, getFile, webhook), запоминает все
+вызовы и, как настоящий Telegram, отвечает 429 с retry_after при
+превышении лимитов. Файлы (голосовые) кладутся в api.files и отдаются
+через api.fetch — замену загрузки для VoicePipeline.
+
+    api = FakeBotAPI()
+    application = (Application.builder().token("123:fake").updater(None)
+                   .request(FakeRequest(api)).get_updates_request(FakeRequest(api)).build())
+"""
+
+import asyncio
+import json
+import math
+import time
+from pathlib import Path
+
+from telegram.request import BaseRequest
+
+from echo.sender import TokenBucket
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Echo", "username": "echo_fake_bot"}
+
+
+class FakeBotAPI:
+    """Состояние поддельного Bot API: вызовы, сообщения, лимиты"""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 latency: float = 0.0, rate_limits: bool = True):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.latency = latency
+        self.rate_limits = rate_limits
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._message_ids = {}
+
+        self.calls = []               # (monotonic, method, параметры)
+        self.messages = {}            # (chat_id, message_id) -> текст
+        self.webhook_url = ""
+        self.rejected = 0
+        self.files = {}               # file_id -> содержимое
+
+    def calls_to(self, method: str) -> list:
+        return [params for _, name, params in self.calls if name == method]
+
+    async def fetch(self, file, dest, max_bytes: int):
+        """Загрузка файла для VoicePipeline(fetch=...)"""
+        data = self.files[file.file_id]
+        if len(data) > max_bytes:
+            raise ValueError(f"Файл {file.file_id} больше {max_bytes} байт")
+        await asyncio.to_thread(Path(dest).write_bytes, data)
+
+    def _limited(self, chat_id) -> float:
+        """Сколько ждать, если вызов превышает лимиты (0 — можно)"""
+        if not self.rate_limits:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        wait = max(self._global.delay(now), bucket.delay(now))
+        if wait:
+            return wait
+        self._global.take(now)
+        bucket.take(now)
+        return 0.0
+
+    def _message(self, chat_id, message_id, text) -> dict:
+        return {"message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+
+    async def call(self, method: str, params: dict):
+        """Выполнить вызов; возвращает (HTTP-статус, тело ответа)"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None and method in ("sendMessage", "editMessageText"):
+            wait = self._limited(chat_id)
+            if wait:
+                self.rejected += 1
+                retry_after = max(1, math.ceil(wait))
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+
+        self.calls.append((time.monotonic(), method, params))
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = ""
+            result = True
+        elif method == "sendMessage":
+            message_id = self._message_ids[chat_id] = self._message_ids.get(chat_id, 0) + 1
+            self.messages[(chat_id, message_id)] = params.get("text")
+            result = self._message(chat_id, message_id, params.get("text"))
+        elif method == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self.files:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}
+            result = {"file_id": file_id, "file_unique_id": f"u{file_id}", "file_size": len(self.files[file_id]),
+                      "file_path": f"voice/{file_id}.oga"}
+        elif method == "editMessageText":
+            key = (chat_id, params.get("message_id"))
+            if chat_id is not None and key not in self.messages:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message to edit not found"}
+            self.messages[key] = params.get("text")
+            result = self._message(chat_id, params.get("message_id"), params.get("text"))
+        else:
+            result = True
+
+        return 200, {"ok": True, "result": result}
+
+
+class FakeRequest(BaseRequest):
+    """Транспорт python-telegram-bot, отправляющий запросы в FakeBotAPI"""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        params = request_data.parameters if request_data else {}
+        status, body = await self.api.call(url.rsplit("/", 1)[-1], params)
+        return status, json.dumps(body).encode()
@@ -0,0 +1,169 @@
+"""
+Приём обновлений Telegram из webhook
+
+- Ограниченная очередь: при переполнении обновление сбрасывается сразу,
+  webhook отвечает 200 (Telegram не повторяет) или 429 (повторит позже).
+- Дедупликация по update_id в скользящем окне: повторная доставка того же
+  обновления Telegram-ом не обрабатывается дважды.
+- Пул воркеров обрабатывает разные чаты параллельно, но обновления одного
+  чата — строго по очереди, так что порядок сообщений пользователя сохраняется.
+- offer() потокобезопасен: webhook может работать в другом потоке/event loop,
+  чем воркеры.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("ECHO_UPDATE_WORKERS", "8"))
+MAX_QUEUE = int(os.getenv("ECHO_UPDATE_QUEUE_SIZE", "1000"))
+DEDUP_WINDOW = int(os.getenv("ECHO_UPDATE_DEDUP_WINDOW", "10000"))
+SHED_STATUS = int(os.getenv("ECHO_WEBHOOK_SHED_STATUS", "200"))
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+SHED = "shed"
+
+
+def chat_key(data: dict):
+    """Ключ сериализации: чат (или пользователь) обновления"""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = data.get(field)
+        if message and "chat" in message:
+            return message["chat"].get("id")
+    callback = data.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        if message and "chat" in message:
+            return message["chat"].get("id")
+        return callback.get("from", {}).get("id")
+    for payload in data.values():
+        if isinstance(payload, dict) and "from" in payload:
+            return payload["from"].get("id")
+    return ("update", data.get("update_id"))
+
+
+class UpdateIngestor:
+    """Очередь обновлений с дедупликацией и пулом воркеров, упорядоченным по чатам"""
+
+    def __init__(self, process, workers: int = WORKERS, max_queue: int = MAX_QUEUE,
+                 dedup_window: int = DEDUP_WINDOW, shed_status: int = SHED_STATUS):
+        self.process = process
+        self.workers = workers
+        self.max_queue = max_queue
+        self.dedup_window = dedup_window
+        self.shed_status = shed_status
+
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._seen_order = deque()
+        self._depth = 0
+
+        self._loop = None
+        self._ready = None            # asyncio.Queue ключей чатов, готовых к обработке
+        self._chats = {}              # ключ чата -> deque обновлений
+        self._active = set()          # чаты в _ready или в обработке
+        self._tasks = []
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        """Сколько обновлений ждут обработки"""
+        return self._depth
+
+    async def start(self):
+        """Запустить воркеры в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._tasks = [self._loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Приём обновлений запущен: {self.workers} воркеров, очередь {self.max_queue}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def offer(self, data: dict) -> str:
+        """Принять обновление (можно вызывать из любого потока)"""
+        update_id = data.get("update_id")
+
+        with self._lock:
+            if update_id is not None and update_id in self._seen:
+                self.duplicates += 1
+                return DUPLICATE
+            if self._loop is None or self._depth >= self.max_queue:
+                self.shed += 1
+                return SHED
+
+            if update_id is not None:
+                self._seen.add(update_id)
+                self._seen_order.append(update_id)
+                if len(self._seen_order) > self.dedup_window:
+                    self._seen.discard(self._seen_order.popleft())
+            self._depth += 1
+            self.accepted += 1
+
+        key = chat_key(data)
+        if self._on_loop_thread():
+            self._enqueue(key, data)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, key, data)
+        return ACCEPTED
+
+    def _on_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _enqueue(self, key, data):
+        self._chats.setdefault(key, deque()).append(data)
+        if key not in self._active:
+            self._active.add(key)
+            self._ready.put_nowait(key)
+
+    async def _worker(self, number: int):
+        while True:
+            key = await self._ready.get()
+            pending = self._chats[key]
+            data = pending.popleft()
+            try:
+                await self.process(data)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Ошибка обработки обновления {data.get('update_id')}")
+            finally:
+                with self._lock:
+                    self._depth -= 1
+                # Следующее обновление этого чата — в конец очереди, чтобы
+                # один болтливый чат не занимал воркер целиком
+                if pending:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                    self._active.discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._depth,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "shed": self.shed,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,226 @@
+"""
+Метрики в текстовом формате Prometheus
+
+Минимальный реестр без внешних зависимостей: счётчики, гистограммы и
+gauge-и, значения которых читаются в момент запроса /metrics. Наблюдение —
+это perf_counter, bisect по границам корзин и пара инкрементов под
+блокировкой, так что метрики можно не выключать в продакшене.
+
+- echo_http_request_duration_seconds{method, route, status} — middleware
+  (route — шаблон пути, например /tasks/{task_id}, а не сам URL)
+- echo_db_query_duration_seconds{query} — каждая операция репозитория в
+  потоке SQLite
+- echo_handler_duration_seconds{handler, outcome} — обработчики Telegram
+- gauge-и очередей (обновления, исходящие сообщения) регистрирует приложение
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Границы корзин по умолчанию (секунды): от 0.5 мс до 10 с
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}             # метки -> [счётчики корзин..., +Inf, сумма]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, labels: tuple = ()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(labels, time.perf_counter() - started)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]:.6f}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge:
+    """Значение, которое вычисляется при каждом чтении /metrics"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        yield f"{self.name} {float(self.read()):g}"
+
+
+class Registry:
+    """Набор метрик одного процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """Добавить метрику (метрика с тем же именем заменяется)"""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, help: str, read):
+        return self.register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} недоступна: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Starlette сам добавит "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+HTTP_REQUESTS = REGISTRY.register(Histogram(
+    "echo_http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status")))
+DB_QUERIES = REGISTRY.register(Histogram(
+    "echo_db_query_duration_seconds", "Время выполнения операции SQLite", ("query",)))
+DB_ERRORS = REGISTRY.register(Counter(
+    "echo_db_query_errors_total", "Операции SQLite, завершившиеся ошибкой", ("query",)))
+HANDLERS = REGISTRY.register(Histogram(
+    "echo_handler_duration_seconds", "Время работы обработчика Telegram", ("handler", "outcome")))
+RATE_LIMITED = REGISTRY.register(Counter(
+    "echo_rate_limited_total", "Запросы, отклонённые ограничением частоты", ("source", "kind")))
+
+
+def run_query(name: str, fn, *args):
+    """Выполнить fn(*args) в потоке SQLite, учитывая время и ошибки под меткой query=name"""
+    labels = (name,)
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    except Exception:
+        DB_ERRORS.inc(labels)
+        raise
+    finally:
+        DB_QUERIES.observe(labels, time.perf_counter() - started)
+
+
+def timed_handler(fn):
+    """Обернуть обработчик Telegram (update, context)"""
+    name = fn.__name__
+
+    @wraps(fn)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await fn(update, context)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            HANDLERS.observe((name, outcome), time.perf_counter() - started)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware: длительность и статус каждого HTTP-запроса по шаблону маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        streamed = None
+
+        async def send_wrapper(message):
+            nonlocal status, streamed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Поток событий живёт минутами: для него меряем время до заголовков
+                if any(name == b"content-type" and value.startswith(b"text/event-stream")
+                       for name, value in message.get("headers", ())):
+                    streamed = time.perf_counter() - started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Маршрут FastAPI кладёт себя в scope при совпадении пути
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            elapsed = streamed if streamed is not None else time.perf_counter() - started
+            HTTP_REQUESTS.observe((scope["method"], path, str(status)), elapsed)
@@ -0,0 +1,302 @@
+"""
+Миграции схемы
+
+Версия схемы хранится в PRAGMA user_version. Каждая миграция выполняется
+в собственной транзакции BEGIN IMMEDIATE, версия перечитывается уже под
+блокировкой, поэтому бот и API могут стартовать одновременно. Миграции
+только добавляют объекты (ADD COLUMN, CREATE INDEX), таблицы не
+пересоздаются — обновление безопасно на работающей базе.
+
+Запуск вручную:
+    python -m echo.migrations            # применить миграции
+    python -m echo.migrations --check    # проверить планы горячих запросов
+"""
+
+import argparse
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    """ALTER TABLE ADD COLUMN, если колонки ещё нет (операция только над метаданными)"""
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# --- МИГРАЦИИ ---
+
+def _v1_base_schema(conn):
+    """Единая схема users/tasks для бота и API"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        chat_id TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        title TEXT NOT NULL,
+        description TEXT,
+        priority INTEGER DEFAULT 5,
+        status TEXT DEFAULT 'active',
+        deadline TIMESTAMP,
+        category TEXT DEFAULT 'general',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )''')
+
+    # Базы, созданные старыми init_db() из bot.py и api/main.py
+    _add_column(conn, "users", "chat_id", "TEXT")
+    _add_column(conn, "users", "last_name", "TEXT")
+    _add_column(conn, "tasks", "category", "TEXT DEFAULT 'general'")
+
+
+def _v2_task_indexes(conn):
+    """Индексы под горячие запросы списка задач и статистики"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_user_status_rank
+        ON tasks (user_id, status, priority DESC, deadline, created_at DESC)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_user_created
+        ON tasks (user_id, created_at)''')
+
+
+def _v3_stats_counters(conn):
+    """Счётчики статистики по дням и по пользователю (см. echo/stats.py)"""
+    from echo import stats
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS task_stats_daily (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS task_stats_user (
+        user_id INTEGER PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        active INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0
+    )''')
+    stats.rebuild(conn, archive=False)
+
+
+def _v4_task_rank_index(conn):
+    """Индекс для постраничного списка без фильтра по статусу"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_user_rank
+        ON tasks (user_id, priority DESC, deadline, created_at DESC)''')
+
+
+def _v5_reminders(conn):
+    """Отметка о напоминании и частичный индекс ближайших дедлайнов (см. echo/reminders.py)"""
+    from echo.db import now_ts
+
+    _add_column(conn, "tasks", "reminded_at", "TIMESTAMP")
+    # Старые записи могли хранить дедлайн с разделителем 'T': приводим к формату
+    # to_db_ts, чтобы диапазон по строкам совпадал с диапазоном по времени
+    conn.execute("UPDATE tasks SET deadline = replace(deadline, 'T', ' ') WHERE deadline LIKE '____-__-__T%'")
+    # Уже просроченные задачи задним числом не напоминаем
+    now = now_ts()
+    conn.execute('''UPDATE tasks SET reminded_at = ?
+        WHERE deadline IS NOT NULL AND deadline <= ? AND reminded_at IS NULL''', (now, now))
+    # В индексе только задачи, ждущие напоминания: окно ближайших дедлайнов
+    # читается за O(размер окна), сколько бы задач ни было в таблице
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (deadline)
+        WHERE status = 'active' AND reminded_at IS NULL AND deadline IS NOT NULL''')
+
+
+def _v6_sync(conn):
+    """Журнал удалений и индекс изменений для дельта-синхронизации (см. echo/sync.py)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS task_deletions (
+        task_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        deleted_at TIMESTAMP NOT NULL
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_task_deletions_user
+        ON task_deletions (user_id, deleted_at)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_tasks_user_updated
+        ON tasks (user_id, updated_at)''')
+
+
+def _v7_search(conn):
+    """Полнотекстовый индекс задач и триггеры синхронизации (см. echo/search.py)"""
+    from echo import search
+
+    search.create_index(conn)
+    search.rebuild(conn, tables=("tasks",))
+
+
+def _v8_templates(conn):
+    """Шаблоны задач: общие и личные (см. echo/templates.py)"""
+    from echo import templates
+
+    templates.create_table(conn)
+
+
+def _v9_archive(conn):
+    """Архив выполненных задач и индекс кандидатов на перенос (см. echo/archive.py)"""
+    from echo import archive
+
+    archive.create_table(conn)
+
+
+MIGRATIONS = [
+    (1, "base schema", _v1_base_schema),
+    (2, "task indexes", _v2_task_indexes),
+    (3, "stats counters", _v3_stats_counters),
+    (4, "task rank index", _v4_task_rank_index),
+    (5, "deadline reminders", _v5_reminders),
+    (6, "delta sync", _v6_sync),
+    (7, "full-text search", _v7_search),
+    (8, "task templates", _v8_templates),
+    (9, "completed tasks archive", _v9_archive),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции. Возвращает итоговую версию схемы"""
+    for version, description, apply in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if schema_version(conn) >= version:
+                conn.execute("ROLLBACK")
+                continue
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Миграция {version} применена: {description}")
+
+    return schema_version(conn)
+
+
+# --- ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ ---
+
+# Горячие запросы и индекс, который они обязаны использовать
+HOT_QUERIES = {
+    "tasks_by_status": (
+        '''SELECT * FROM tasks WHERE user_id = ? AND status = ?
+           ORDER BY priority DESC, deadline ASC, created_at DESC, id ASC''',
+        (1, "active"),
+        "idx_tasks_user_status_rank",
+    ),
+    "list_view": (
+        '''SELECT id, title, priority FROM tasks WHERE user_id = ? AND status = 'active'
+           ORDER BY priority DESC, deadline ASC, created_at DESC, id ASC LIMIT 10''',
+        (1,),
+        "idx_tasks_user_status_rank",
+    ),
+    "tasks_page": (
+        '''SELECT * FROM tasks WHERE user_id = ?
+           ORDER BY priority DESC, deadline ASC, created_at DESC, id ASC LIMIT 51''',
+        (1,),
+        "idx_tasks_user_rank",
+    ),
+    "stats_by_day": (
+        '''SELECT COUNT(*) FROM tasks
+           WHERE user_id = ? AND created_at >= ? AND created_at < ?''',
+        (1, "2024-01-01", "2024-01-02"),
+        "idx_tasks_user_created",
+    ),
+    "due_tasks": (
+        '''SELECT id, deadline FROM tasks
+           WHERE status = 'active' AND reminded_at IS NULL AND deadline IS NOT NULL AND deadline <= ?
+           ORDER BY deadline LIMIT 1000''',
+        ("2024-01-01 12:00:00",),
+        "idx_tasks_due",
+    ),
+    "task_changes": (
+        '''SELECT * FROM tasks
+           WHERE user_id = ? AND updated_at >= ? AND (updated_at > ? OR id > ?)
+           ORDER BY updated_at, id LIMIT 201''',
+        (1, "2024-01-01 12:00:00", "2024-01-01 12:00:00", 0),
+        "idx_tasks_user_updated",
+    ),
+    "user_version": (
+        '''SELECT updated_at, id FROM tasks WHERE user_id = ?
+           ORDER BY updated_at DESC, id DESC LIMIT 1''',
+        (1,),
+        "idx_tasks_user_updated",
+    ),
+    "task_search": (
+        '''SELECT t.* FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+           WHERE tasks_fts MATCH ? AND t.status = ? ORDER BY rank LIMIT 50''',
+        ('user_id:"1" AND {title description}:("отчет"*)', "active"),
+        "tasks_fts",
+    ),
+    "archive_batch": (
+        '''SELECT id, user_id FROM tasks
+           WHERE status = 'completed' AND updated_at < ?
+           ORDER BY updated_at LIMIT 500''',
+        ("2024-01-01 12:00:00",),
+        "idx_tasks_completed",
+    ),
+}
+
+
+def explain(conn: sqlite3.Connection, sql: str, params=()) -> list:
+    """Строки EXPLAIN QUERY PLAN"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn: sqlite3.Connection) -> dict:
+    """Проверить, что горячие запросы идут по своим индексам без сортировки во временном B-tree.
+
+    Возвращает {имя запроса: (ok, план)}.
+    """
+    results = {}
+    for name, (sql, params, index) in HOT_QUERIES.items():
+        plan = explain(conn, sql, params)
+        uses_index = any(index in line for line in plan)
+        sorts = any("USE TEMP B-TREE" in line for line in plan)
+        results[name] = (uses_index and not sorts, plan)
+    return results
+
+
+def main():
+    from echo.db import ConnectionPool, DB_PATH
+
+    parser = argparse.ArgumentParser(description="Миграции базы Echo")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу SQLite")
+    parser.add_argument("--check", action="store_true", help="проверить планы горячих запросов")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    pool = ConnectionPool(args.db)
+    conn = pool.connection()
+
+    version = migrate(conn)
+    print(f"Версия схемы: {version}")
+
+    if args.check:
+        failed = False
+        for name, (ok, plan) in check_query_plans(conn).items():
+            print(f"{'OK  ' if ok else 'FAIL'} {name}")
+            for line in plan:
+                print(f"     {line}")
+            failed |= not ok
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Keyset-пагинация списка задач
+
+Порядок списка: priority DESC, deadline ASC (NULL первыми), created_at DESC, id ASC.
+Курсор — позиция последней отданной строки в этом порядке; следующая
+страница начинается строго после неё. В отличие от OFFSET стоимость
+страницы не зависит от того, насколько далеко клиент пролистал.
+"""
+
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ORDER_BY = "priority DESC, deadline ASC, created_at DESC, id ASC"
+
+# Колонки, которые можно запросить через fields=
+TASK_FIELDS = ("id", "user_id", "title", "description", "priority", "status",
+               "deadline", "category", "created_at", "updated_at")
+
+# Колонки курсора (выбираются всегда, даже если их не просили)
+KEY_FIELDS = ("priority", "deadline", "created_at", "id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row) -> str:
+    key = [row[name] for name in KEY_FIELDS]
+    raw = json.dumps(key, ensure_ascii=False, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        priority, deadline, created_at, task_id = json.loads(raw)
+        return int(priority), deadline, created_at, int(task_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Некорректный курсор: {cursor}") from e
+
+
+def parse_fields(fields: str = None) -> tuple:
+    """fields=id,title,priority -> кортеж колонок (None — все колонки)"""
+    if not fields:
+        return None
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [name for name in names if name not in TASK_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def clamp_limit(limit: int = None) -> int:
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def after_cursor(cursor: tuple) -> tuple:
+    """WHERE-условие "строго после курсора" и его параметры.
+
+    Условие priority <= ? дублирует первую ветку OR, но даёт SQLite
+    диапазон по индексу: поиск начинается сразу с нужного приоритета.
+    """
+    priority, deadline, created_at, task_id = cursor
+
+    # created_at DESC (NULL последними), затем id ASC
+    if created_at is None:
+        tail, tail_params = "(created_at IS NULL AND id > ?)", [task_id]
+    else:
+        tail = "(created_at < ? OR created_at IS NULL OR (created_at = ? AND id > ?))"
+        tail_params = [created_at, created_at, task_id]
+
+    # deadline ASC (NULL первыми)
+    if deadline is None:
+        by_deadline = f"(deadline IS NOT NULL OR (deadline IS NULL AND {tail}))"
+        deadline_params = tail_params
+    else:
+        by_deadline = f"(deadline > ? OR (deadline = ? AND {tail}))"
+        deadline_params = [deadline, deadline] + tail_params
+
+    clause = f"priority <= ? AND (priority < ? OR (priority = ? AND {by_deadline}))"
+    return clause, [priority, priority, priority] + deadline_params
@@ -0,0 +1,169 @@
+"""
+Push изменений задач в открытые Mini App (Server-Sent Events)
+
+GET /tasks/events?user_id=... держит открытый text/event-stream. Репозиторий
+сообщает о каждой записи (add_listener), брокер раскладывает событие по
+подпискам пользователя — без обращений к базе. Событие несёт только вид
+изменения и ID задачи: клиент в ответ забирает дельту через /tasks/changes,
+так что пропущенное событие ничего не ломает.
+
+Подписка — это deque и asyncio.Event, ожидающая корутина ответа не держит
+ни потоков, ни соединений с базой, поэтому тысячи простаивающих клиентов
+стоят только памяти. Раз в HEARTBEAT секунд в поток уходит комментарий:
+прокси не закрывают соединение по таймауту, а разрыв обнаруживается при
+записи. Клиент, у которого накопилось больше MAX_PENDING событий (не
+успевает читать), отключается с событием reset — EventSource
+переподключится сам и перечитает изменения.
+
+Брокер живёт в процессе: бот и API публикуют каждый свои записи.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = float(os.getenv("ECHO_PUSH_HEARTBEAT", "15"))
+MAX_PENDING = int(os.getenv("ECHO_PUSH_MAX_PENDING", "64"))
+MAX_SUBSCRIBERS = int(os.getenv("ECHO_PUSH_MAX_SUBSCRIBERS", "10000"))
+MAX_PER_USER = int(os.getenv("ECHO_PUSH_MAX_PER_USER", "8"))
+RETRY_MS = int(os.getenv("ECHO_PUSH_RETRY_MS", "3000"))
+
+MEDIA_TYPE = "text/event-stream"
+# Без буферизации в nginx и без кэширования потока
+HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class TooManySubscribers(Exception):
+    """Превышен общий лимит подписок или лимит на пользователя"""
+
+
+class Subscription:
+    """Подписка одного открытого потока"""
+
+    __slots__ = ("user_id", "pending", "wakeup", "dropped", "closed")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.dropped = False
+        self.closed = False
+
+
+class ChangeBroker:
+    """Fan-out событий репозитория по подпискам пользователей"""
+
+    def __init__(self, heartbeat: float = HEARTBEAT, max_pending: int = MAX_PENDING,
+                 max_subscribers: int = MAX_SUBSCRIBERS, max_per_user: int = MAX_PER_USER):
+        self.heartbeat = heartbeat
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self._subscribers = {}        # user_id -> set[Subscription]
+        self._count = 0
+        self._seq = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # --- ПОДПИСКИ ---
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscribers = self._subscribers.get(user_id, ())
+        if self._count >= self.max_subscribers or len(subscribers) >= self.max_per_user:
+            self.rejected += 1
+            raise TooManySubscribers(f"Слишком много подписок (пользователь {user_id})")
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+        self._count -= 1
+
+    def close(self):
+        """Завершить все потоки (остановка приложения)"""
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.closed = True
+                subscription.wakeup.set()
+
+    # --- ПУБЛИКАЦИЯ ---
+
+    def publish(self, user_id: int, message: dict):
+        """Положить событие во все подписки пользователя (не блокирует)"""
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        self._seq += 1
+        self.published += 1
+        for subscription in subscribers:
+            if subscription.dropped:
+                continue
+            if len(subscription.pending) >= self.max_pending:
+                # Медленный клиент: не копим очередь, а отключаем его
+                subscription.dropped = True
+                subscription.pending.clear()
+                self.dropped += 1
+                logger.warning(f"Push: отключён медленный клиент пользователя {user_id}")
+            else:
+                subscription.pending.append((self._seq, message))
+            subscription.wakeup.set()
+
+    def on_task_event(self, event: str, task: dict):
+        """Слушатель репозитория (см. TaskRepository.add_listener)"""
+        user_id = task.get("user_id")
+        if user_id is not None:
+            self.publish(user_id, {"event": event, "id": task["id"]})
+
+    # --- ПОТОК ---
+
+    async def stream(self, subscription: Subscription):
+        """Тело ответа text/event-stream; подписка снимается при любом завершении"""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                if not (subscription.pending or subscription.dropped or subscription.closed):
+                    subscription.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(subscription.wakeup.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": ping\n\n"
+                        continue
+
+                if subscription.dropped:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                if subscription.closed:
+                    return
+
+                # Всё накопившееся — одной записью в сокет
+                chunk = []
+                while subscription.pending:
+                    seq, message = subscription.pending.popleft()
+                    chunk.append(f"id: {seq}\nevent: change\ndata: {json.dumps(message)}\n\n")
+                self.delivered += len(chunk)
+                yield "".join(chunk)
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self._count,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
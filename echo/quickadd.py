@@ -0,0 +1,294 @@
+"""
+Быстрое добавление: дедлайн, приоритет и категория из текста задачи
+
+    parse("Отчёт завтра в 15:00 срочно #работа")
+    -> {"title": "Отчёт", "deadline": datetime(…, 15, 0), "priority": 9, "category": "work"}
+
+Правила (русские и английские) описаны таблицами ниже и при импорте
+собираются в одно регулярное выражение: каждое правило — именованная
+альтернатива, m.lastgroup сразу указывает на обработчик. Разбор сообщения —
+один проход finditer, без циклов по правилам; найденные фрагменты
+вырезаются из названия.
+
+Дата без времени — DEFAULT_TIME (сегодняшняя прошедшая — конец дня), время
+без даты — ближайшее такое время, день недели — ближайший следующий, дата
+без года — ближайшая будущая. Относительный срок («через 2 часа») важнее
+даты и времени.
+"""
+
+import re
+from datetime import date, datetime, time, timedelta
+
+DEFAULT_PRIORITY = 5
+DEFAULT_CATEGORY = "general"
+DEFAULT_TIME = (18, 0)
+END_OF_DAY = (23, 59)
+
+CATEGORY_ALIASES = {
+    "работа": "work", "work": "work", "job": "work",
+    "личное": "personal", "дом": "personal", "personal": "personal", "home": "personal",
+    "здоровье": "health", "спорт": "health", "health": "health", "sport": "health",
+}
+
+NUMBER_WORDS = {
+    "один": 1, "одну": 1, "одна": 1, "пару": 2, "два": 2, "две": 2, "три": 3, "четыре": 4, "пять": 5,
+    "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10,
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+MONTHS = {
+    "янв": 1, "фев": 2, "мар": 3, "апр": 4, "мая": 5, "май": 5, "июн": 6, "июл": 7, "авг": 8,
+    "сен": 9, "окт": 10, "ноя": 11, "дек": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+
+WEEKDAYS = {
+    "пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6,
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+# --- ФРАГМЕНТЫ ПАТТЕРНОВ ---
+
+_NUMBER = r"\d{1,3}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+_RU_MONTH = r"январ[яь]|феврал[яь]|март[а]?|апрел[яь]|ма[яй]|июн[яь]|июл[яь]|август[а]?|сентябр[яь]|октябр[яь]|ноябр[яь]|декабр[яь]"
+_EN_MONTH = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+             r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+_RU_WEEKDAY = (r"(?P<пн>понедельник[а]?)|(?P<вт>вторник[а]?)|(?P<ср>сред[уыа])|(?P<чт>четверг[а]?)"
+               r"|(?P<пт>пятниц[уыа])|(?P<сб>суббот[уыа])|(?P<вс>воскресень[ея])")
+_EN_WEEKDAY = (r"(?P<mon>monday)|(?P<tue>tuesday)|(?P<wed>wednesday)|(?P<thu>thursday)"
+               r"|(?P<fri>friday)|(?P<sat>saturday)|(?P<sun>sunday)")
+_RU_BEFORE = r"(?:(?:на|до|к|в|во)\s+)?"
+_EN_BEFORE = r"(?:(?:by|on|next|this|until)\s+)?"
+
+_UNITS = {
+    "minutes": r"минут[уы]?|мин|minutes?|mins?",
+    "hours": r"час(?:а|ов)?|ч|hours?|hrs?|h",
+    "days": r"д(?:ень|ня|ней)|сут(?:ки|ок)|days?",
+    "weeks": r"недел[юиь]|нед|weeks?",
+    "months": r"месяц(?:а|ев)?|months?",
+}
+_UNIT = "|".join(f"(?P<{unit}>{pattern})" for unit, pattern in _UNITS.items())
+
+
+# --- ОБРАБОТЧИКИ ---
+
+def _number(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBER_WORDS[value.lower()]
+
+
+def _delta(g, now):
+    count = _number(g["n"]) if g["n"] else 1
+    for unit in _UNITS:
+        if g[unit]:
+            if unit == "months":
+                return timedelta(days=30 * count)
+            return timedelta(**{unit: count})
+
+
+def _weekday(g, now):
+    weekday = next(WEEKDAYS[name] for name in WEEKDAYS if g.get(name))
+    # Ближайший следующий: «в пятницу», сказанное в пятницу, — через неделю
+    return now.date() + timedelta(days=(weekday - now.weekday()) % 7 or 7)
+
+
+def _future_date(year, month, day, now):
+    try:
+        value = date(year or now.year, month, day)
+    except ValueError:
+        return None
+    if year is None and value < now.date():
+        value = value.replace(year=value.year + 1)
+    return value
+
+
+def _numeric_date(g, now):
+    year = int(g["y"]) if g.get("y") else None
+    if year is not None and year < 100:
+        year += 2000
+    return _future_date(year, int(g["m"]), int(g["d"]), now)
+
+
+def _named_date(g, now):
+    return _future_date(None, MONTHS[g["mon"][:3].lower()], int(g["d"]), now)
+
+
+def _clock(hour, minute=0, meridiem=None):
+    if meridiem:
+        meridiem = meridiem.lower()
+        if meridiem in ("pm", "дня", "вечера") and hour < 12:
+            hour += 12
+        elif meridiem in ("am", "ночи", "утра") and hour == 12:
+            hour = 0
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return hour, minute
+    return None
+
+
+def _time(g, now):
+    return _clock(int(g["h"]), int(g.get("mi") or 0), g.get("mer"))
+
+
+def _priority(value):
+    return lambda g, now: value
+
+
+def _bangs(g, now):
+    return 8 if len(g["b"]) == 2 else 10
+
+
+def _explicit_priority(g, now):
+    return max(1, min(int(g["p"]), 10))
+
+
+def _category(g, now):
+    tag = g["tag"].lower()
+    return CATEGORY_ALIASES.get(tag, tag)
+
+
+# --- ТАБЛИЦЫ ПРАВИЛ ---
+
+# (паттерн, обработчик[, только целыми словами]); обработчик(группы, now) -> значение
+# или None, если фрагмент не подходит (тогда он остаётся в названии)
+DELTA_RULES = [
+    (r"через\s+полчаса|in\s+half\s+an\s+hour", lambda g, now: timedelta(minutes=30)),
+    (rf"через\s+(?:(?P<n>{_NUMBER})\s*)?(?:{_UNIT})", _delta),
+    (rf"in\s+(?P<n>{_NUMBER})\s*(?:{_UNIT})", _delta),
+]
+
+DAY_RULES = [
+    (rf"{_RU_BEFORE}сегодня|today", lambda g, now: now.date()),
+    (rf"{_RU_BEFORE}послезавтра|(?:the\s+)?day\s+after\s+tomorrow", lambda g, now: now.date() + timedelta(days=2)),
+    (rf"{_RU_BEFORE}завтра|{_EN_BEFORE}tomorrow", lambda g, now: now.date() + timedelta(days=1)),
+    (rf"{_RU_BEFORE}(?:{_RU_WEEKDAY})|{_EN_BEFORE}(?:{_EN_WEEKDAY})", _weekday),
+    (r"(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})", _numeric_date),
+    # Без «в»: «в 15.30» — это время; день и месяц в пределах, так что «15.45» тоже остаётся временем.
+    # Без предлога — только «05.06» или с годом: «1.5 литра» и «глава 2.3» — не даты;
+    # продолжение цифрой («10.12.1») — номер версии
+    (r"(?:на|до|к)\s+(?P<d>0?[1-9]|[12]\d|3[01])\.(?P<m>0?[1-9]|1[0-2])(?:\.(?P<y>\d{4}|\d{2}))?(?!\d|\.\d)",
+     _numeric_date),
+    (r"(?P<d>0?[1-9]|[12]\d|3[01])\.(?P<m>0?[1-9]|1[0-2])\.(?P<y>\d{4}|\d{2})(?!\d|\.\d)", _numeric_date),
+    (r"(?P<d>0[1-9]|[12]\d|3[01])\.(?P<m>0[1-9]|1[0-2])(?!\d|\.\d)", _numeric_date),
+    (rf"{_RU_BEFORE}(?P<d>\d{{1,2}})\s+(?P<mon>{_RU_MONTH}|{_EN_MONTH})", _named_date),
+    (rf"{_EN_BEFORE}(?P<mon>{_EN_MONTH})\s+(?P<d>\d{{1,2}})(?:st|nd|rd|th)?", _named_date),
+]
+
+TIME_RULES = [
+    (r"(?:(?:в|к|до|at|by)\s+|@\s*)?(?P<h>\d{1,2})[:.](?P<mi>\d{2})(?!\d|\.\d)(?:\s*(?P<mer>am|pm))?", _time),
+    (r"в\s+(?P<h>\d{1,2})(?:\s*(?:ч|час(?:а|ов)?))?\s+(?P<mer>утра|дня|вечера|ночи)", _time),
+    (r"в\s+(?P<h>\d{1,2})\s*(?:ч|час(?:а|ов)?)(?!\w)|в\s+(?P<h2>\d{1,2})$",
+     lambda g, now: _clock(int(g["h"] or g["h2"]))),
+    (r"(?:at\s+)?(?P<h>\d{1,2})\s*(?P<mer>am|pm)|at\s+(?P<h2>\d{1,2})",
+     lambda g, now: _clock(int(g["h"] or g["h2"]), 0, g["mer"])),
+    (r"утром|in\s+the\s+morning|morning", lambda g, now: (9, 0)),
+    (r"дн[её]м|in\s+the\s+afternoon|afternoon", lambda g, now: (13, 0)),
+    (r"вечером|in\s+the\s+evening|evening|tonight", lambda g, now: (19, 0)),
+    (r"ночью|at\s+night", lambda g, now: (23, 0)),
+]
+
+PRIORITY_RULES = [
+    (r"не\s+срочно|не\s*важно|low\s+priority|когда-нибудь|someday", _priority(3)),
+    (r"срочн\w*|urgent\w*|asap", _priority(9)),
+    (r"важн\w*|important", _priority(7)),
+    (r"(?:приоритет|priority|p)\s*(?P<p>\d{1,2})", _explicit_priority),
+    (r"(?P<b>!{2,})", _bangs, False),
+]
+
+CATEGORY_RULES = [
+    # #123 — номер задачи или тикета, а не категория
+    (r"#(?P<tag>[^\W\d_]\w*)", _category),
+]
+
+TABLES = (
+    ("delta", DELTA_RULES),
+    ("day", DAY_RULES),
+    ("time", TIME_RULES),
+    ("priority", PRIORITY_RULES),
+    ("category", CATEGORY_RULES),
+)
+
+_GROUP = re.compile(r"\(\?P<(\w+)>")
+
+
+def compile_rules(tables=TABLES):
+    """Таблицы правил -> (одно регулярное выражение, {имя альтернативы: (вид, обработчик, группы)}).
+
+    Именованные группы правил переименовываются в r<N>_<имя>, чтобы не
+    конфликтовать между альтернативами; обработчик получает исходные имена.
+    """
+    words, others, rules = [], [], {}
+    for kind, table in tables:
+        for entry in table:
+            pattern, handler, bounded = (entry + (True,))[:3]
+            name = f"r{len(rules)}"
+            groups = tuple((f"{name}_{group}", group) for group in _GROUP.findall(pattern))
+            pattern = _GROUP.sub(lambda m: f"(?P<{name}_{m.group(1)}>", pattern)
+            if bounded:
+                words.append(rf"(?P<{name}>(?:{pattern})(?!\w))")
+            else:
+                others.append(f"(?P<{name}>{pattern})")
+            rules[name] = (kind, handler, groups)
+    # Одна проверка начала слова на все правила: внутри слова альтернативы не перебираются
+    matcher = rf"(?<!\w)(?:{'|'.join(words)})"
+    # Паттерны в нижнем регистре, текст приводится к нему перед разбором: без IGNORECASE
+    # каждая попытка сопоставления заметно дешевле
+    return re.compile("|".join([matcher] + others)), rules
+
+
+MATCHER, RULES = compile_rules()
+
+_SPACES = re.compile(r"\s{2,}")
+_EDGE_PUNCTUATION = " \t\n,.;:-—–"
+
+
+def parse(text: str, now: datetime = None) -> dict:
+    """Текст -> {"title", "deadline" (datetime | None), "priority", "category"}"""
+    now = now or datetime.now()
+    found = {"delta": None, "day": None, "time": None, "category": None}
+    priority = None
+    kept, position = [], 0
+
+    folded = text.lower()
+    if len(folded) == len(text):
+        matches = MATCHER.finditer(folded)
+    else:
+        # Редкие символы, меняющие длину при lower(): позиции должны совпадать с text
+        matches = re.finditer(MATCHER.pattern, text, re.IGNORECASE)
+
+    for match in matches:
+        kind, handler, groups = RULES[match.lastgroup]
+        value = handler({short: match.group(full) for full, short in groups}, now)
+        if value is None:
+            continue
+        if kind == "priority":
+            priority = max(priority or 0, value)
+        elif found[kind] is None:
+            found[kind] = value
+        kept.append(text[position:match.start()])
+        position = match.end()
+    kept.append(text[position:])
+
+    title = _SPACES.sub(" ", " ".join(part.strip() for part in kept)).strip(_EDGE_PUNCTUATION)
+    return {
+        "title": title or text.strip(),
+        "deadline": _deadline(found["delta"], found["day"], found["time"], now),
+        "priority": priority or DEFAULT_PRIORITY,
+        "category": found["category"] or DEFAULT_CATEGORY,
+    }
+
+
+def _deadline(delta, day, clock, now):
+    if delta is not None:
+        return (now + delta).replace(second=0, microsecond=0)
+    if day is None and clock is None:
+        return None
+
+    deadline = datetime.combine(day or now.date(), time(*(clock or DEFAULT_TIME)))
+    if deadline <= now:
+        if day is None:
+            # Только время: ближайшее такое время
+            deadline += timedelta(days=1)
+        elif clock is None and day == now.date():
+            deadline = datetime.combine(day, time(*END_OF_DAY))
+    return deadline
@@ -0,0 +1,226 @@
+"""
+Ограничение частоты запросов (token bucket)
+
+У каждого ключа — user_id или IP клиента — своё ведро: до burst токенов,
+пополнение rate токенов в секунду. Запрос тратит токен; в пустом ведре
+отказ и время до следующего токена (Retry-After). Чтения и записи считаются
+раздельно: листание списка не съедает бюджет на создание задач. Бюджет IP
+в IP_FACTOR раз больше бюджета пользователя — за одним NAT сидит много людей.
+
+Ведро пополняется лениво при обращении, фоновых таймеров нет. Вёдра лежат
+в OrderedDict, не больше MAX_KEYS на бюджет: давно молчавший ключ
+вытесняется, поток запросов с новых IP память не раздувает. Вытесненный
+ключ потом получает полное ведро — он и так успел бы наполниться.
+
+Лимитер используется только из event loop (без блокировок): HTTP-запросы
+бота и API проверяются зависимостью роутера (http_dependency), обновления
+Telegram — обработчиком bot.py в группе -1.
+
+    python -m echo.ratelimit          # стоимость одной проверки
+"""
+
+import argparse
+import math
+import os
+import time
+from collections import OrderedDict
+from time import monotonic
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+from echo import metrics
+
+ENABLED = os.getenv("ECHO_RATE_LIMIT", "1") != "0"
+READ_RATE = float(os.getenv("ECHO_RATE_READ_PER_S", "10"))
+READ_BURST = float(os.getenv("ECHO_RATE_READ_BURST", "40"))
+WRITE_RATE = float(os.getenv("ECHO_RATE_WRITE_PER_S", "2"))
+WRITE_BURST = float(os.getenv("ECHO_RATE_WRITE_BURST", "20"))
+IP_FACTOR = float(os.getenv("ECHO_RATE_IP_FACTOR", "4"))
+MAX_KEYS = int(os.getenv("ECHO_RATE_MAX_KEYS", "100000"))
+# Сколько обратных прокси перед приложением дописывают X-Forwarded-For (Render — 1)
+FORWARDED_HOPS = int(os.getenv("ECHO_FORWARDED_HOPS", "0"))
+
+READ = "read"
+WRITE = "write"
+
+# Служебные пути: проверки здоровья, метрики и webhook Telegram (его обновления
+# ограничиваются по пользователю в самом боте)
+EXEMPT_PATHS = frozenset({"/", "/health", "/metrics", "/webhook"})
+
+
+class TokenBuckets:
+    """Вёдра одного бюджета: rate токенов в секунду, не больше burst.
+
+    Ведро хранится одним числом — временем, когда оно снова станет полным
+    (GCRA): то же ведро токенов, но пополнение — одно сравнение, без
+    отдельных счётчика и метки времени.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.interval = 1.0 / rate
+        self.window = burst * self.interval
+        self._buckets = OrderedDict()     # ключ -> момент, когда ведро снова полное
+        self.rejected = 0
+        self.evicted = 0
+
+    def due(self, key, now: float, cost: float = 1.0) -> float:
+        """Момент полного ведра после списания cost токенов (ведро не меняется)"""
+        full_at = self._buckets.get(key)
+        if full_at is None or full_at < now:
+            full_at = now
+        return full_at + self.interval * cost
+
+    def charge(self, key, full_at: float):
+        """Записать списание, посчитанное due(); лишний ключ вытесняется только здесь"""
+        buckets = self._buckets
+        buckets[key] = full_at
+        buckets.move_to_end(key)
+        if len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def take(self, key, now: float, cost: float = 1.0) -> float:
+        """Списать cost токенов. 0.0 — можно; иначе секунды до повтора.
+
+        То же, что due() + charge(), одним вызовом — это горячий путь.
+        """
+        buckets = self._buckets
+        full_at = buckets.get(key)
+        if full_at is None or full_at < now:
+            full_at = now
+        full_at += self.interval * cost
+        wait = full_at - now - self.window
+        if wait > 0:
+            self.rejected += 1
+            return wait
+        buckets[key] = full_at
+        buckets.move_to_end(key)
+        if len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+            self.evicted += 1
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "rejected": self.rejected, "evicted": self.evicted}
+
+
+class RateLimiter:
+    """Бюджеты чтения и записи по user_id и по IP"""
+
+    def __init__(self, read: tuple = (READ_RATE, READ_BURST), write: tuple = (WRITE_RATE, WRITE_BURST),
+                 ip_factor: float = IP_FACTOR, max_keys: int = MAX_KEYS, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self.max_keys = max_keys
+        self.users = {READ: TokenBuckets(*read, max_keys), WRITE: TokenBuckets(*write, max_keys)}
+        self.ips = {kind: TokenBuckets(rate * ip_factor, burst * ip_factor, max_keys)
+                    for kind, (rate, burst) in ((READ, read), (WRITE, write))}
+        self._warned = {}                 # user_id -> до какого момента не напоминать об отказе
+
+    def check(self, kind: str, user_id: int = None, ip: str = None, cost: float = 1.0) -> float:
+        """0.0 — пропустить запрос; иначе секунды до повтора"""
+        if not self.enabled:
+            return 0.0
+        now = monotonic()
+        if ip is None:
+            return self.users[kind].take(user_id, now, cost) if user_id is not None else 0.0
+        # Сначала решают оба ведра, списывается только пропущенный запрос: отказ
+        # по бюджету пользователя не тратит бюджет его соседей по IP
+        ips = self.ips[kind]
+        ip_full_at = ips.due(ip, now, cost)
+        retry = ip_full_at - now - ips.window
+        if retry > 0:
+            ips.rejected += 1
+            return retry
+        if user_id is not None:
+            retry = self.users[kind].take(user_id, now, cost)
+            if retry:
+                return retry
+        ips.charge(ip, ip_full_at)
+        return 0.0
+
+    def notify_once(self, user_id: int, retry: float) -> bool:
+        """Сообщить ли пользователю об отказе: один раз, пока не истечёт retry"""
+        now = monotonic()
+        if self._warned.get(user_id, 0.0) > now:
+            return False
+        if len(self._warned) >= self.max_keys:
+            self._warned.clear()
+        self._warned[user_id] = now + retry
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "users": {kind: buckets.stats() for kind, buckets in self.users.items()},
+            "ips": {kind: buckets.stats() for kind, buckets in self.ips.items()},
+        }
+
+
+def retry_after(seconds: float) -> str:
+    """Значение заголовка Retry-After: целые секунды, не меньше 1"""
+    return str(max(1, math.ceil(seconds)))
+
+
+# --- HTTP ---
+
+def client_ip(request: Request):
+    """IP клиента: за FORWARDED_HOPS прокси — адрес, который дописал ближайший к нам прокси"""
+    if FORWARDED_HOPS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            hops = forwarded.split(",")
+            return hops[max(len(hops) - FORWARDED_HOPS, 0)].strip()
+    return request.client.host if request.client else None
+
+
+def request_user(request: Request):
+    """user_id из пути или query (?user_id=); None, если его нет или он не число"""
+    value = request.path_params.get("user_id") or request.query_params.get("user_id")
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def http_dependency(limiter: RateLimiter):
+    """Зависимость FastAPI: 429 с Retry-After, если бюджет пользователя или IP исчерпан.
+
+    GET/HEAD — чтение, остальные методы — запись.
+    """
+    async def admit(request: Request):
+        if not limiter.enabled or request.url.path in EXEMPT_PATHS:
+            return
+        kind = READ if request.method in ("GET", "HEAD") else WRITE
+        retry = limiter.check(kind, request_user(request), client_ip(request))
+        if retry:
+            metrics.RATE_LIMITED.inc(("http", kind))
+            raise HTTPException(status_code=429, detail="Слишком много запросов",
+                                headers={"Retry-After": retry_after(retry)})
+    return admit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость проверки ограничения частоты")
+    parser.add_argument("--keys", type=int, default=10000, help="разных пользователей")
+    parser.add_argument("--checks", type=int, default=1000000, help="сколько проверок")
+    args = parser.parse_args()
+
+    limiter = RateLimiter(read=(1e9, 1e9), write=(1e9, 1e9), enabled=True)
+    check = limiter.check
+    users = [1000000 + i for i in range(args.keys)]
+    ips = [f"10.0.{i // 256 % 256}.{i % 256}" for i in range(args.keys)]
+    for label, with_ip in (("user_id", False), ("user_id + IP", True)):
+        keys = [(users[i % args.keys], ips[i % args.keys] if with_ip else None) for i in range(args.checks)]
+        started = time.perf_counter()
+        for user_id, ip in keys:
+            check(WRITE, user_id, ip)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<14} {elapsed / args.checks * 1e9:6.0f} нс на проверку")
+
+
+if __name__ == "__main__":
+    main()
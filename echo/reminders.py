@@ -0,0 +1,231 @@
+"""
+Напоминания о дедлайнах
+
+В памяти держится min-куча только ближайших дедлайнов — окно [сейчас,
+сейчас + WINDOW]. Окно читается из частичного индекса idx_tasks_due, куда
+попадают лишь активные задачи без напоминания, поэтому стоимость чтения
+зависит от числа задач в окне, а не от размера таблицы. Окно
+перечитывается раз в RESCAN секунд — так подхватываются задачи, созданные
+другим процессом (например, API).
+
+Изменения из своего процесса приходят от репозитория (add_listener) и
+обновляют кучу сразу: перенос дедлайна добавляет новую запись, а старая
+становится неактуальной и пропускается при извлечении (ленивое удаление).
+
+Перед отправкой задачи «забираются» одной транзакцией: проставляется
+reminded_at, и только действительно ожидавшие напоминания задачи уходят
+в notify — повторов не будет даже при рассинхронизации кучи с базой.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import datetime
+
+from echo.db import now_ts, to_db_ts
+
+logger = logging.getLogger(__name__)
+
+WINDOW = float(os.getenv("ECHO_REMINDER_WINDOW", "3600"))
+RESCAN = float(os.getenv("ECHO_REMINDER_RESCAN", "60"))
+BATCH_SIZE = int(os.getenv("ECHO_REMINDER_BATCH", "100"))
+MAX_LOADED = int(os.getenv("ECHO_REMINDER_MAX_LOADED", "10000"))
+
+DUE_SQL = '''SELECT id, deadline FROM tasks
+    WHERE status = 'active' AND reminded_at IS NULL AND deadline IS NOT NULL AND deadline <= ?
+    ORDER BY deadline LIMIT ?'''
+
+
+def to_epoch(deadline):
+    """Дедлайн из базы -> unix time (None, если не разбирается)"""
+    try:
+        return datetime.fromisoformat(str(deadline)).timestamp()
+    except ValueError:
+        return None
+
+
+# --- SQL (выполняется в потоках репозитория) ---
+
+def due_window(conn, until: float, limit: int) -> list:
+    """(id, epoch дедлайна) задач, ждущих напоминания, с дедлайном до until"""
+    rows = conn.execute(DUE_SQL, (to_db_ts(datetime.fromtimestamp(until)), limit)).fetchall()
+    return [(row[0], to_epoch(row[1])) for row in rows]
+
+
+def claim(conn, task_ids: list, now: float) -> list:
+    """Отметить напоминание для наступивших задач; вернуть только отмеченные"""
+    rows = conn.execute(f'''SELECT t.id, t.user_id, t.title, t.deadline,
+            COALESCE(u.chat_id, t.user_id) AS chat_id
+        FROM tasks t LEFT JOIN users u ON u.user_id = t.user_id
+        WHERE t.id IN ({', '.join('?' * len(task_ids))})
+          AND t.status = 'active' AND t.reminded_at IS NULL AND t.deadline IS NOT NULL''',
+        task_ids).fetchall()
+
+    # Дедлайн мог быть перенесён другим процессом уже после загрузки окна
+    due = [dict(row) for row in rows if (to_epoch(row["deadline"]) or 0) <= now]
+    conn.executemany("UPDATE tasks SET reminded_at = ? WHERE id = ?",
+                     [(now_ts(), task["id"]) for task in due])
+    return due
+
+
+class ReminderScheduler:
+    """Куча ближайших дедлайнов и цикл отправки напоминаний.
+
+    notify(reminders) получает список задач (id, user_id, title, deadline,
+    chat_id), для которых пора напомнить, — не больше batch_size за вызов.
+    """
+
+    def __init__(self, repo, notify, window: float = WINDOW, rescan: float = RESCAN,
+                 batch_size: int = BATCH_SIZE, max_loaded: int = MAX_LOADED):
+        self.repo = repo
+        self.notify = notify
+        self.window = window
+        self.rescan = rescan
+        self.batch_size = batch_size
+        self.max_loaded = max_loaded
+
+        self._heap = []               # (epoch дедлайна, task_id), возможны устаревшие записи
+        self._due = {}                # task_id -> актуальный epoch дедлайна
+        self._horizon = 0.0           # все задачи с дедлайном до horizon уже в куче
+        self._next_scan = 0.0
+        self._wakeup = None
+        self._task = None
+
+        self.scans = 0
+        self.loaded = 0
+        self.batches = 0
+        self.sent = 0
+        self.skipped = 0
+        self.lag_seconds_max = 0.0
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+
+    async def start(self):
+        """Подписаться на изменения задач и запустить цикл в текущем event loop"""
+        self._wakeup = asyncio.Event()
+        self.repo.add_listener(self.on_task_event)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Напоминания запущены: окно {self.window:g} с, пересмотр раз в {self.rescan:g} с")
+
+    async def stop(self):
+        self.repo.remove_listener(self.on_task_event)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._heap.clear()
+        self._due.clear()
+        self._horizon = self._next_scan = 0.0
+
+    # --- ИЗМЕНЕНИЯ ЗАДАЧ ---
+
+    def on_task_event(self, event: str, task: dict):
+        """Слушатель репозитория: created / updated / completed / deleted"""
+        task_id = task["id"]
+        if event in ("completed", "deleted") or task.get("status") not in (None, "active"):
+            self._due.pop(task_id, None)
+            return
+
+        when = to_epoch(task["deadline"]) if task.get("deadline") else None
+        if when is None:
+            return
+        if when <= self._horizon:
+            self._push(task_id, when)
+        else:
+            # Дальше окна: задача попадёт в кучу при следующем чтении окна
+            self._due.pop(task_id, None)
+
+    def _push(self, task_id, when: float):
+        if self._due.get(task_id) == when:
+            return
+        self._due[task_id] = when
+        heapq.heappush(self._heap, (when, task_id))
+        if self._heap[0] == (when, task_id) and self._wakeup is not None:
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._compact()
+
+    def _compact(self):
+        """Выбросить устаревшие записи (после множества переносов дедлайнов)"""
+        self._heap = [(when, task_id) for task_id, when in self._due.items()]
+        heapq.heapify(self._heap)
+
+    # --- ЦИКЛ ---
+
+    async def _scan(self, now: float):
+        horizon = now + self.window
+        rows = await self.repo.get_due_window(horizon, self.max_loaded)
+        self.scans += 1
+        self.loaded += len(rows)
+
+        self._next_scan = now + self.rescan
+        if len(rows) >= self.max_loaded:
+            # Окно не поместилось: куча полна только до последнего загруженного
+            # дедлайна, дочитаем, когда дойдём до него
+            horizon = rows[-1][1] or now
+            self._next_scan = min(self._next_scan, horizon)
+        self._horizon = horizon
+
+        for task_id, when in rows:
+            if when is not None:
+                self._push(task_id, when)
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            when, task_id = heapq.heappop(self._heap)
+            if self._due.get(task_id) == when:
+                del self._due[task_id]
+                due.append(task_id)
+                self.lag_seconds_max = max(self.lag_seconds_max, now - when)
+        return due
+
+    async def _fire(self, task_ids: list, now: float):
+        reminders = await self.repo.claim_reminders(task_ids, now)
+        self.batches += 1
+        self.skipped += len(task_ids) - len(reminders)
+        if not reminders:
+            return
+        try:
+            await self.notify(reminders)
+            self.sent += len(reminders)
+        except Exception:
+            logger.exception(f"Ошибка отправки {len(reminders)} напоминаний")
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            try:
+                if now >= self._next_scan:
+                    await self._scan(now)
+                due = self._pop_due(now)
+                if due:
+                    await self._fire(due, now)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка цикла напоминаний")
+                self._next_scan = now + self.rescan
+
+            wake = min(self._next_scan, self._heap[0][0] if self._heap else self._next_scan)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(wake - time.time(), 0.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._due),
+            "heap_size": len(self._heap),
+            "window_s": self.window,
+            "scans": self.scans,
+            "loaded": self.loaded,
+            "batches": self.batches,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "max_lag_ms": round(self.lag_seconds_max * 1000, 3),
+        }
@@ -0,0 +1,623 @@
+"""
+Асинхронный репозиторий задач
+
+Все обращения к SQLite выполняются вне event loop: записи идут через
+единственный поток-писатель (SQLite всё равно допускает одного писателя),
+чтения — через пул читателей. Количество задач в очереди ограничено,
+поэтому всплеск запросов не копит бесконечный бэклог в executor.
+"""
+
+import asyncio
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from echo import archive, batch, metrics, reminders, search, stats, sync, templates, users
+from echo.cache import VERSION_TTL, TaskListCache
+from echo.coalescer import WriteCoalescer
+from echo.db import ConnectionPool, now_ts, to_db_ts
+from echo.migrations import migrate
+from echo.pagination import (ORDER_BY, TASK_FIELDS, KEY_FIELDS, after_cursor,
+                             clamp_limit, decode_cursor, encode_cursor)
+from echo.templates import TemplateIndex
+from echo.users import UserCache
+
+logger = logging.getLogger(__name__)
+
+READER_THREADS = 4
+MAX_PENDING = 256
+
+
+def task_to_dict(row) -> dict:
+    """Строка tasks -> dict"""
+    return {name: row[name] for name in row.keys()}
+
+
+class TaskRepository:
+    """Асинхронный доступ к задачам и пользователям"""
+
+    def __init__(self, pool: ConnectionPool, readers: int = READER_THREADS, max_pending: int = MAX_PENDING,
+                 cache: TaskListCache = None):
+        self.pool = pool
+        self.cache = cache if cache is not None else TaskListCache()
+        self.coalescer = WriteCoalescer(self._commit_group)
+        self.templates = TemplateIndex()
+        self.users = UserCache()
+        self._templates_reloading = False
+        self._reader_threads = readers
+        self._writer = None
+        self._readers = None
+        self._max_pending = max_pending
+        # Семафор на каждый event loop (приложение могут перезапускать в новом loop, например в тестах)
+        self._pending = weakref.WeakKeyDictionary()
+        self._listeners = []
+
+    # --- EXECUTORS ---
+
+    async def _submit(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = asyncio.Semaphore(self._max_pending)
+        async with pending:
+            # Метка метрики — имя операции без подчёркивания (_get_tasks -> get_tasks)
+            return await loop.run_in_executor(executor, metrics.run_query, fn.__name__.lstrip("_"), fn, *args)
+
+    async def _read(self, fn, *args):
+        if self._readers is None:
+            self._readers = ThreadPoolExecutor(max_workers=self._reader_threads,
+                                               thread_name_prefix="echo-db-reader")
+        return await self._submit(self._readers, fn, *args)
+
+    async def _write(self, fn, *args):
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="echo-db-writer")
+        return await self._submit(self._writer, fn, *args)
+
+    def init_db(self):
+        """Применить миграции схемы (вызывается синхронно при старте)"""
+        version = migrate(self.pool.connection())
+        with self.pool.transaction() as conn:
+            pruned = sync.prune(conn)
+        self.templates.load(templates.load_rows(self.pool.connection()))
+        logger.info(f"База данных инициализирована (схема v{version}, удалено надгробий: {pruned})")
+
+    async def drain(self):
+        """Дождаться записей group commit (перед close)"""
+        await self.coalescer.stop()
+
+    def close(self):
+        """Остановить executors и закрыть соединения"""
+        for executor in (self._writer, self._readers):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._writer = self._readers = None
+        self.pool.close_all()
+
+    def stats(self) -> dict:
+        """Счётчики пула, кэшей, group commit и шаблонов (для /health)"""
+        return {"db_pool": self.pool.stats(), "task_cache": self.cache.stats(), "user_cache": self.users.stats(),
+                "write_coalescer": self.coalescer.stats(), "templates": self.templates.stats()}
+
+    # --- СЛУШАТЕЛИ ИЗМЕНЕНИЙ ---
+
+    def add_listener(self, listener):
+        """listener(event, task) вызывается в event loop после фиксации записи.
+
+        event — created / updated / completed / deleted; task — dict с id,
+        user_id и изменёнными полями (status, deadline), если они известны.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event: str, task: dict):
+        for listener in self._listeners:
+            try:
+                listener(event, task)
+            except Exception:
+                logger.exception(f"Ошибка слушателя изменений задачи {task.get('id')}")
+
+    # --- ПОЛЬЗОВАТЕЛИ ---
+
+    def _upsert_user(self, user):
+        with self.pool.transaction() as conn:
+            created, stored = users.upsert(conn, user, now_ts())
+        if created:
+            logger.info(f"Создан пользователь: {user['user_id']}")
+        return created, stored
+
+    async def upsert_user(self, user_id: int, username: str = None, first_name: str = None,
+                          last_name: str = None, chat_id: str = None) -> bool:
+        """Создать или обновить пользователя. True, если пользователь новый.
+
+        Профиль без изменений (по кэшу) в базу не пишется.
+        """
+        user = users.profile(user_id, username, chat_id, first_name, last_name)
+        known = self.users.get(user_id)
+        if known is not None and users.unchanged(known, user):
+            self.users.skipped_writes += 1
+            return False
+        created, stored = await self._write(self._upsert_user, user)
+        if stored is None:
+            # Строка в базе уже такая (ON CONFLICT ... WHERE не сработал)
+            self.users.skipped_writes += 1
+            if user["chat_id"] is None:
+                # Сохранённый chat_id знаем, только если профиль уже был в кэше
+                if known is None:
+                    return False
+                user["chat_id"] = known["chat_id"]
+            stored = user
+        else:
+            self.users.writes += 1
+        self.users.put(stored)
+        return created
+
+    def _create_user(self, user):
+        with self.pool.transaction() as conn:
+            return users.insert(conn, user, now_ts())
+
+    async def create_user(self, user_id: int, username: str = None, chat_id: str = None,
+                          first_name: str = None) -> bool:
+        """Создать пользователя, если его ещё нет. True, если создан"""
+        if self.users.get(user_id) is not None:
+            self.users.skipped_writes += 1
+            return False
+        user = users.profile(user_id, username, chat_id, first_name)
+        created = await self._write(self._create_user, user)
+        if created:
+            self.users.writes += 1
+            self.users.put(user)
+        else:
+            self.users.skipped_writes += 1
+        return created
+
+    def _get_user(self, user_id):
+        return users.select(self.pool.connection(), user_id)
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """Пользователь по ID (из кэша профилей, если он там есть)"""
+        user = self.users.get(user_id)
+        if user is None:
+            user = await self._read(self._get_user, user_id)
+            if user is not None:
+                self.users.put(user)
+        return dict(user) if user is not None else None
+
+    # --- ЗАДАЧИ ---
+
+    @staticmethod
+    def _insert_task(conn, user_id, title, description, priority, deadline, category):
+        """INSERT задачи + счётчики. Возвращает (результат, user_id для сброса кэша)"""
+        now = now_ts()
+        cur = conn.execute('''INSERT INTO tasks
+            (user_id, title, description, priority, status, deadline, category, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 'active', ?, ?, ?, ?)''',
+            (user_id, title, description, priority, to_db_ts(deadline), category, now, now))
+        stats.on_created(conn, user_id, now)
+        logger.info(f"Создана задача: {cur.lastrowid} для пользователя: {user_id}")
+        return {"id": cur.lastrowid, "title": title, "status": "active", "priority": priority}, user_id
+
+    def _create_task(self, *args):
+        with self.pool.transaction() as conn:
+            result, user_id = self._insert_task(conn, *args)
+        self.cache.invalidate_user(user_id)
+        return result
+
+    async def create_task(self, user_id: int, title: str, description: str = None, priority: int = 5,
+                          deadline=None, category: str = "general", coalesce: bool = False) -> dict:
+        """Создать задачу.
+
+        coalesce=True — отдать вставку в group commit вместе с соседними записями
+        (для потока сообщений бота, где важна пропускная способность, а не задержка).
+        """
+        args = (user_id, title, description, priority, deadline, category)
+        if coalesce:
+            result = await self.coalescer.submit(self._insert_task, *args)
+        else:
+            result = await self._write(self._create_task, *args)
+        self._emit("created", {"id": result["id"], "user_id": user_id, "status": "active",
+                               "deadline": to_db_ts(deadline)})
+        return result
+
+    def _get_tasks(self, user_id, status):
+        query = f"SELECT {', '.join(TASK_FIELDS)} FROM tasks WHERE user_id = ?"
+        params = [user_id]
+
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+
+        query += f" ORDER BY {ORDER_BY}"
+
+        rows = self.pool.connection().execute(query, params).fetchall()
+        return [task_to_dict(row) for row in rows]
+
+    async def get_tasks(self, user_id: int, status: str = None) -> list:
+        """Задачи пользователя (приоритетные и срочные первыми).
+
+        Повторные запросы отдаются из кэша; любая запись по пользователю его сбрасывает.
+        Версия данных (см. get_version) входит в ключ кэша, так что запись из другого
+        процесса (API, второй воркер) видна не позже чем через VERSION_TTL.
+        """
+        key = (status, await self.get_version(user_id))
+        tasks = self.cache.get(user_id, key)
+        if tasks is None:
+            token = self.cache.begin_read()
+            tasks = await self._read(self._get_tasks, user_id, status)
+            self.cache.put(user_id, key, tasks, token)
+        return list(tasks)
+
+    def _get_list_view(self, user_id, limit):
+        conn = self.pool.connection()
+        rows = conn.execute(f'''SELECT id, title, priority FROM tasks
+            WHERE user_id = ? AND status = 'active'
+            ORDER BY {ORDER_BY} LIMIT ?''', (user_id, limit)).fetchall()
+        return dict(stats.user_totals(conn, user_id), tasks=[dict(row) for row in rows])
+
+    async def get_list_view(self, user_id: int, limit: int = 10) -> dict:
+        """Сводка для списка в боте: {"total", "active", "completed", "tasks"}.
+
+        tasks — limit первых активных задач (id, title, priority), счётчики —
+        одна строка task_stats_user, так что стоимость не зависит от числа задач.
+        Как и в get_tasks, версия данных входит в ключ кэша.
+        """
+        key = ("view", limit, await self.get_version(user_id))
+        view = self.cache.get(user_id, key)
+        if view is None:
+            token = self.cache.begin_read()
+            view = await self._read(self._get_list_view, user_id, limit)
+            self.cache.put(user_id, key, view, token)
+        return view
+
+    def _get_tasks_page(self, user_id, status, limit, cursor, fields):
+        columns = tuple(dict.fromkeys(("id",) + (fields or TASK_FIELDS) + KEY_FIELDS))
+        query = f"SELECT {', '.join(columns)} FROM tasks WHERE user_id = ?"
+        params = [user_id]
+
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+
+        if cursor:
+            clause, clause_params = after_cursor(decode_cursor(cursor))
+            query += f" AND {clause}"
+            params += clause_params
+
+        # limit + 1: лишняя строка говорит, есть ли следующая страница
+        query += f" ORDER BY {ORDER_BY} LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self.pool.connection().execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        output = tuple(dict.fromkeys(("id",) + fields)) if fields else TASK_FIELDS
+        return {
+            "tasks": [{name: row[name] for name in output} for row in rows],
+            "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+        }
+
+    async def get_tasks_page(self, user_id: int, status: str = None, limit: int = None,
+                             cursor: str = None, fields: tuple = None, version: str = None) -> dict:
+        """Страница задач по курсору: {"tasks": [...], "next_cursor": str | None}.
+
+        fields — кортеж колонок (id добавляется всегда). Первая страница кэшируется;
+        version (см. get_version) входит в ключ кэша, так что запись из другого
+        процесса тоже делает закэшированную страницу неактуальной.
+        """
+        limit = clamp_limit(limit)
+        if cursor:
+            return await self._read(self._get_tasks_page, user_id, status, limit, cursor, fields)
+
+        key = ("page", status, limit, fields, version)
+        page = self.cache.get(user_id, key)
+        if page is None:
+            token = self.cache.begin_read()
+            page = await self._read(self._get_tasks_page, user_id, status, limit, None, fields)
+            self.cache.put(user_id, key, page, token)
+        return page
+
+    def _update_task(self, task_id, status, title, deadline):
+        fields = []
+        values = []
+
+        if status:
+            fields.append("status = ?")
+            values.append(status)
+        if deadline:
+            # Новый дедлайн — новое напоминание
+            fields.append("deadline = ?, reminded_at = NULL")
+            values.append(to_db_ts(deadline))
+        if title:
+            fields.append("title = ?")
+            values.append(title)
+
+        if not fields:
+            return None
+
+        with self.pool.transaction() as conn:
+            task = self._task_state(conn, task_id)
+            if not task:
+                return None
+            conn.execute(f"UPDATE tasks SET {', '.join(fields)}, updated_at = ? WHERE id = ?",
+                         values + [now_ts(), task_id])
+            if status:
+                stats.on_status_changed(conn, task["user_id"], task["created_at"], task["status"], status)
+        self.cache.invalidate_user(task["user_id"])
+        return task["user_id"]
+
+    async def update_task(self, task_id: int, status: str = None, title: str = None, deadline=None) -> bool:
+        """Обновить задачу (статус, название, дедлайн)"""
+        user_id = await self._write(self._update_task, task_id, status, title, deadline)
+        if user_id is not None:
+            self._emit("updated", {"id": task_id, "user_id": user_id, "status": status,
+                                   "deadline": to_db_ts(deadline)})
+        return user_id is not None
+
+    @staticmethod
+    def _task_state(conn, task_id):
+        """user_id/status/created_at задачи (для обновления счётчиков)"""
+        return conn.execute("SELECT user_id, status, created_at FROM tasks WHERE id = ?",
+                            (task_id,)).fetchone()
+
+    @classmethod
+    def _mark_completed(cls, conn, task_id):
+        """UPDATE статуса + счётчики. Возвращает (user_id или None, если задачи нет; user_id для сброса кэша)"""
+        task = cls._task_state(conn, task_id)
+        if task is None:
+            return None, None
+        conn.execute('''UPDATE tasks SET status = 'completed', updated_at = ?
+            WHERE id = ?''', (now_ts(), task_id))
+        stats.on_status_changed(conn, task["user_id"], task["created_at"], task["status"], "completed")
+        logger.info(f"Задача {task_id} выполнена")
+        return task["user_id"], task["user_id"]
+
+    def _complete_task(self, task_id):
+        with self.pool.transaction() as conn:
+            user_id, _ = self._mark_completed(conn, task_id)
+        if user_id is not None:
+            self.cache.invalidate_user(user_id)
+        return user_id
+
+    async def complete_task(self, task_id: int, coalesce: bool = False) -> bool:
+        """Завершить задачу (coalesce=True — через group commit)"""
+        if coalesce:
+            user_id = await self.coalescer.submit(self._mark_completed, task_id)
+        else:
+            user_id = await self._write(self._complete_task, task_id)
+        if user_id is not None:
+            self._emit("completed", {"id": task_id, "user_id": user_id})
+        return user_id is not None
+
+    def _delete_task(self, task_id):
+        with self.pool.transaction() as conn:
+            task = self._task_state(conn, task_id)
+            if task is None:
+                return None
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            sync.record_deletion(conn, task["user_id"], task_id)
+            stats.on_deleted(conn, task["user_id"], task["created_at"], task["status"])
+        self.cache.invalidate_user(task["user_id"])
+        logger.info(f"Задача {task_id} удалена")
+        return task["user_id"]
+
+    async def delete_task(self, task_id: int) -> bool:
+        """Удалить задачу"""
+        user_id = await self._write(self._delete_task, task_id)
+        if user_id is not None:
+            self._emit("deleted", {"id": task_id, "user_id": user_id})
+        return user_id is not None
+
+    # --- GROUP COMMIT ---
+
+    def _run_group(self, ops):
+        """Выполнить группу операций одной транзакцией, каждую в своём SAVEPOINT"""
+        results = []
+        users = set()
+        with self.pool.transaction() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args in ops:
+                conn.execute("SAVEPOINT coalesced_op")
+                try:
+                    value, user_id = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO coalesced_op")
+                    conn.execute("RELEASE coalesced_op")
+                    results.append((False, e))
+                    continue
+                conn.execute("RELEASE coalesced_op")
+                results.append((True, value))
+                if user_id is not None:
+                    users.add(user_id)
+        for user_id in users:
+            self.cache.invalidate_user(user_id)
+        return results
+
+    async def _commit_group(self, ops):
+        return await self._write(self._run_group, ops)
+
+    def _apply_batch(self, user_id, operations, all_or_nothing):
+        with self.pool.transaction() as conn:
+            results = batch.apply(conn, user_id, operations, all_or_nothing)
+        self.cache.invalidate_user(user_id)
+        logger.info(f"Пакет из {len(operations)} операций применён для пользователя: {user_id}")
+        return results
+
+    async def apply_batch(self, user_id: int, operations: list, all_or_nothing: bool = False) -> list:
+        """Применить пакет create/update/complete/delete в одной транзакции.
+
+        При ошибке SQLite (или ненайденной задаче при all_or_nothing) откатывается весь пакет.
+        """
+        batch.validate(operations)
+        results = await self._write(self._apply_batch, user_id, operations, all_or_nothing)
+        for result in results:
+            op = operations[result["index"]]
+            if result["status"] == "created":
+                self._emit("created", {"id": result["id"], "user_id": user_id, "status": "active",
+                                       "deadline": to_db_ts(op.get("deadline"))})
+            elif result["status"] == "updated":
+                self._emit("updated", {"id": result["id"], "user_id": user_id, "status": op.get("status"),
+                                       "deadline": to_db_ts(op.get("deadline"))})
+            elif result["status"] in ("completed", "deleted"):
+                self._emit(result["status"], {"id": result["id"], "user_id": user_id})
+        return results
+
+    # --- ПОИСК ---
+
+    def _search_tasks(self, user_id, text, status, category, min_priority, limit):
+        return search.search(self.pool.connection(), user_id, text, status, category, min_priority, limit)
+
+    async def search_tasks(self, user_id: int, text: str, status: str = None, category: str = None,
+                           min_priority: int = None, limit: int = None) -> list:
+        """Полнотекстовый поиск по названию и описанию (bm25, см. echo/search.py)"""
+        return await self._read(self._search_tasks, user_id, text, status, category, min_priority, limit)
+
+    # --- ШАБЛОНЫ ---
+
+    def _load_templates(self):
+        return templates.load_rows(self.pool.connection())
+
+    async def _fresh_templates(self) -> TemplateIndex:
+        """Индекс шаблонов; раз в RELOAD секунд перечитывается (записи другого процесса)"""
+        if self.templates.stale() and not self._templates_reloading:
+            # Одно перечитывание за раз, остальные запросы пока берут текущий индекс
+            self._templates_reloading = True
+            try:
+                token = self.templates.begin_load()
+                self.templates.load(await self._read(self._load_templates), token)
+            finally:
+                self._templates_reloading = False
+        return self.templates
+
+    async def get_template_catalogue(self, user_id: int) -> tuple:
+        """(ETag, шаблоны пользователя): общие и личные"""
+        return (await self._fresh_templates()).catalogue(user_id)
+
+    def _create_template(self, user_id, fields):
+        with self.pool.transaction() as conn:
+            return templates.insert(conn, user_id, fields)
+
+    async def create_template(self, user_id: int, fields: dict) -> dict:
+        """Личный шаблон (ValueError при неверных полях, DuplicateTemplate — имя занято)"""
+        if user_id == templates.GLOBAL_USER:
+            raise ValueError("Общие шаблоны задаются миграцией")
+        template = await self._write(self._create_template, user_id, templates.validate(fields))
+        self.templates.put(template)
+        return templates.public(template)
+
+    def _update_template(self, template_id, fields):
+        with self.pool.transaction() as conn:
+            return templates.update(conn, template_id, fields)
+
+    async def update_template(self, template_id: int, fields: dict) -> Optional[dict]:
+        """Изменить личный шаблон. None — нет такого (или он общий)"""
+        previous, template = await self._write(self._update_template, template_id,
+                                               templates.validate(fields, partial=True))
+        if template is None:
+            return None
+        self.templates.put(template, previous)
+        return templates.public(template)
+
+    def _delete_template(self, template_id):
+        with self.pool.transaction() as conn:
+            return templates.delete(conn, template_id)
+
+    async def delete_template(self, template_id: int) -> bool:
+        template = await self._write(self._delete_template, template_id)
+        if template is None:
+            return False
+        self.templates.remove(template)
+        return True
+
+    async def create_task_from_template(self, user_id: int, name: str, coalesce: bool = False) -> dict:
+        """Задача по шаблону: поиск в индексе и один INSERT. Неизвестное имя — задача с таким названием"""
+        template = (await self._fresh_templates()).get(user_id, name) or templates.fallback(name)
+        deadline = datetime.now() + timedelta(hours=template["deadline_hours"])
+        return await self.create_task(user_id, template["title"], f"Шаблон: {name}", template["priority"],
+                                      deadline, template["category"], coalesce)
+
+    # --- СИНХРОНИЗАЦИЯ ---
+
+    def _get_changes(self, user_id, since, limit):
+        return sync.changes(self.pool.connection(), user_id, since, limit)
+
+    async def get_changes(self, user_id: int, since: str = None, limit: int = None) -> dict:
+        """Задачи, изменённые после курсора since, и ID удалённых (см. echo/sync.py)"""
+        return await self._read(self._get_changes, user_id, since, clamp_limit(limit))
+
+    def _get_version(self, user_id):
+        return sync.version(self.pool.connection(), user_id)
+
+    async def get_version(self, user_id: int) -> str:
+        """Версия данных пользователя для ETag и ключей кэша: меняется при любой записи его задач.
+
+        Запоминается на VERSION_TTL секунд (см. echo/cache.py); запись этого
+        процесса сбрасывает её сразу вместе со списками пользователя.
+        """
+        version = self.cache.get(user_id, "version")
+        if version is None:
+            token = self.cache.begin_read()
+            version = await self._read(self._get_version, user_id)
+            self.cache.put(user_id, "version", version, token, ttl=VERSION_TTL)
+        return version
+
+    # --- НАПОМИНАНИЯ ---
+
+    def _get_due_window(self, until, limit):
+        return reminders.due_window(self.pool.connection(), until, limit)
+
+    async def get_due_window(self, until: float, limit: int) -> list:
+        """(id, epoch дедлайна) задач, ждущих напоминания, с дедлайном до until"""
+        return await self._read(self._get_due_window, until, limit)
+
+    def _claim_reminders(self, task_ids, now):
+        with self.pool.transaction() as conn:
+            return reminders.claim(conn, task_ids, now)
+
+    async def claim_reminders(self, task_ids: list, now: float) -> list:
+        """Отметить напоминание для наступивших задач и вернуть их (с chat_id)"""
+        return await self._write(self._claim_reminders, task_ids, now)
+
+    # --- АРХИВ ---
+
+    def _archive_completed(self, before, limit):
+        with self.pool.transaction() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            users = archive.archive_batch(conn, before, limit)
+        for user_id in set(users):
+            self.cache.invalidate_user(user_id)
+        return len(users)
+
+    async def archive_completed(self, before: str, limit: int) -> int:
+        """Перенести в tasks_archive до limit выполненных задач с updated_at < before"""
+        return await self._write(self._archive_completed, before, limit)
+
+    # --- СТАТИСТИКА ---
+
+    def _get_user_stats(self, user_id):
+        return stats.user_totals(self.pool.connection(), user_id)
+
+    async def get_user_stats(self, user_id: int) -> dict:
+        """Итоги пользователя: всего / активных / выполненных"""
+        return await self._read(self._get_user_stats, user_id)
+
+    def _get_stats_range(self, user_id, start, end):
+        return stats.day_range(self.pool.connection(), user_id, start, end)
+
+    async def get_stats_range(self, user_id: int, start: str, end: str) -> dict:
+        """Задачи, созданные за дни [start, end], и сколько из них выполнено"""
+        return await self._read(self._get_stats_range, user_id, start, end)
+
+    def _rebuild_stats(self):
+        with self.pool.transaction() as conn:
+            stats.rebuild(conn)
+        self.cache.clear()
+
+    async def rebuild_stats(self):
+        """Пересчитать счётчики статистики из tasks и tasks_archive"""
+        await self._write(self._rebuild_stats)
@@ -0,0 +1,196 @@
+"""
+Полнотекстовый поиск по задачам (SQLite FTS5)
+
+tasks_fts — contentless-индекс по title и description: сам текст хранится
+только в tasks, индекс синхронизируют триггеры (см. миграцию v7). В индекс
+попадает и user_id: условие на пользователя — ещё один терм запроса, так что
+FTS5 пересекает списки документов и не перебирает чужие совпадения.
+
+Русский текст: unicode61 приводит регистр, «ё» заменяется на «е» и в
+индексе, и в запросе. Каждое слово запроса ищется как префикс, длинные
+кириллические слова — без типичного окончания: «задачами» найдёт «задача»
+и «задачи». Ранжирование — bm25 (название весит больше описания).
+
+Задачи, перенесённые в tasks_archive (echo/archive.py), остаются в индексе:
+если совпадений в tasks меньше limit, выдача дополняется совпадениями из
+архива.
+
+    python -m echo.search --rebuild          # пересобрать индекс существующей базы
+    python -m echo.search --user 1 отчёт     # проверить поиск из консоли
+"""
+
+import argparse
+import re
+import time
+
+from echo.pagination import TASK_FIELDS, clamp_limit
+
+MAX_TERMS = 8
+MIN_STEM = 4
+
+# bm25 по колонкам (user_id, title, description)
+RANK = "bm25(0.0, 10.0, 1.0)"
+
+_WORD = re.compile(r"\w+")
+_CYRILLIC = re.compile(r"[а-я]")
+# Окончания, длинные первыми: срезается одно, если основа не короче MIN_STEM
+_ENDING = re.compile(r"(иями|ями|ами|ого|его|ому|ему|ыми|ими|ой|ей|ий|ый|ая|яя|ое|ее|ые|ие|ов|ев|ам|ям"
+                     r"|ах|ях|ом|ем|а|я|о|е|ы|и|у|ю|ь|й)$")
+
+
+def fold_sql(expr: str) -> str:
+    """SQL-выражение: expr с «ё» -> «е» (то же, что fold() для запроса)"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def fold(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _stem(word: str) -> str:
+    if not _CYRILLIC.search(word):
+        return word
+    match = _ENDING.search(word)
+    if match and match.start() >= MIN_STEM:
+        return word[:match.start()]
+    return word
+
+
+def build_query(text: str, user_id: int) -> str:
+    """Строка поиска -> выражение MATCH для tasks_fts"""
+    words = _WORD.findall(fold(text or ""))[:MAX_TERMS]
+    if not words:
+        raise ValueError("Пустой поисковый запрос")
+    # Слова в кавычках: операторы FTS5 (AND, NEAR, *) из ввода не интерпретируются
+    terms = " ".join(f'"{_stem(word)}"*' for word in words)
+    return f'user_id:"{int(user_id)}" AND {{title description}}:({terms})'
+
+
+# --- SQL ---
+
+INDEX_TASK = f'''INSERT INTO tasks_fts (rowid, user_id, title, description)
+    VALUES (new.id, new.user_id, {fold_sql("new.title")}, {fold_sql("new.description")})'''
+UNINDEX_TASK = f'''INSERT INTO tasks_fts (tasks_fts, rowid, user_id, title, description)
+    VALUES ('delete', old.id, old.user_id, {fold_sql("old.title")}, {fold_sql("old.description")})'''
+
+TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        {INDEX_TASK};
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        {UNINDEX_TASK};
+    END''',
+    # Смена статуса, дедлайна и updated_at индекс не трогает
+    f'''CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF user_id, title, description ON tasks
+        WHEN old.user_id IS NOT new.user_id OR old.title IS NOT new.title
+          OR old.description IS NOT new.description
+    BEGIN
+        {UNINDEX_TASK};
+        {INDEX_TASK};
+    END''',
+)
+
+# Архивация копирует задачу в tasks_archive и удаляет её из tasks — такая задача
+# остаётся в индексе. Миграция v9 заменяет этим триггером tasks_fts_delete из TRIGGERS
+ARCHIVE_DELETE_TRIGGER = f'''CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks
+    WHEN NOT EXISTS (SELECT 1 FROM tasks_archive WHERE id = old.id)
+BEGIN
+    {UNINDEX_TASK};
+END'''
+
+
+def create_index(conn):
+    """Таблица tasks_fts и триггеры (внутри транзакции вызывающего)"""
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        user_id, title, description,
+        content = '', tokenize = 'unicode61', prefix = '2 3')''')
+    conn.execute(f"INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('rank', '{RANK}')")
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+
+
+def rebuild(conn, tables=("tasks", "tasks_archive")) -> int:
+    """Переиндексировать все задачи (внутри транзакции вызывающего). Возвращает число задач"""
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('delete-all')")
+    count = 0
+    for table in tables:
+        cur = conn.execute(f'''INSERT INTO tasks_fts (rowid, user_id, title, description)
+            SELECT id, user_id, {fold_sql("title")}, {fold_sql("description")} FROM {table}''')
+        count += cur.rowcount
+    return count
+
+
+def optimize(conn):
+    """Слить сегменты индекса в один (после массовой загрузки)"""
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
+
+
+def search(conn, user_id: int, text: str, status: str = None, category: str = None,
+           min_priority: int = None, limit: int = None, archived: bool = True) -> list:
+    """Задачи пользователя по запросу text, самые релевантные первыми.
+
+    archived=True — если в tasks нашлось меньше limit, добрать из архива
+    (там только выполненные задачи).
+    """
+    match = build_query(text, user_id)
+    limit = clamp_limit(limit)
+    tasks = _search(conn, "tasks", match, status, category, min_priority, limit)
+    if archived and len(tasks) < limit and status in (None, "completed"):
+        tasks += _search(conn, "tasks_archive", match, status, category, min_priority, limit - len(tasks))
+    return tasks
+
+
+def _search(conn, table, match, status, category, min_priority, limit) -> list:
+    query = f'''SELECT {', '.join('t.' + name for name in TASK_FIELDS)}
+        FROM tasks_fts JOIN {table} t ON t.id = tasks_fts.rowid
+        WHERE tasks_fts MATCH ?'''
+    params = [match]
+
+    if status:
+        query += " AND t.status = ?"
+        params.append(status)
+    if category:
+        query += " AND t.category = ?"
+        params.append(category)
+    if min_priority is not None:
+        query += " AND t.priority >= ?"
+        params.append(min_priority)
+
+    query += " ORDER BY rank LIMIT ?"
+    params.append(limit)
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
+def main():
+    from echo.db import ConnectionPool, DB_PATH
+    from echo.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Полнотекстовый индекс задач Echo")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу SQLite")
+    parser.add_argument("--rebuild", action="store_true", help="пересобрать индекс из tasks и tasks_archive")
+    parser.add_argument("--user", type=int, help="пользователь для пробного поиска")
+    parser.add_argument("query", nargs="*", help="пробный поисковый запрос")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db)
+    migrate(pool.connection())
+
+    if args.rebuild:
+        started = time.perf_counter()
+        with pool.transaction() as conn:
+            count = rebuild(conn)
+            optimize(conn)
+        print(f"Проиндексировано задач: {count} за {time.perf_counter() - started:.2f} с")
+
+    if args.query:
+        if args.user is None:
+            parser.error("для поиска нужен --user")
+        started = time.perf_counter()
+        tasks = search(pool.connection(), args.user, " ".join(args.query))
+        print(f"Найдено: {len(tasks)} за {(time.perf_counter() - started) * 1000:.1f} мс")
+        for task in tasks:
+            print(f"  #{task['id']} [{task['status']}] {task['title']}")
+
+
+if __name__ == "__main__":
+    main()
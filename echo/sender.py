@@ -0,0 +1,344 @@
+"""
+Исходящие сообщения бота
+
+Обработчики не ждут Telegram: ответы кладутся в очередь, а отдельный
+диспетчер отправляет их с учётом лимитов Bot API.
+
+- Глобальный token bucket (~30 сообщений/с на бота) и свой bucket на
+  каждый чат (~1 сообщение/с с небольшим запасом).
+- Сообщения одного чата уходят строго по очереди, не больше одного
+  запроса на чат одновременно.
+- 429 с retry_after: сообщение возвращается в начало очереди чата, чат
+  ставится на паузу на указанное время.
+- Несколько подряд идущих правок одного сообщения, ещё не отправленных,
+  схлопываются в одну — уходит только последнее состояние.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = float(os.getenv("ECHO_SEND_GLOBAL_RATE", "30"))
+GLOBAL_BURST = float(os.getenv("ECHO_SEND_GLOBAL_BURST", "30"))
+CHAT_RATE = float(os.getenv("ECHO_SEND_CHAT_RATE", "1"))
+CHAT_BURST = float(os.getenv("ECHO_SEND_CHAT_BURST", "3"))
+CONCURRENCY = int(os.getenv("ECHO_SEND_CONCURRENCY", "16"))
+MAX_RETRIES = int(os.getenv("ECHO_SEND_MAX_RETRIES", "5"))
+
+# Сколько bucket-ов простаивающих чатов держать в памяти
+MAX_IDLE_CHATS = 10000
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst в запасе"""
+
+    def __init__(self, rate: float, burst: float, now: float = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже есть)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> bool:
+        """Забрать токен, если он есть"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def drain(self, now: float):
+        """Обнулить запас (после 429 от Telegram)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Job:
+    """Один вызов Bot API и все, кто ждёт его результата"""
+
+    __slots__ = ("method", "kwargs", "futures", "queued_at", "attempts")
+
+    def __init__(self, method: str, kwargs: dict, future, queued_at: float):
+        self.method = method
+        self.kwargs = kwargs
+        self.futures = [future]
+        self.queued_at = queued_at
+        self.attempts = 0
+
+    def edits(self, message_id) -> bool:
+        return self.method == "edit_message_text" and self.kwargs.get("message_id") == message_id
+
+
+def _retrieve(future):
+    # Ошибка уже залогирована отправителем; забираем её, чтобы asyncio не ругался
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundSender:
+    """Очередь исходящих вызовов Bot API с лимитами по чатам и на весь бот"""
+
+    def __init__(self, bot, global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST,
+                 concurrency: int = CONCURRENCY, max_retries: int = MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+
+        self._loop = None
+        self._wakeup = None
+        self._slots = None
+        self._dispatcher = None
+        self._sending = set()         # задачи отправки в полёте
+
+        self._chats = {}              # chat_id -> deque[_Job]
+        self._buckets = {}            # chat_id -> TokenBucket
+        self._paused = {}             # chat_id -> loop.time() окончания паузы
+        self._ready = []              # куча (готов_к, seq, chat_id)
+        self._scheduled = set()       # чаты в _ready
+        self._in_flight = set()       # чаты с запросом в полёте
+        self._seq = 0
+        self._depth = 0
+
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.merged = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Сколько вызовов ждут отправки"""
+        return self._depth
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+
+    async def start(self):
+        """Запустить диспетчер в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._global = TokenBucket(self._global.rate, self._global.burst, self._loop.time())
+        self._dispatcher = self._loop.create_task(self._dispatch())
+        logger.info(f"Очередь отправки запущена: {self._global.rate:g}/с на бота, {self.chat_rate:g}/с на чат")
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Дождаться отправки очереди (не дольше drain_timeout) и остановить диспетчер"""
+        if self._dispatcher is None:
+            return
+        deadline = self._loop.time() + drain_timeout
+        while (self._depth or self._sending) and self._loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        self._dispatcher.cancel()
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._sending, return_exceptions=True)
+        self._dispatcher = None
+
+        for pending in self._chats.values():
+            for job in pending:
+                for future in job.futures:
+                    future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+        self._scheduled.clear()
+        self._in_flight.clear()
+        self._depth = 0
+
+    # --- ПОСТАНОВКА В ОЧЕРЕДЬ ---
+
+    def send_message(self, chat_id, text: str, **kwargs) -> asyncio.Future:
+        """Поставить send_message в очередь; результат (Message) — в возвращаемом future"""
+        return self.enqueue("send_message", chat_id, text=text, **kwargs)
+
+    def edit_message_text(self, chat_id, message_id, text: str, **kwargs) -> asyncio.Future:
+        """Поставить правку в очередь; неотправленная правка того же сообщения заменяется"""
+        return self.enqueue("edit_message_text", chat_id, message_id=message_id, text=text, **kwargs)
+
+    def enqueue(self, method: str, chat_id, **kwargs) -> asyncio.Future:
+        """Поставить произвольный метод бота с chat_id в очередь чата"""
+        if self._loop is None:
+            raise RuntimeError("OutboundSender не запущен")
+
+        future = self._loop.create_future()
+        future.add_done_callback(_retrieve)
+        kwargs["chat_id"] = chat_id
+        self.queued += 1
+
+        pending = self._chats.setdefault(chat_id, deque())
+        if method == "edit_message_text" and pending and pending[-1].edits(kwargs.get("message_id")):
+            # Предыдущая правка ещё не ушла: отправим сразу итоговое состояние
+            pending[-1].kwargs = kwargs
+            pending[-1].futures.append(future)
+            self.merged += 1
+            return future
+
+        pending.append(_Job(method, kwargs, future, self._loop.time()))
+        self._depth += 1
+        self._schedule(chat_id)
+        return future
+
+    def _schedule(self, chat_id, at: float = None):
+        if chat_id in self._scheduled or chat_id in self._in_flight:
+            return
+        at = max(at or self._loop.time(), self._paused.get(chat_id, 0.0))
+        self._seq += 1
+        heapq.heappush(self._ready, (at, self._seq, chat_id))
+        self._scheduled.add(chat_id)
+        self._wakeup.set()
+
+    # --- ДИСПЕТЧЕР ---
+
+    async def _wait(self, timeout: float = None):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _dispatch(self):
+        while True:
+            if not self._ready:
+                await self._wait()
+                continue
+
+            now = self._loop.time()
+            at, _, chat_id = self._ready[0]
+            if at > now:
+                await self._wait(at - now)
+                continue
+
+            delay = self._global.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(self._ready)
+            self._scheduled.discard(chat_id)
+
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            delay = bucket.delay(now)
+            if delay:
+                self._schedule(chat_id, now + delay)
+                continue
+
+            # Чат занят уже на время ожидания слота: иначе новое сообщение этого
+            # чата снова попадёт в _ready и уйдёт параллельно с текущим
+            self._in_flight.add(chat_id)
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                self._in_flight.discard(chat_id)
+                raise
+            now = self._loop.time()
+            self._global.take(now)
+            bucket.take(now)
+
+            job = self._chats[chat_id].popleft()
+            task = self._loop.create_task(self._send(chat_id, job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, chat_id, job: _Job):
+        job.attempts += 1
+        try:
+            result = await getattr(self.bot, job.method)(**job.kwargs)
+        except asyncio.CancelledError:
+            self._fail(job, None)
+            raise
+        except RetryAfter as e:
+            if job.attempts > self.max_retries:
+                self._fail(job, e)
+            else:
+                # Telegram просит подождать: задача возвращается в начало очереди чата
+                now = self._loop.time()
+                self.retried += 1
+                self._paused[chat_id] = now + float(e.retry_after)
+                self._global.drain(now)
+                self._chats[chat_id].appendleft(job)
+                logger.warning(f"429 для чата {chat_id}: повтор через {e.retry_after} с")
+        except Exception as e:
+            logger.error(f"Ошибка отправки {job.method} в чат {chat_id}: {e}")
+            self._fail(job, e)
+        else:
+            self._done(job)
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+            self._in_flight.discard(chat_id)
+            if self._chats.get(chat_id):
+                self._schedule(chat_id)
+            else:
+                self._chats.pop(chat_id, None)
+                self._paused.pop(chat_id, None)
+                if len(self._buckets) > MAX_IDLE_CHATS:
+                    self._prune_buckets()
+
+    def _done(self, job: _Job):
+        latency = self._loop.time() - job.queued_at
+        self._depth -= 1
+        self.sent += 1
+        self.latency_seconds_total += latency
+        self.latency_seconds_max = max(self.latency_seconds_max, latency)
+
+    def _fail(self, job: _Job, error):
+        self._depth -= 1
+        self.failed += 1
+        for future in job.futures:
+            if not future.done():
+                if error is None:
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+
+    def _prune_buckets(self):
+        # Полный bucket ничем не отличается от нового — такие можно забыть
+        now = self._loop.time()
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._chats and b.full(now)]:
+            del self._buckets[chat_id]
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._depth,
+            "chats_waiting": len(self._chats),
+            "in_flight": len(self._in_flight),
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "merged": self.merged,
+            "avg_latency_ms": round(self.latency_seconds_total / self.sent * 1000, 3) if self.sent else 0.0,
+            "max_latency_ms": round(self.latency_seconds_max * 1000, 3),
+        }
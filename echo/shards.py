@@ -0,0 +1,364 @@
+"""
+Шардирование базы по user_id
+
+Один файл SQLite — один писатель: все записи всех пользователей ждут одну
+блокировку. При ECHO_SHARDS > 1 пользователи раскладываются по N файлам
+(стабильный хэш user_id), у каждого шарда свой TaskRepository — своё
+соединение на поток, свой поток-писатель и свой group commit, так что
+записи разных шардов идут параллельно.
+
+ShardedRepository повторяет интерфейс TaskRepository. Методы с user_id идут
+в шард пользователя. Методы с ID задачи или шаблона находят шард по самому
+ID: каждый шард выдаёт ID из своего диапазона [(k + 1) << ID_BITS, ...).
+ID, выданные до шардирования (меньше 1 << ID_BITS), сохраняются при
+переносе — их шард находится поиском по первичному ключу во всех шардах.
+Напоминания читаются из всех шардов и сливаются по времени.
+
+Перенос существующей базы (офлайн, приложения остановлены):
+    python -m echo.shards --shards 4                    # ~/echo-bot.db -> echo-bot.shard{0..3}of4.db
+    ECHO_SHARDS=4 python bot.py
+
+Число шардов входит в имя файлов: смена ECHO_SHARDS не подхватит чужую
+раскладку. Перераспределение между шардами (N -> M) не поддерживается —
+только перенос из одного файла.
+"""
+
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from echo import search, stats
+from echo.db import ConnectionPool, DB_PATH
+from echo.migrations import migrate
+from echo.repository import READER_THREADS, TaskRepository
+
+logger = logging.getLogger(__name__)
+
+SHARDS = int(os.getenv("ECHO_SHARDS", "1"))
+# Сколько найденных старых ID помнить (строка между шардами не переезжает)
+LEGACY_CACHE = int(os.getenv("ECHO_SHARDS_LEGACY_CACHE", "100000"))
+PROBE_THREADS = 2
+
+# ID задач и шаблонов шарда k: от (k + 1) << ID_BITS (2^40 — триллион строк на шард,
+# и ID остаётся точным числом в JavaScript)
+ID_BITS = 40
+ID_TABLES = ("tasks", "templates")
+
+# Таблицы, переносимые в шард владельца строки, и доп. условие
+# (общие шаблоны с user_id = 0 засевает миграция самого шарда)
+COPY_TABLES = (
+    ("users", ""),
+    ("tasks", ""),
+    ("tasks_archive", ""),
+    ("task_deletions", ""),
+    ("templates", "AND user_id != 0"),
+)
+
+
+def shard_of(user_id: int, count: int) -> int:
+    """Номер шарда пользователя: crc32 не зависит от процесса и версии Python"""
+    if user_id is None:
+        return 0                          # задачи без владельца из старых баз
+    return zlib.crc32(str(int(user_id)).encode()) % count
+
+
+def id_base(index: int) -> int:
+    return (index + 1) << ID_BITS
+
+
+def shard_of_id(row_id: int, count: int) -> Optional[int]:
+    """Шард по ID задачи или шаблона. None — ID выдан до шардирования"""
+    index = (int(row_id) >> ID_BITS) - 1
+    return index if 0 <= index < count else None
+
+
+def shard_paths(base, count: int) -> list:
+    """Файлы шардов рядом с base: echo-bot.db -> echo-bot.shard0of4.db, ..."""
+    base = Path(base)
+    return [base.with_name(f"{base.stem}.shard{index}of{count}{base.suffix}") for index in range(count)]
+
+
+def reserve_ids(conn, index: int):
+    """Новые ID шарда — из его диапазона (внутри транзакции вызывающего)"""
+    floor = id_base(index)
+    for table in ID_TABLES:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, floor))
+        elif row[0] < floor:
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (floor, table))
+
+
+class ShardedRepository:
+    """TaskRepository поверх N файлов SQLite с маршрутизацией по user_id"""
+
+    def __init__(self, pools: list, readers: int = None, **kwargs):
+        # Потоков-читателей на шард меньше: суммарно их не должно быть в N раз больше
+        readers = readers or max(2, READER_THREADS // len(pools))
+        self.shards = [TaskRepository(pool, readers=readers, **kwargs) for pool in pools]
+        self._legacy = OrderedDict()      # (таблица, старый ID) -> шард
+        self._probe = None
+        self.legacy_lookups = 0
+
+    def _user(self, user_id: int) -> TaskRepository:
+        return self.shards[shard_of(user_id, len(self.shards))]
+
+    async def _owner(self, table: str, row_id: int) -> Optional[TaskRepository]:
+        """Шард строки по ID; старые ID ищутся во всех шардах сразу"""
+        index = shard_of_id(row_id, len(self.shards))
+        if index is not None:
+            return self.shards[index]
+        key = (table, row_id)
+        shard = self._legacy.get(key)
+        if shard is not None:
+            self._legacy.move_to_end(key)
+            return shard
+        self.legacy_lookups += 1
+        if self._probe is None:
+            self._probe = ThreadPoolExecutor(max_workers=PROBE_THREADS, thread_name_prefix="echo-shard-probe")
+        # Один переход в поток и N поисков по первичному ключу подряд дешевле N параллельных чтений
+        index = await asyncio.get_running_loop().run_in_executor(self._probe, self._find, table, row_id)
+        shard = self.shards[index] if index is not None else None
+        if shard is not None:
+            self._legacy[key] = shard
+            if len(self._legacy) > LEGACY_CACHE:
+                self._legacy.popitem(last=False)
+        return shard
+
+    def _find(self, table, row_id):
+        for index, shard in enumerate(self.shards):
+            if shard.pool.connection().execute(f"SELECT 1 FROM {table} WHERE id = ?", (row_id,)).fetchone():
+                return index
+        return None
+
+    def init_db(self):
+        for index, shard in enumerate(self.shards):
+            shard.init_db()
+            with shard.pool.transaction() as conn:
+                reserve_ids(conn, index)
+        logger.info(f"Шардов: {len(self.shards)} ({self.shards[0].pool.path.name}, ...)")
+
+    async def drain(self):
+        for shard in self.shards:
+            await shard.drain()
+
+    def close(self):
+        if self._probe is not None:
+            self._probe.shutdown(wait=True)
+            self._probe = None
+        for shard in self.shards:
+            shard.close()
+
+    def stats(self) -> dict:
+        """Счётчики по шардам: {раздел: [шард 0, шард 1, ...]}"""
+        per_shard = [shard.stats() for shard in self.shards]
+        result = {section: [item[section] for item in per_shard] for section in per_shard[0]}
+        result["shards"] = {"count": len(self.shards), "legacy_cached": len(self._legacy),
+                            "legacy_lookups": self.legacy_lookups}
+        return result
+
+    def add_listener(self, listener):
+        for shard in self.shards:
+            shard.add_listener(listener)
+
+    def remove_listener(self, listener):
+        for shard in self.shards:
+            shard.remove_listener(listener)
+
+    # --- ПОЛЬЗОВАТЕЛИ ---
+
+    async def upsert_user(self, user_id: int, *args, **kwargs) -> bool:
+        return await self._user(user_id).upsert_user(user_id, *args, **kwargs)
+
+    async def create_user(self, user_id: int, *args, **kwargs) -> bool:
+        return await self._user(user_id).create_user(user_id, *args, **kwargs)
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        return await self._user(user_id).get_user(user_id)
+
+    # --- ЗАДАЧИ ---
+
+    async def create_task(self, user_id: int, *args, **kwargs) -> dict:
+        return await self._user(user_id).create_task(user_id, *args, **kwargs)
+
+    async def get_tasks(self, user_id: int, *args, **kwargs) -> list:
+        return await self._user(user_id).get_tasks(user_id, *args, **kwargs)
+
+    async def get_list_view(self, user_id: int, *args, **kwargs) -> dict:
+        return await self._user(user_id).get_list_view(user_id, *args, **kwargs)
+
+    async def get_tasks_page(self, user_id: int, *args, **kwargs) -> dict:
+        return await self._user(user_id).get_tasks_page(user_id, *args, **kwargs)
+
+    async def update_task(self, task_id: int, *args, **kwargs) -> bool:
+        shard = await self._owner("tasks", task_id)
+        return await shard.update_task(task_id, *args, **kwargs) if shard else False
+
+    async def complete_task(self, task_id: int, *args, **kwargs) -> bool:
+        shard = await self._owner("tasks", task_id)
+        return await shard.complete_task(task_id, *args, **kwargs) if shard else False
+
+    async def delete_task(self, task_id: int) -> bool:
+        shard = await self._owner("tasks", task_id)
+        return await shard.delete_task(task_id) if shard else False
+
+    async def apply_batch(self, user_id: int, *args, **kwargs) -> list:
+        # Пакет относится к задачам одного пользователя — они в его шарде
+        return await self._user(user_id).apply_batch(user_id, *args, **kwargs)
+
+    async def search_tasks(self, user_id: int, *args, **kwargs) -> list:
+        return await self._user(user_id).search_tasks(user_id, *args, **kwargs)
+
+    # --- ШАБЛОНЫ ---
+
+    async def get_template_catalogue(self, user_id: int) -> tuple:
+        return await self._user(user_id).get_template_catalogue(user_id)
+
+    async def create_template(self, user_id: int, fields: dict) -> dict:
+        return await self._user(user_id).create_template(user_id, fields)
+
+    async def update_template(self, template_id: int, fields: dict) -> Optional[dict]:
+        shard = await self._owner("templates", template_id)
+        return await shard.update_template(template_id, fields) if shard else None
+
+    async def delete_template(self, template_id: int) -> bool:
+        shard = await self._owner("templates", template_id)
+        return await shard.delete_template(template_id) if shard else False
+
+    async def create_task_from_template(self, user_id: int, *args, **kwargs) -> dict:
+        return await self._user(user_id).create_task_from_template(user_id, *args, **kwargs)
+
+    # --- СИНХРОНИЗАЦИЯ ---
+
+    async def get_changes(self, user_id: int, *args, **kwargs) -> dict:
+        return await self._user(user_id).get_changes(user_id, *args, **kwargs)
+
+    async def get_version(self, user_id: int) -> str:
+        return await self._user(user_id).get_version(user_id)
+
+    # --- НАПОМИНАНИЯ ---
+
+    async def get_due_window(self, until: float, limit: int) -> list:
+        """Окна всех шардов, слитые по времени дедлайна"""
+        windows = await asyncio.gather(*(shard.get_due_window(until, limit) for shard in self.shards))
+        return list(heapq.merge(*windows, key=lambda item: item[1]))[:limit]
+
+    async def claim_reminders(self, task_ids: list, now: float) -> list:
+        by_shard = {}
+        for task_id in task_ids:
+            index = shard_of_id(task_id, len(self.shards))
+            # Старый ID: claim в чужом шарде просто не найдёт задачу
+            for shard in ([self.shards[index]] if index is not None else self.shards):
+                by_shard.setdefault(shard, []).append(task_id)
+        claimed = await asyncio.gather(*(shard.claim_reminders(ids, now) for shard, ids in by_shard.items()))
+        return [task for tasks in claimed for task in tasks]
+
+    # --- АРХИВ ---
+
+    async def archive_completed(self, before: str, limit: int) -> int:
+        """Пачка с каждого шарда; возвращает сумму"""
+        counts = await asyncio.gather(*(shard.archive_completed(before, limit) for shard in self.shards))
+        return sum(counts)
+
+    # --- СТАТИСТИКА ---
+
+    async def get_user_stats(self, user_id: int) -> dict:
+        return await self._user(user_id).get_user_stats(user_id)
+
+    async def get_stats_range(self, user_id: int, *args) -> dict:
+        return await self._user(user_id).get_stats_range(user_id, *args)
+
+    async def rebuild_stats(self):
+        await asyncio.gather(*(shard.rebuild_stats() for shard in self.shards))
+
+
+def open_repository(path=DB_PATH, shards: int = SHARDS, **kwargs):
+    """Репозиторий приложения: один файл или ShardedRepository при shards > 1"""
+    if shards <= 1:
+        return TaskRepository(ConnectionPool(path), **kwargs)
+    return ShardedRepository([ConnectionPool(shard) for shard in shard_paths(path, shards)], **kwargs)
+
+
+# --- ПЕРЕНОС ---
+
+def _columns(conn, table: str) -> str:
+    return ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+
+
+def _count_tasks(conn) -> int:
+    """Задачи в tasks и в архиве"""
+    return conn.execute("SELECT (SELECT COUNT(*) FROM tasks) + (SELECT COUNT(*) FROM tasks_archive)").fetchone()[0]
+
+
+def rebalance(source, count: int, targets: list = None) -> dict:
+    """Разложить базу source по count новым файлам шардов. Возвращает {файл: число задач}"""
+    source = Path(source)
+    targets = [Path(target) for target in (targets or shard_paths(source, count))]
+    existing = [str(target) for target in targets if target.exists()]
+    if existing:
+        raise FileExistsError(f"Файлы шардов уже существуют: {', '.join(existing)}")
+
+    source_pool = ConnectionPool(source)
+    source_conn = source_pool.connection()
+    migrate(source_conn)
+    for table in ID_TABLES + ("tasks_archive",):
+        top = source_conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        if top is not None and top >= 1 << ID_BITS:
+            raise ValueError(f"{source}: в {table} уже есть ID шардов — переносить можно только несшардированную базу")
+    total = _count_tasks(source_conn)
+    source_pool.close_all()
+
+    result = {}
+    for index, target in enumerate(targets):
+        pool = ConnectionPool(target)
+        conn = pool.connection()
+        migrate(conn)
+        conn.create_function("echo_shard", 1, lambda user_id: shard_of(user_id, count), deterministic=True)
+        conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+        try:
+            with conn:
+                for table, condition in COPY_TABLES:
+                    columns = _columns(conn, table)
+                    conn.execute(f'''INSERT INTO main.{table} ({columns})
+                        SELECT {columns} FROM src.{table} WHERE echo_shard(user_id) = ? {condition}''', (index,))
+                stats.rebuild(conn)
+                # Триггер проиндексировал только tasks: архив тоже должен искаться
+                search.rebuild(conn)
+                reserve_ids(conn, index)
+        finally:
+            conn.execute("DETACH DATABASE src")
+        result[str(target)] = _count_tasks(conn)
+        pool.close_all()
+
+    moved = sum(result.values())
+    if moved != total:
+        raise RuntimeError(f"Перенесено {moved} задач из {total}: проверьте user_id без владельца")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос базы Echo в шарды по user_id")
+    parser.add_argument("--db", default=str(DB_PATH), help="исходный файл SQLite")
+    parser.add_argument("--shards", type=int, default=SHARDS, help="число шардов (ECHO_SHARDS)")
+    args = parser.parse_args()
+    if args.shards < 2:
+        parser.error("нужно --shards 2 или больше")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    started = time.perf_counter()
+    result = rebalance(args.db, args.shards)
+    for path, tasks in result.items():
+        print(f"  {path}: {tasks} задач")
+    print(f"Перенесено за {time.perf_counter() - started:.1f} с. Запуск: ECHO_SHARDS={args.shards}")
+
+
+if __name__ == "__main__":
+    main()
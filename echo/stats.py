@@ -0,0 +1,177 @@
+"""
+Счётчики статистики
+
+task_stats_daily — по (user_id, день создания): сколько задач создано в этот
+день и сколько из них выполнено. task_stats_user — итоги по пользователю.
+Счётчики обновляются в той же транзакции, что и сама задача, поэтому
+/stats читает одну строку вместо обхода tasks.
+
+Перенос выполненных задач в архив (echo/archive.py) счётчики не меняет —
+архивные задачи учитываются по-прежнему.
+
+Пересчёт из таблиц tasks и tasks_archive:
+    python -m echo.stats --rebuild
+"""
+
+import argparse
+import sqlite3
+from datetime import date, timedelta
+
+
+def day_of(ts) -> str:
+    """День (YYYY-MM-DD) из хранимого timestamp"""
+    return str(ts)[:10] if ts else date.today().isoformat()
+
+
+UPSERT_DAILY = '''INSERT INTO task_stats_daily (user_id, day, created, completed)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        created = created + excluded.created,
+        completed = completed + excluded.completed'''
+
+UPSERT_USER = '''INSERT INTO task_stats_user (user_id, total, active, completed)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        total = total + excluded.total,
+        active = active + excluded.active,
+        completed = completed + excluded.completed'''
+
+
+def bump(conn: sqlite3.Connection, user_id: int, created_at, status: str, sign: int):
+    """Учесть (+1) или исключить (-1) задачу со статусом status"""
+    completed = sign if status == "completed" else 0
+    active = sign if status == "active" else 0
+
+    conn.execute(UPSERT_DAILY, (user_id, day_of(created_at), sign, completed))
+    conn.execute(UPSERT_USER, (user_id, sign, active, completed))
+
+
+def on_created(conn, user_id, created_at, status="active"):
+    bump(conn, user_id, created_at, status, +1)
+
+
+def on_status_changed(conn, user_id, created_at, old_status, new_status):
+    if old_status != new_status:
+        bump(conn, user_id, created_at, old_status, -1)
+        bump(conn, user_id, created_at, new_status, +1)
+
+
+def on_deleted(conn, user_id, created_at, status):
+    bump(conn, user_id, created_at, status, -1)
+
+
+class StatsDelta:
+    """Накопитель изменений счётчиков для пакетных операций.
+
+    Изменения суммируются в памяти и записываются двумя executemany в flush().
+    """
+
+    def __init__(self):
+        self.daily = {}     # (user_id, day) -> [created, completed]
+        self.users = {}     # user_id -> [total, active, completed]
+
+    def bump(self, user_id, created_at, status, sign):
+        daily = self.daily.setdefault((user_id, day_of(created_at)), [0, 0])
+        totals = self.users.setdefault(user_id, [0, 0, 0])
+        daily[0] += sign
+        totals[0] += sign
+        if status == "completed":
+            daily[1] += sign
+            totals[2] += sign
+        elif status == "active":
+            totals[1] += sign
+
+    def on_created(self, user_id, created_at, status="active"):
+        self.bump(user_id, created_at, status, +1)
+
+    def on_status_changed(self, user_id, created_at, old_status, new_status):
+        if old_status != new_status:
+            self.bump(user_id, created_at, old_status, -1)
+            self.bump(user_id, created_at, new_status, +1)
+
+    def on_deleted(self, user_id, created_at, status):
+        self.bump(user_id, created_at, status, -1)
+
+    def flush(self, conn: sqlite3.Connection):
+        conn.executemany(UPSERT_DAILY, [(user_id, day, d[0], d[1])
+                                        for (user_id, day), d in self.daily.items() if any(d)])
+        conn.executemany(UPSERT_USER, [(user_id, t[0], t[1], t[2])
+                                       for user_id, t in self.users.items() if any(t)])
+        self.daily.clear()
+        self.users.clear()
+
+
+def rebuild(conn: sqlite3.Connection, archive: bool = True):
+    """Пересчитать все счётчики из tasks и tasks_archive (внутри транзакции вызывающего).
+
+    archive=False — только из tasks (для миграций до появления архива).
+    """
+    source = "tasks"
+    if archive:
+        source = '''(SELECT user_id, status, created_at FROM tasks
+            UNION ALL SELECT user_id, status, created_at FROM tasks_archive)'''
+    conn.execute("DELETE FROM task_stats_daily")
+    conn.execute("DELETE FROM task_stats_user")
+    conn.execute(f'''INSERT INTO task_stats_daily (user_id, day, created, completed)
+        SELECT user_id, substr(created_at, 1, 10), COUNT(*),
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+        FROM {source}
+        WHERE created_at IS NOT NULL
+        GROUP BY user_id, substr(created_at, 1, 10)''')
+    conn.execute(f'''INSERT INTO task_stats_user (user_id, total, active, completed)
+        SELECT user_id, COUNT(*),
+               SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+        FROM {source}
+        GROUP BY user_id''')
+
+
+# --- ЧТЕНИЕ ---
+
+def user_totals(conn: sqlite3.Connection, user_id: int) -> dict:
+    """Итоги пользователя: одна строка по первичному ключу"""
+    row = conn.execute("SELECT total, active, completed FROM task_stats_user WHERE user_id = ?",
+                       (user_id,)).fetchone()
+    if not row:
+        return {"total": 0, "active": 0, "completed": 0}
+    return {"total": row[0], "active": row[1], "completed": row[2]}
+
+
+def day_range(conn: sqlite3.Connection, user_id: int, start: str, end: str) -> dict:
+    """Сумма и разбивка по дням за [start, end] по счётчикам (без обхода tasks)"""
+    rows = conn.execute('''SELECT day, created, completed FROM task_stats_daily
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        ORDER BY day''', (user_id, start, end)).fetchall()
+    return {
+        "total": sum(r[1] for r in rows),
+        "completed": sum(r[2] for r in rows),
+        "days": [{"date": r[0], "total": r[1], "completed": r[2]} for r in rows if r[1]],
+    }
+
+
+def last_days(days: int, today: date = None) -> tuple:
+    """(start, end) для последних N дней, включая сегодня"""
+    today = today or date.today()
+    return (today - timedelta(days=max(days, 1) - 1)).isoformat(), today.isoformat()
+
+
+def main():
+    from echo.db import ConnectionPool, DB_PATH
+    from echo.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Счётчики статистики Echo")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу SQLite")
+    parser.add_argument("--rebuild", action="store_true", help="пересчитать счётчики из tasks и tasks_archive")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db)
+    migrate(pool.connection())
+
+    if args.rebuild:
+        with pool.transaction() as conn:
+            rebuild(conn)
+        print("Счётчики пересчитаны")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""
+Распознавание голосовых сообщений
+
+voice_handler только ставит задание в очередь. Задание проходит: кэш по
+file_unique_id -> getFile -> потоковая загрузка во временный каталог с общим
+лимитом -> распознавание в ProcessPoolExecutor (OGG/Opus декодируется
+ffmpeg в PCM 16 кГц, затем локальный движок) -> on_result. Event loop только
+ждёт: загрузка идёт через aiohttp, запись на диск — в потоке, декодирование
+и распознавание — в отдельных процессах.
+
+Движки (ECHO_STT_ENGINE):
+- vosk — офлайн-распознавание на CPU (pip install vosk, ffmpeg в PATH,
+  модель в ECHO_STT_MODEL, например vosk-model-small-ru)
+- stub — детерминированная заглушка для проверок и нагрузочных прогонов:
+  файл, начинающийся с «STUB:», распознаётся как текст после префикса
+- auto (по умолчанию) — vosk, если он установлен и модель на месте, иначе
+  распознавание выключено
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+ENGINE = os.getenv("ECHO_STT_ENGINE", "auto")
+MODEL_PATH = os.getenv("ECHO_STT_MODEL", "models/vosk-model-small-ru")
+PROCESSES = int(os.getenv("ECHO_STT_PROCESSES", "1"))
+CONCURRENCY = int(os.getenv("ECHO_STT_CONCURRENCY", "4"))
+QUEUE_SIZE = int(os.getenv("ECHO_STT_QUEUE_SIZE", "100"))
+JOB_TIMEOUT = float(os.getenv("ECHO_STT_TIMEOUT", "60"))
+MAX_DURATION = int(os.getenv("ECHO_STT_MAX_DURATION", "120"))
+MAX_FILE_BYTES = int(os.getenv("ECHO_STT_MAX_FILE_MB", "5")) * 1024 * 1024
+TMP_DIR = os.getenv("ECHO_STT_TMP_DIR") or os.path.join(tempfile.gettempdir(), "echo-voice")
+TMP_LIMIT_BYTES = int(os.getenv("ECHO_STT_TMP_LIMIT_MB", "50")) * 1024 * 1024
+CACHE_SIZE = int(os.getenv("ECHO_STT_CACHE_SIZE", "1024"))
+
+SAMPLE_RATE = 16000
+CHUNK = 64 * 1024
+
+ACCEPTED = "accepted"
+DISABLED = "disabled"
+TOO_LONG = "too_long"
+BUSY = "busy"
+
+
+class VoiceError(Exception):
+    """Задание не выполнено; текст исключения можно показать пользователю"""
+
+
+# --- ДВИЖКИ (выполняются в процессах пула) ---
+
+def decode_ogg(path: str, timeout: float = JOB_TIMEOUT) -> bytes:
+    """OGG/Opus -> PCM s16le, моно, SAMPLE_RATE"""
+    completed = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+         "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        capture_output=True, timeout=timeout, check=True)
+    return completed.stdout
+
+
+class StubEngine:
+    """Детерминированная заглушка: ни ffmpeg, ни модели не нужно"""
+
+    name = "stub"
+
+    def __init__(self, model_path: str = None):
+        pass
+
+    def transcribe(self, path: str) -> str:
+        data = Path(path).read_bytes()
+        if data.startswith(b"STUB:"):
+            return data[5:].decode("utf-8", "replace").strip()
+        return f"Голосовая заметка {hashlib.blake2b(data, digest_size=4).hexdigest()}"
+
+
+class VoskEngine:
+    """Vosk (Kaldi) на CPU; модель загружается один раз на процесс"""
+
+    name = "vosk"
+
+    def __init__(self, model_path: str):
+        import vosk
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def transcribe(self, path: str) -> str:
+        pcm = decode_ogg(path)
+        recognizer = self._vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        parts = []
+        for offset in range(0, len(pcm), CHUNK):
+            if recognizer.AcceptWaveform(pcm[offset:offset + CHUNK]):
+                parts.append(json.loads(recognizer.Result()).get("text", ""))
+        parts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+        return " ".join(part for part in parts if part)
+
+
+ENGINES = {"stub": StubEngine, "vosk": VoskEngine}
+
+_engine = None
+
+
+def _init_worker(name: str, model_path: str, pids=None):
+    global _engine
+    # PID — до загрузки модели: зависший на ней процесс тоже можно будет убить
+    if pids is not None:
+        pids.put(os.getpid())
+    _engine = ENGINES[name](model_path)
+
+
+def _transcribe(path: str) -> str:
+    return _engine.transcribe(path)
+
+
+def _kill_pool(pool: ProcessPoolExecutor, pids):
+    """Остановить пул, не дожидаясь заданий: его процессы завершаются SIGKILL.
+
+    pids — очередь, в которую процессы пула сообщают свой PID (_init_worker).
+    """
+    pool.shutdown(wait=False, cancel_futures=True)
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    pids.close()
+
+
+def resolve_engine(name: str = ENGINE, model_path: str = MODEL_PATH):
+    """Имя движка, который можно запустить (None — распознавание выключено)"""
+    if name == "stub":
+        return name
+    if name not in ("auto", "vosk"):
+        return None
+    missing = [what for what, ok in (("vosk", importlib.util.find_spec("vosk") is not None),
+                                     ("ffmpeg", shutil.which("ffmpeg") is not None),
+                                     (f"модель {model_path}", Path(model_path).is_dir())) if not ok]
+    if missing:
+        log = logger.error if name == "vosk" else logger.info
+        log(f"Распознавание речи выключено: нет {', '.join(missing)}")
+        return None
+    return "vosk"
+
+
+# --- ЗАГРУЗКА ---
+
+class TempArea:
+    """Каталог для загружаемых файлов с общим лимитом размера"""
+
+    def __init__(self, root, limit: int):
+        self.root = Path(root)
+        self.limit = limit
+        self.used = 0
+
+    def prepare(self):
+        """Создать каталог и удалить файлы, оставшиеся от прошлого запуска"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        for leftover in self.root.glob("*.oga"):
+            leftover.unlink(missing_ok=True)
+
+    @contextmanager
+    def file(self, size: int):
+        """Зарезервировать size байт и выдать путь; файл удаляется на выходе"""
+        if self.used + size > self.limit:
+            raise VoiceError("Слишком много голосовых сразу, попробуй чуть позже")
+        self.used += size
+        path = self.root / f"{uuid.uuid4().hex}.oga"
+        try:
+            yield path
+        finally:
+            path.unlink(missing_ok=True)
+            self.used -= size
+
+
+async def stream_download(session, url: str, dest: Path, max_bytes: int):
+    """Скачать url в dest кусками, прервав загрузку сверх max_bytes"""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        size = 0
+        with open(dest, "wb") as out:
+            async for chunk in response.content.iter_chunked(CHUNK):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise VoiceError("Голосовое сообщение слишком большое")
+                await asyncio.to_thread(out.write, chunk)
+
+
+# --- ОЧЕРЕДЬ ЗАДАНИЙ ---
+
+class VoiceJob:
+    """Одно голосовое сообщение"""
+
+    __slots__ = ("user_id", "chat_id", "file_id", "file_unique_id", "duration", "file_size", "queued_at")
+
+    def __init__(self, user_id: int, chat_id: int, file_id: str, file_unique_id: str,
+                 duration: int = 0, file_size: int = None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.file_id = file_id
+        self.file_unique_id = file_unique_id
+        self.duration = duration or 0
+        self.file_size = file_size
+        self.queued_at = time.monotonic()
+
+
+class VoicePipeline:
+    """Очередь распознавания голосовых с пулом процессов.
+
+    on_result(job, text) вызывается с распознанным текстом, on_error(job, error)
+    — с VoiceError (таймаут, пустой результат, сбой загрузки или движка).
+    fetch(file, dest, max_bytes) заменяет загрузку по HTTP (FakeBotAPI.fetch).
+    """
+
+    def __init__(self, bot, on_result, on_error, engine: str = ENGINE, model_path: str = MODEL_PATH,
+                 processes: int = PROCESSES, concurrency: int = CONCURRENCY, queue_size: int = QUEUE_SIZE,
+                 timeout: float = JOB_TIMEOUT, max_duration: int = MAX_DURATION, tmp_dir=TMP_DIR,
+                 tmp_limit: int = TMP_LIMIT_BYTES, cache_size: int = CACHE_SIZE, fetch=None):
+        self.bot = bot
+        self.on_result = on_result
+        self.on_error = on_error
+        self.engine = resolve_engine(engine, model_path)
+        self.model_path = model_path
+        self.processes = processes
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_duration = max_duration
+        self.tmp = TempArea(tmp_dir, tmp_limit)
+        self.cache_size = cache_size
+        self.fetch = fetch
+
+        self._cache = OrderedDict()   # file_unique_id -> текст
+        self._inflight = {}           # file_unique_id -> Future распознавания
+        self._queue = None
+        self._workers = []
+        self._pool = None
+        self._pids = None             # SimpleQueue с PID процессов текущего пула
+        self._session = None
+        self._running = 0
+        self._stopping = False
+
+        self.accepted = 0
+        self.rejected = 0
+        self.done = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+
+    def _start_pool(self):
+        # spawn: дочерние процессы не наследуют потоки SQLite и event loop родителя
+        context = multiprocessing.get_context("spawn")
+        self._pids = context.SimpleQueue()
+        self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context, initializer=_init_worker,
+                                         initargs=(self.engine, self.model_path, self._pids))
+
+    async def start(self):
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.tmp.prepare)
+        if self.fetch is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._stopping = False
+        self._start_pool()
+        self._queue = asyncio.Queue(self.queue_size)
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Распознавание речи запущено: {self.engine}, процессов {self.processes}, "
+                    f"заданий одновременно {self.concurrency}")
+
+    async def stop(self):
+        # Отменённые задания не перезапускают пул (см. _restart_pool)
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._pool is not None:
+            _kill_pool(self._pool, self._pids)
+            self._pool = self._pids = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._queue = None
+
+    def submit(self, job: VoiceJob) -> str:
+        """Поставить задание в очередь: ACCEPTED / DISABLED / TOO_LONG / BUSY"""
+        if not self.enabled or self._queue is None:
+            return DISABLED
+        if job.duration > self.max_duration:
+            self.rejected += 1
+            return TOO_LONG
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return BUSY
+        self.accepted += 1
+        return ACCEPTED
+
+    # --- ВЫПОЛНЕНИЕ ---
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            started = time.monotonic()
+            try:
+                text = await self._process(job)
+            except VoiceError as e:
+                self.failed += 1
+                await self._notify(self.on_error, job, e)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Ошибка распознавания {job.file_unique_id}")
+                await self._notify(self.on_error, job, VoiceError("Не удалось распознать голосовое"))
+            else:
+                self.done += 1
+                await self._notify(self.on_result, job, text)
+            finally:
+                self._running -= 1
+                self.busy_seconds += time.monotonic() - started
+                self._queue.task_done()
+
+    async def _notify(self, callback, job, value):
+        try:
+            await callback(job, value)
+        except Exception:
+            logger.exception(f"Ошибка обработчика результата распознавания {job.file_unique_id}")
+
+    async def _process(self, job: VoiceJob) -> str:
+        text = self._cache.get(job.file_unique_id)
+        if text is not None:
+            self._cache.move_to_end(job.file_unique_id)
+            self.cache_hits += 1
+            return text
+
+        # То же голосовое (например, пересланное) уже распознаётся — ждём тот же результат
+        running = self._inflight.get(job.file_unique_id)
+        if running is not None:
+            self.cache_hits += 1
+            return await asyncio.shield(running)
+
+        running = self._inflight[job.file_unique_id] = asyncio.get_running_loop().create_future()
+        try:
+            text = await self._recognize(job)
+        except BaseException as e:
+            running.set_exception(e if isinstance(e, VoiceError) else VoiceError("Не удалось распознать голосовое"))
+            running.exception()       # ожидающих может и не быть
+            raise
+        else:
+            running.set_result(text)
+        finally:
+            del self._inflight[job.file_unique_id]
+
+        self._cache[job.file_unique_id] = text
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+    async def _recognize(self, job: VoiceJob) -> str:
+        # Таймаут — на всё задание: очередь к процессам, загрузку и распознавание
+        try:
+            text = await asyncio.wait_for(self._transcribe(job), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise VoiceError("Распознавание заняло слишком много времени") from None
+
+        text = " ".join(text.split())
+        if not text:
+            raise VoiceError("Не удалось разобрать речь")
+        return text
+
+    async def _transcribe(self, job: VoiceJob) -> str:
+        size = min(job.file_size or MAX_FILE_BYTES, MAX_FILE_BYTES)
+        with self.tmp.file(size) as path:
+            try:
+                file = await self.bot.get_file(job.file_id)
+                if self.fetch is not None:
+                    await self.fetch(file, path, size)
+                else:
+                    await stream_download(self._session, file.file_path, path, size)
+            except (VoiceError, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось скачать голосовое {job.file_unique_id}: {e}")
+                raise VoiceError("Не удалось скачать голосовое") from e
+
+            pool = self._pool
+            future = asyncio.get_running_loop().run_in_executor(pool, _transcribe, str(path))
+            try:
+                return await future
+            except asyncio.CancelledError:
+                # Таймаут: процесс может быть занят зависшим заданием — новые пойдут в свежий пул
+                self._restart_pool(pool)
+                raise
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                raise VoiceError("Движок распознавания перезапускается, попробуй ещё раз") from None
+            except subprocess.SubprocessError:
+                raise VoiceError("Не удалось декодировать голосовое") from None
+
+    def _restart_pool(self, pool):
+        if self._stopping or pool is not self._pool:
+            return
+        logger.warning("Пул распознавания перезапускается")
+        # Зависший процесс сам не завершится: убиваем весь старый пул. Остальные его
+        # задания получат BrokenProcessPool и ответ «попробуй ещё раз»
+        _kill_pool(pool, self._pids)
+        self._start_pool()
+
+    def stats(self) -> dict:
+        return {
+            "engine": self.engine,
+            "queued": self.depth,
+            "running": self._running,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "done": self.done,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cache_hits": self.cache_hits,
+            "cached": len(self._cache),
+            "tmp_bytes": self.tmp.used,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
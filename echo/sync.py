@@ -0,0 +1,158 @@
+"""
+Дельта-синхронизация и ETag
+
+GET /tasks/changes?since=<курсор> отдаёт задачи, изменённые после курсора
+(по updated_at, затем id), и «надгробия» удалённых задач из журнала
+task_deletions. Курсор — позиция (updated_at, id) последнего отданного
+изменения. На последней странице курсор не заходит в последние SYNC_LAG_MS:
+запись другого процесса, начатая раньше, но зафиксированная позже, попадёт
+в следующую синхронизацию (повтор изменения для клиента безопасен).
+
+Журнал удалений хранится TOMBSTONE_DAYS дней. Клиент с более старым
+курсором получает reset=true и должен загрузить список заново.
+
+ETag списка и статистики строится из версии пользователя — последнего
+(updated_at, id) в tasks и последнего удаления. Оба значения читаются из
+индексов одним шагом, так что 304 стоит два поиска по индексу и ноль байт тела.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from echo.db import now_ts
+from echo.pagination import InvalidCursor, TASK_FIELDS
+
+SYNC_LAG_MS = int(os.getenv("ECHO_SYNC_LAG_MS", "2000"))
+TOMBSTONE_DAYS = int(os.getenv("ECHO_TOMBSTONE_DAYS", "30"))
+
+RECORD_DELETION = '''INSERT OR REPLACE INTO task_deletions (task_id, user_id, deleted_at)
+    VALUES (?, ?, ?)'''
+
+
+def encode_since(updated_at: str, task_id: int) -> str:
+    raw = json.dumps([updated_at, task_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_since(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, task_id = json.loads(raw)
+        return str(updated_at), int(task_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Некорректный курсор синхронизации: {cursor}") from e
+
+
+def _shifted(delta: timedelta) -> str:
+    return (datetime.now() + delta).isoformat(sep=" ", timespec="microseconds")
+
+
+def current_since() -> str:
+    """Курсор «сейчас» (с запасом SYNC_LAG_MS) — отдаётся вместе с полным списком"""
+    return encode_since(_shifted(-timedelta(milliseconds=SYNC_LAG_MS)), 0)
+
+
+def record_deletion(conn, user_id: int, task_id: int, deleted_at: str = None):
+    conn.execute(RECORD_DELETION, (task_id, user_id, deleted_at or now_ts()))
+
+
+def changes(conn, user_id: int, since: str = None, limit: int = 200) -> dict:
+    """Изменения после курсора: {"tasks", "deleted", "next_since", "has_more", "reset"}"""
+    if since:
+        ts, task_id = decode_since(since)
+        if ts and ts < _shifted(-timedelta(days=TOMBSTONE_DAYS)):
+            # Журнал удалений уже обрезан: дельта была бы неполной
+            return {"tasks": [], "deleted": [], "next_since": None, "has_more": False, "reset": True}
+    else:
+        ts, task_id = "", 0
+
+    rows = conn.execute(f'''SELECT {', '.join(TASK_FIELDS)} FROM tasks
+        WHERE user_id = ? AND updated_at >= ? AND (updated_at > ? OR id > ?)
+        ORDER BY updated_at, id LIMIT ?''', (user_id, ts, ts, task_id, limit + 1)).fetchall()
+    items = [((row["updated_at"], row["id"]), dict(row)) for row in rows]
+
+    if since:
+        # Новому клиенту (без курсора) надгробия не нужны
+        deleted = conn.execute('''SELECT deleted_at, task_id FROM task_deletions
+            WHERE user_id = ? AND deleted_at >= ? AND (deleted_at > ? OR task_id > ?)
+            ORDER BY deleted_at, task_id LIMIT ?''', (user_id, ts, ts, task_id, limit + 1)).fetchall()
+        items += [((row[0], row[1]), None) for row in deleted]
+
+    items.sort(key=lambda item: item[0])
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    last = items[-1][0] if items else (ts, task_id)
+    if not has_more:
+        # Не уходим в окно, где ещё могут фиксироваться чужие записи
+        last = max((ts, task_id), min(last, (_shifted(-timedelta(milliseconds=SYNC_LAG_MS)), 0)))
+
+    return {
+        "tasks": [task for _, task in items if task is not None],
+        "deleted": [key[1] for key, task in items if task is None],
+        "next_since": encode_since(*last),
+        "has_more": has_more,
+        "reset": False,
+    }
+
+
+def version(conn, user_id: int) -> str:
+    """Версия данных пользователя: последняя запись в tasks и последнее удаление"""
+    changed = conn.execute('''SELECT updated_at, id FROM tasks WHERE user_id = ?
+        ORDER BY updated_at DESC, id DESC LIMIT 1''', (user_id,)).fetchone()
+    deleted = conn.execute('''SELECT deleted_at, task_id FROM task_deletions WHERE user_id = ?
+        ORDER BY deleted_at DESC, task_id DESC LIMIT 1''', (user_id,)).fetchone()
+    return f"{tuple(changed) if changed else ''}|{tuple(deleted) if deleted else ''}"
+
+
+def prune(conn, days: int = TOMBSTONE_DAYS) -> int:
+    """Удалить надгробия старше days дней (внутри транзакции вызывающего)"""
+    cur = conn.execute("DELETE FROM task_deletions WHERE deleted_at < ?", (_shifted(-timedelta(days=days)),))
+    return cur.rowcount
+
+
+# --- ETAG ---
+
+def etag(*parts) -> str:
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    """Совпадает ли ETag с заголовком If-None-Match (список или *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return tag in candidates
+
+
+def cache_headers(tag: str) -> dict:
+    """ETag + no-cache: браузер хранит ответ, но каждый раз перепроверяет его (получая 304)"""
+    return {"ETag": tag, "Cache-Control": "private, no-cache"}
+
+
+def main():
+    from echo.db import ConnectionPool, DB_PATH
+    from echo.migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Журнал удалений Echo")
+    parser.add_argument("--db", default=str(DB_PATH), help="путь к файлу SQLite")
+    parser.add_argument("--prune", action="store_true", help=f"удалить надгробия старше {TOMBSTONE_DAYS} дней")
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db)
+    migrate(pool.connection())
+
+    if args.prune:
+        with pool.transaction() as conn:
+            print(f"Удалено надгробий: {prune(conn)}")
+
+
+if __name__ == "__main__":
+    main()
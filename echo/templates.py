@@ -0,0 +1,232 @@
+"""
+Шаблоны задач
+
+Шаблоны хранятся в таблице templates: общие (user_id = 0, засеваются
+миграцией v8) и личные шаблоны пользователей. Личный шаблон с тем же
+именем перекрывает общий.
+
+Все шаблоны держатся в памяти (TemplateIndex): создание задачи из шаблона —
+поиск в dict и один INSERT, каталог для Mini App собирается один раз и
+отдаётся с ETag. Свои записи репозиторий применяет к индексу сразу после
+фиксации. Записи другого процесса (бот и API пишут в одну базу) видны после
+перечитывания таблицы — не реже раза в RELOAD секунд. Чтобы перечитывание,
+начатое до записи, не вернуло в индекс устаревшие данные, индекс ведёт
+счётчик записей (begin_load() / load()), как и кэш списков задач.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+from echo.db import now_ts
+from echo.sync import etag
+
+RELOAD = float(os.getenv("ECHO_TEMPLATES_RELOAD", "60"))
+MAX_CATALOGUES = int(os.getenv("ECHO_TEMPLATES_MAX_CATALOGUES", "1024"))
+
+GLOBAL_USER = 0
+MAX_NAME = 64
+MAX_DEADLINE_HOURS = 24 * 365
+
+FIELDS = ("id", "user_id", "name", "title", "priority", "deadline_hours", "category", "icon")
+
+# (имя, название задачи, приоритет, срок в часах, категория, иконка)
+DEFAULTS = [
+    ("Код-ревью", "Код-ревью", 7, 1, "work", "🔍"),
+    ("Митинг", "Митинг с командой", 5, 2, "work", "👥"),
+    ("Обед", "Обед", 3, 1, "personal", "🍔"),
+    ("Спорт", "Спорт", 4, 1, "health", "🏃"),
+    ("Спринт", "Спринт-планирование", 8, 4, "work", "🏁"),
+    ("Доклад", "Отправить доклад", 6, 2, "work", "📄"),
+]
+
+
+class DuplicateTemplate(ValueError):
+    """У пользователя уже есть шаблон с таким именем"""
+
+
+def validate(fields: dict, partial: bool = False) -> dict:
+    """Проверить и нормализовать поля шаблона (ValueError при ошибке)"""
+    fields = {key: value for key, value in fields.items() if value is not None}
+    if "name" in fields:
+        fields["name"] = fields["name"].strip()
+        if not fields["name"] or len(fields["name"]) > MAX_NAME:
+            raise ValueError(f"Имя шаблона: от 1 до {MAX_NAME} символов")
+    elif not partial:
+        raise ValueError("Нужно имя шаблона")
+    if "title" in fields:
+        fields["title"] = fields["title"].strip()
+        if not fields["title"]:
+            del fields["title"]          # пустое название — по имени шаблона
+    if "priority" in fields and not 1 <= fields["priority"] <= 10:
+        raise ValueError("Приоритет шаблона: от 1 до 10")
+    if "deadline_hours" in fields and not 0 < fields["deadline_hours"] <= MAX_DEADLINE_HOURS:
+        raise ValueError(f"Срок шаблона: от 0 до {MAX_DEADLINE_HOURS} часов")
+    return fields
+
+
+def fallback(name: str) -> dict:
+    """Шаблон для неизвестного имени: задача с таким названием на час"""
+    return {"name": name, "title": name, "priority": 5, "deadline_hours": 1, "category": "general"}
+
+
+# --- SQL ---
+
+def create_table(conn):
+    """Таблица templates и общие шаблоны (внутри транзакции вызывающего)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        title TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 5,
+        deadline_hours REAL NOT NULL DEFAULT 1,
+        category TEXT NOT NULL DEFAULT 'general',
+        icon TEXT,
+        updated_at TIMESTAMP,
+        UNIQUE (user_id, name)
+    )''')
+    now = now_ts()
+    conn.executemany('''INSERT OR IGNORE INTO templates
+        (user_id, name, title, priority, deadline_hours, category, icon, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        [(GLOBAL_USER, *template, now) for template in DEFAULTS])
+
+
+def load_rows(conn) -> list:
+    return [dict(row) for row in conn.execute(f"SELECT {', '.join(FIELDS)} FROM templates ORDER BY id")]
+
+
+def _select(conn, template_id: int):
+    """Личный шаблон по ID (общие через API не меняются)"""
+    row = conn.execute(f"SELECT {', '.join(FIELDS)} FROM templates WHERE id = ? AND user_id != ?",
+                       (template_id, GLOBAL_USER)).fetchone()
+    return dict(row) if row else None
+
+
+def insert(conn, user_id: int, fields: dict) -> dict:
+    template = {"user_id": user_id, "name": fields["name"], "title": fields.get("title") or fields["name"],
+                "priority": fields.get("priority", 5), "deadline_hours": fields.get("deadline_hours", 1),
+                "category": fields.get("category", "general"), "icon": fields.get("icon")}
+    try:
+        cur = conn.execute('''INSERT INTO templates
+            (user_id, name, title, priority, deadline_hours, category, icon, updated_at)
+            VALUES (:user_id, :name, :title, :priority, :deadline_hours, :category, :icon, :updated_at)''',
+            dict(template, updated_at=now_ts()))
+    except sqlite3.IntegrityError as e:
+        raise DuplicateTemplate(f"Шаблон «{fields['name']}» уже есть") from e
+    return dict(template, id=cur.lastrowid)
+
+
+def update(conn, template_id: int, fields: dict) -> tuple:
+    """UPDATE личного шаблона. Возвращает (было, стало) или (None, None)"""
+    previous = _select(conn, template_id)
+    if previous is None or not fields:
+        return previous, previous
+    assignments = ", ".join(f"{name} = :{name}" for name in fields)
+    try:
+        conn.execute(f"UPDATE templates SET {assignments}, updated_at = :updated_at WHERE id = :id",
+                     dict(fields, id=template_id, updated_at=now_ts()))
+    except sqlite3.IntegrityError as e:
+        raise DuplicateTemplate(f"Шаблон «{fields['name']}» уже есть") from e
+    return previous, dict(previous, **fields)
+
+
+def delete(conn, template_id: int):
+    """DELETE личного шаблона. Возвращает удалённую строку или None"""
+    template = _select(conn, template_id)
+    if template is not None:
+        conn.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+    return template
+
+
+# --- ИНДЕКС ---
+
+def public(template: dict) -> dict:
+    """Шаблон для клиента: без user_id, с признаком личного"""
+    view = {name: template[name] for name in FIELDS if name != "user_id"}
+    view["custom"] = template["user_id"] != GLOBAL_USER
+    return view
+
+
+class TemplateIndex:
+    """Все шаблоны в памяти: {user_id: {имя: шаблон}} + собранные каталоги.
+
+    Используется только из event loop (репозиторий меняет его после await записи).
+    """
+
+    def __init__(self, reload_interval: float = RELOAD):
+        self.reload_interval = reload_interval
+        self._by_user = {}
+        self._catalogues = {}             # user_id -> (etag, список для клиента)
+        self._writes = 0
+        self._loaded_at = None
+        self.loads = 0
+
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval
+
+    def begin_load(self) -> int:
+        """Метка начала чтения таблицы (передаётся в load)"""
+        return self._writes
+
+    def load(self, rows: list, token: int = None) -> bool:
+        """Заменить индекс строками таблицы. False — пока читали, была запись"""
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row["user_id"], {})[row["name"]] = row
+        if token is not None and token != self._writes:
+            return False
+        self._by_user = by_user
+        self._catalogues.clear()
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+        return True
+
+    def get(self, user_id: int, name: str):
+        """Шаблон по имени: личный, иначе общий, иначе None"""
+        own = self._by_user.get(user_id)
+        if own and name in own:
+            return own[name]
+        return self._by_user.get(GLOBAL_USER, {}).get(name)
+
+    def catalogue(self, user_id: int) -> tuple:
+        """(ETag, список шаблонов пользователя): общие и личные, личные перекрывают общие"""
+        # Пользователи без личных шаблонов делят один каталог
+        key = user_id if user_id in self._by_user else GLOBAL_USER
+        cached = self._catalogues.get(key)
+        if cached is not None:
+            return cached
+        if len(self._catalogues) >= MAX_CATALOGUES:
+            self._catalogues.clear()
+        merged = dict(self._by_user.get(GLOBAL_USER, {}))
+        merged.update(self._by_user.get(key, {}))
+        items = [public(template) for template in sorted(merged.values(), key=lambda t: t["id"])]
+        cached = self._catalogues[key] = (etag("templates", json.dumps(items, sort_keys=True)), items)
+        return cached
+
+    # --- ЗАПИСИ СВОЕГО ПРОЦЕССА ---
+
+    def put(self, template: dict, previous: dict = None):
+        if previous is not None:
+            self.remove(previous)
+        self._writes += 1
+        self._by_user.setdefault(template["user_id"], {})[template["name"]] = template
+        self._catalogues.pop(template["user_id"], None)
+
+    def remove(self, template: dict):
+        self._writes += 1
+        own = self._by_user.get(template["user_id"], {})
+        own.pop(template["name"], None)
+        if not own:
+            self._by_user.pop(template["user_id"], None)
+        self._catalogues.pop(template["user_id"], None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._by_user) - (GLOBAL_USER in self._by_user),
+            "templates": sum(len(templates) for templates in self._by_user.values()),
+            "catalogues": len(self._catalogues),
+            "loads": self.loads,
+        }
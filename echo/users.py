@@ -0,0 +1,129 @@
+"""
+Профили пользователей
+
+Регистрация — один INSERT ... ON CONFLICT DO UPDATE ... WHERE: строка
+меняется, только если в профиле действительно что-то поменялось, и
+RETURNING сообщает, была ли запись (новый пользователь или изменение).
+
+Известные профили держатся в памяти (UserCache, LRU на MAX_ENTRIES
+пользователей). Повторный /start с тем же профилем и чтение профиля
+через API не доходят до SQLite. Бот и API пишут в одну базу, поэтому
+запись живёт не дольше TTL секунд: изменения другого процесса видны не
+позже чем через TTL.
+
+Кэш используется только из event loop (репозиторий меняет его после
+await записи).
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+MAX_ENTRIES = int(os.getenv("ECHO_USER_CACHE_SIZE", "10000"))
+TTL = float(os.getenv("ECHO_USER_CACHE_TTL", "600"))
+
+FIELDS = ("user_id", "username", "chat_id", "first_name", "last_name")
+
+UPSERT = '''INSERT INTO users (user_id, username, chat_id, first_name, last_name, created_at)
+    VALUES (:user_id, :username, :chat_id, :first_name, :last_name, :created_at)
+    ON CONFLICT (user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        chat_id = COALESCE(excluded.chat_id, users.chat_id)
+    WHERE users.username IS NOT excluded.username
+       OR users.first_name IS NOT excluded.first_name
+       OR users.last_name IS NOT excluded.last_name
+       OR (excluded.chat_id IS NOT NULL AND users.chat_id IS NOT excluded.chat_id)
+    RETURNING username, chat_id, first_name, last_name, created_at'''
+
+
+def profile(user_id: int, username=None, chat_id=None, first_name=None, last_name=None) -> dict:
+    """Профиль в том виде, в каком он хранится (chat_id — TEXT)"""
+    return {"user_id": user_id, "username": username, "chat_id": str(chat_id) if chat_id is not None else None,
+            "first_name": first_name, "last_name": last_name}
+
+
+def unchanged(known: dict, new: dict) -> bool:
+    """Запись new ничего не изменит в known (chat_id=None не затирает сохранённый)"""
+    return (known["username"] == new["username"] and known["first_name"] == new["first_name"]
+            and known["last_name"] == new["last_name"]
+            and (new["chat_id"] is None or known["chat_id"] == new["chat_id"]))
+
+
+# --- SQL ---
+
+def upsert(conn, new: dict, created_at: str) -> tuple:
+    """Создать или обновить пользователя (внутри транзакции вызывающего).
+
+    Возвращает (создан ли, сохранённый профиль или None, если запись не понадобилась).
+    """
+    row = conn.execute(UPSERT, dict(new, created_at=created_at)).fetchone()
+    if row is None:
+        return False, None
+    stored = profile(new["user_id"], row["username"], row["chat_id"], row["first_name"], row["last_name"])
+    return row["created_at"] == created_at, stored
+
+
+def insert(conn, new: dict, created_at: str) -> bool:
+    """Создать пользователя, если его ещё нет (внутри транзакции вызывающего)"""
+    cur = conn.execute('''INSERT INTO users (user_id, username, chat_id, first_name, last_name, created_at)
+        VALUES (:user_id, :username, :chat_id, :first_name, :last_name, :created_at)
+        ON CONFLICT (user_id) DO NOTHING''', dict(new, created_at=created_at))
+    return cur.rowcount > 0
+
+
+def select(conn, user_id: int) -> Optional[dict]:
+    row = conn.execute(f"SELECT {', '.join(FIELDS)} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    return dict(row) if row else None
+
+
+# --- КЭШ ---
+
+class UserCache:
+    """LRU + TTL профилей: {user_id: (истекает, профиль)}"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self.skipped_writes = 0
+
+    def get(self, user_id: int) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user: dict):
+        self._entries[user["user_id"]] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user["user_id"])
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "writes": self.writes,
+            "skipped_writes": self.skipped_writes,
+        }
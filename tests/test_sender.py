@@ -0,0 +1,67 @@
+import asyncio
+
+from echo.sender import OutboundSender
+
+
+class BlockingBot:
+    """send_message ждёт, пока тест не отпустит сообщение с этим текстом"""
+
+    def __init__(self):
+        self.gates = {}
+        self.started = []
+        self.active = {}
+        self.max_active = {}
+
+    def gate(self, text):
+        return self.gates.setdefault(text, asyncio.Event())
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.started.append((chat_id, text))
+        self.active[chat_id] = self.active.get(chat_id, 0) + 1
+        self.max_active[chat_id] = max(self.max_active.get(chat_id, 0), self.active[chat_id])
+        try:
+            await self.gate(text).wait()
+        finally:
+            self.active[chat_id] -= 1
+        return text
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_enqueue_while_waiting_for_slot_keeps_chat_order():
+    async def scenario():
+        bot = BlockingBot()
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000,
+                                chat_rate=1000, chat_burst=1000, concurrency=2)
+        await sender.start()
+        try:
+            # Оба слота заняты другими чатами, диспетчер ждёт слот для чата 3
+            sender.send_message(1, "a1")
+            sender.send_message(2, "c1")
+            await _settle()
+            first = sender.send_message(3, "b1")
+            await _settle()
+            # Новое сообщение того же чата, пока он ждёт слот
+            second = sender.send_message(3, "b2")
+            await _settle()
+
+            bot.gate("a1").set()
+            await _settle()
+            bot.gate("c1").set()
+            await _settle()
+            assert (3, "b2") not in bot.started
+
+            bot.gate("b1").set()
+            bot.gate("b2").set()
+            assert await asyncio.wait_for(first, 1) == "b1"
+            assert await asyncio.wait_for(second, 1) == "b2"
+        finally:
+            await sender.stop(drain_timeout=0)
+
+        assert [text for chat, text in bot.started if chat == 3] == ["b1", "b2"]
+        assert bot.max_active[3] == 1
+
+    asyncio.run(scenario())